@@ -0,0 +1,5 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Offline benchmarks for the hot potato operator.
+"""
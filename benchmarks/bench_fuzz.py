@@ -0,0 +1,210 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Event ordering fuzzer and parameter sweep.
+
+Plays many games on simulated deployments (see `cluster.py`) with hooks
+dispatched in random order (`PeerCluster(rng=...)`), over a process
+pool, for every combination of implementation, mode, unit count and
+delay, and reports per scenario:
+
+* lost - passes the application counted but no unit did (app
+  `total_passes` over the sum of unit `npasses`)
+* double - passes counted by units but not by the application (or
+  counted twice)
+* stalls - games that stopped making progress before `passes`
+* pass/s - throughput (wall clock) and hooks per pass
+
+Time is simulated: each hook takes `HOOK_TIME`, and when no hook is
+queued the clock moves on by the delay (at least a second) and every
+unit gets update-status (the periodic hook, and the wakeup of a paced
+pass). A game stalls if that makes no progress `IDLE_ROUNDS` times in a
+row, or runs out of hooks.
+
+Each game is seeded: the seeds of failed games are listed, and a game
+is replayed with `--runs 1 --seed <seed>` (and the scenario's options).
+Exits 1 if any game failed.
+
+Usage:
+    ./run_benchmarks fuzz [--runs N] [--passes N] [--units 3 5 10] [--delay 0 1]
+                          [--mode leader peer] [--impl iface noiface]
+                          [--burst K] [--potatoes N] [--strategy S]
+                          [--seed N] [--workers N]
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import importlib
+import itertools
+import random
+import sys
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_game import IMPLEMENTATIONS
+from benchmarks.cluster import PeerCluster
+from protocol import decode_app
+
+
+# simulated seconds per hook
+HOOK_TIME = 0.01
+IDLE_ROUNDS = 3
+
+
+class Clock:
+    """Simulated `time.time`."""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def fuzz_game(charm_cls, nunits, max_passes, seed, delay=0, **params):
+    """Play one game with hooks in random order (seeded by `seed`) and
+    return its outcome."""
+
+    rng = random.Random(seed)
+    # (owner selection)
+    random.seed(seed)
+    clock = Clock()
+    with patch("time.time", clock):
+        cluster = PeerCluster(charm_cls, nunits, rng=rng)
+        try:
+            params.update({"delay": delay, "owner": cluster.unit_names[-1]})
+            params["max-passes"] = max_passes
+            cluster.run_action("configure", params)
+            cluster.run_action("run", {"run": True})
+            setup_hooks = len(cluster.hooks)
+            max_hooks = 8 * nunits * (max_passes + 1)
+
+            t0 = time.perf_counter()
+            idle = 0
+            last = -1
+            while True:
+                count = cluster.drain(max_hooks=max_hooks - len(cluster.hooks))
+                clock.advance(count * HOOK_TIME)
+                app = decode_app(cluster.app_data().get("state", ""))
+                if not app.run or len(cluster.hooks) >= max_hooks:
+                    break
+
+                # (in peer mode, the app is only updated at the end)
+                npasses = get_npasses(cluster)
+                idle = idle + 1 if npasses == last else 0
+                if idle >= IDLE_ROUNDS:
+                    break
+                last = npasses
+
+                clock.advance(max(delay, 1))
+                names = list(cluster.unit_names)
+                rng.shuffle(names)
+                for name in names:
+                    cluster.emit(name, "update_status")
+            elapsed = time.perf_counter() - t0
+
+            npasses = get_npasses(cluster)
+            hooks = len(cluster.hooks) - setup_hooks
+        finally:
+            cluster.cleanup()
+
+    stalled = app.run or app.total_passes < max_passes
+    return {
+        "seed": seed,
+        "passes": npasses if stalled else app.total_passes,
+        # (counts of a stalled game are not final)
+        "lost": 0 if stalled else max(app.total_passes - npasses, 0),
+        "double": 0 if stalled else max(npasses - app.total_passes, 0),
+        "stalled": stalled,
+        "elapsed": elapsed,
+        "hooks": hooks,
+    }
+
+
+def get_npasses(cluster):
+    """Return passes counted by the units of `cluster`."""
+
+    return sum(int(cluster.unit_data(name).get("npasses", 0)) for name in cluster.unit_names)
+
+
+def run_task(task):
+    """Run fuzz task (in a worker): (scenario, options, seed)."""
+
+    scenario, options, seed = task
+    impl, mode, nunits, delay = scenario
+    charm_cls = importlib.import_module(IMPLEMENTATIONS[impl]).HotPotatoCharm
+    return scenario, fuzz_game(
+        charm_cls, nunits, options["passes"], seed, delay=delay, mode=mode, **options["params"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=100, help="games per scenario")
+    parser.add_argument("--passes", type=int, default=20)
+    parser.add_argument("--units", type=int, nargs="+", default=[3, 5, 10])
+    parser.add_argument("--delay", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--mode", nargs="+", choices=["leader", "peer"], default=["leader"])
+    parser.add_argument(
+        "--impl", nargs="+", choices=sorted(IMPLEMENTATIONS), default=["iface", "noiface"]
+    )
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--potatoes", type=int, default=1)
+    parser.add_argument("--strategy", choices=["random", "round-robin", "fair"], default="random")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPUs)")
+    args = parser.parse_args()
+
+    options = {
+        "passes": args.passes,
+        "params": {"burst": args.burst, "potatoes": args.potatoes, "strategy": args.strategy},
+    }
+    scenarios = list(itertools.product(args.impl, args.mode, args.units, args.delay))
+    tasks = [
+        (scenario, options, args.seed + run)
+        for scenario in scenarios
+        for run in range(args.runs)
+    ]
+
+    results = collections.defaultdict(list)
+    t0 = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+        for scenario, result in executor.map(run_task, tasks, chunksize=8):
+            results[scenario].append(result)
+    elapsed = time.perf_counter() - t0
+
+    header = (
+        f"{'impl':<8} {'mode':<6} {'units':>5} {'delay':>5} {'games':>6} {'lost':>6}"
+        f" {'double':>6} {'stalls':>6} {'pass/s':>9} {'hook/pass':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    failed = []
+    for scenario in scenarios:
+        impl, mode, nunits, delay = scenario
+        games = results[scenario]
+        passes = sum(game["passes"] for game in games) or 1
+        bad = [game for game in games if game["lost"] or game["double"] or game["stalled"]]
+        failed.extend((scenario, game["seed"]) for game in bad)
+        print(
+            f"{impl:<8} {mode:<6} {nunits:>5} {delay:>5} {len(games):>6}"
+            f" {sum(game['lost'] for game in games):>6}"
+            f" {sum(game['double'] for game in games):>6}"
+            f" {sum(game['stalled'] for game in games):>6}"
+            f" {passes / sum(game['elapsed'] for game in games):>9.1f}"
+            f" {sum(game['hooks'] for game in games) / passes:>9.1f}"
+        )
+    print(f"{len(tasks)} games in {elapsed:.1f}s")
+
+    for scenario, seed in failed[:20]:
+        print("failed: impl=%s mode=%s units=%d delay=%d" % scenario, f"seed={seed}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Full game benchmark: interface vs non-interface implementation.
+
+Drives complete games on a simulated deployment (see `cluster.py`)
+and reports, per implementation and unit count:
+
+* passes/sec (wall clock)
+* hooks dispatched per pass
+* relation data reads/writes per pass
+* status updates per pass
+* per-hook CPU time
+
+Usage:
+    ./run_benchmarks game [--units 3 10 50 200] [--passes N] [--burst K]
+                          [--mode leader|peer] [--potatoes N] [--strategy S]
+                          [--impl iface noiface]
+"""
+
+import argparse
+import importlib
+import statistics
+import time
+
+from benchmarks.cluster import PeerCluster
+from protocol import decode_app
+from stats import percentile
+
+
+IMPLEMENTATIONS = {
+    "iface": "charmiface",
+    "noiface": "charmnoiface",
+}
+
+
+def play_game(charm_cls, nunits, max_passes, owner=None, **params):
+    """Play one game to completion and return its measurements."""
+
+    cluster = PeerCluster(charm_cls, nunits)
+    try:
+        owner = owner or cluster.unit_names[-1]
+        params.update({"delay": 0, "owner": owner, "max-passes": max_passes})
+        cluster.run_action("configure", params)
+        cluster.drain()
+        setup_hooks = len(cluster.hooks)
+
+        t0 = time.perf_counter()
+        cluster.run_action("run", {"run": True})
+        cluster.drain(max_hooks=4 * nunits * (max_passes + 1))
+        elapsed = time.perf_counter() - t0
+
+        hooks = cluster.hooks[setup_hooks:]
+        passes = decode_app(cluster.app_data().get("state", "")).total_passes
+    finally:
+        cluster.cleanup()
+
+    npasses = max(passes, 1)
+    cpu = [hook.cpu for hook in hooks]
+    return {
+        "units": nunits,
+        "passes": passes,
+        "elapsed": elapsed,
+        "passes_per_sec": passes / elapsed if elapsed else 0.0,
+        "hooks_per_pass": len(hooks) / npasses,
+        "reads_per_pass": sum(hook.reads for hook in hooks) / npasses,
+        "writes_per_pass": sum(hook.writes for hook in hooks) / npasses,
+        "statuses_per_pass": sum(hook.statuses for hook in hooks) / npasses,
+        "cpu_mean_ms": 1000 * statistics.mean(cpu) if cpu else 0.0,
+        "cpu_p95_ms": 1000 * percentile(cpu, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--units", type=int, nargs="+", default=[3, 10, 50, 200])
+    parser.add_argument("--passes", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--mode", choices=["leader", "peer"], default="leader")
+    parser.add_argument("--potatoes", type=int, default=1)
+    parser.add_argument("--strategy", choices=["random", "round-robin", "fair"], default="random")
+    parser.add_argument(
+        "--impl", nargs="+", choices=sorted(IMPLEMENTATIONS), default=["iface", "noiface"]
+    )
+    args = parser.parse_args()
+
+    header = (
+        f"{'impl':<8} {'units':>5} {'passes':>6} {'pass/s':>9} {'hook/pass':>9}"
+        f" {'rd/pass':>8} {'wr/pass':>8} {'st/pass':>8} {'cpu/hook':>9} {'p95':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for impl in args.impl:
+        charm_cls = importlib.import_module(IMPLEMENTATIONS[impl]).HotPotatoCharm
+        for nunits in args.units:
+            r = play_game(
+                charm_cls,
+                nunits,
+                args.passes,
+                burst=args.burst,
+                mode=args.mode,
+                potatoes=args.potatoes,
+                strategy=args.strategy,
+            )
+            print(
+                f"{impl:<8} {r['units']:>5} {r['passes']:>6} {r['passes_per_sec']:>9.1f}"
+                f" {r['hooks_per_pass']:>9.1f} {r['reads_per_pass']:>8.1f}"
+                f" {r['writes_per_pass']:>8.1f} {r['statuses_per_pass']:>8.1f}"
+                f" {r['cpu_mean_ms']:>7.2f}ms"
+                f" {r['cpu_p95_ms']:>6.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Interface microbenchmark: per-hook superinterface cost.
+
+Measures, in one process, what the `iface` implementation pays on each
+dispatch to access the relation through the hot potato superinterface
+(see `src/interfaces/hotpotato.py`), with the relation caches
+invalidated between hooks, as in a fresh process:
+
+* load - `interface_registry.load` (superinterface construction)
+* select - bucket snapshots of the app, this unit and a remote unit
+  (each taken twice, as handlers do)
+* read - reading every field of those buckets
+* commit - writing two fields and committing
+
+and, for reference, the same hook through uncached bucket interfaces
+(a fresh `select` per access and per-access field reads and writes, as
+before snapshots) and on the raw buckets (as `noiface` does).
+
+Usage:
+    ./run_benchmarks iface [--units 10] [--hooks 2000]
+"""
+
+import argparse
+import time
+
+import charmiface
+from benchmarks.cluster import RELATION_NAME, make_harness
+from hpctinterfaces import interface_registry
+from hpctinterfaces.relation import RelationSuperInterface
+
+import interfaces.hotpotato  # noqa: F401 (registers the superinterface)
+
+
+APP_DATA = {
+    "initialized": "True",
+    "burst": "1",
+    "delay": "0.0",
+    "max_passes": "1000",
+    "mode": "leader",
+    "pacing": "delay",
+    "potatoes": "1",
+    "shards": "",
+    "state": "1:2:17:42:hot-potato/1::1660000000.0:1",
+    "strategy": "random",
+    "target_rate": "0.0",
+}
+UNIT_DATA = {"claim": "1:2:42:hot-potato/2", "next_shards": "", "npasses": "7"}
+APP_FIELDS = list(APP_DATA)
+UNIT_FIELDS = list(UNIT_DATA)
+
+
+def make_charm(nunits):
+    """Return (harness, relation) of a leader with `nunits` units in the
+    peer relation, with realistic bucket contents."""
+
+    harness = make_harness(charmiface.HotPotatoCharm, "hot-potato/0")
+    relation_id = harness.add_relation(RELATION_NAME, "hot-potato")
+    for i in range(1, nunits):
+        harness.add_relation_unit(relation_id, f"hot-potato/{i}")
+    harness.set_leader(True)
+    harness.begin()
+    # noinspection PyProtectedMember
+    raw = harness._backend._relation_data_raw[relation_id]
+    raw["hot-potato"].update(APP_DATA)
+    for name in raw:
+        if "/" in name:
+            raw[name].update(UNIT_DATA)
+    return harness, harness.model.get_relation(RELATION_NAME, relation_id)
+
+
+def invalidate(relation):
+    for content in relation.data.values():
+        content._invalidate()
+
+
+def hook_iface(charm, relation, remote, times):
+    """One hook through the superinterface; add phase times to `times`."""
+
+    t0 = time.perf_counter()
+    hpsiface = interface_registry.load("relation-hot-potato", charm, RELATION_NAME)
+    t1 = time.perf_counter()
+    snapshots = []
+    for _ in range(2):
+        snapshots = [
+            hpsiface.snapshot(charm.app),
+            hpsiface.snapshot(charm.unit),
+            hpsiface.snapshot(remote),
+        ]
+    t2 = time.perf_counter()
+    appiface, selfiface, unitiface = snapshots
+    for name in APP_FIELDS:
+        getattr(appiface, name)
+    for iface in (selfiface, unitiface):
+        for name in UNIT_FIELDS:
+            getattr(iface, name)
+    t3 = time.perf_counter()
+    selfiface.npasses += 1
+    selfiface.claim = "1:2:43:hot-potato/1"
+    hpsiface.commit()
+    t4 = time.perf_counter()
+
+    times["load"] += t1 - t0
+    times["select"] += t2 - t1
+    times["read"] += t3 - t2
+    times["commit"] += t4 - t3
+
+
+def hook_uncached(charm, relation, remote, times):
+    """The same hook through uncached bucket interfaces: no reuse of
+    bucket interfaces and no compiled snapshot class."""
+
+    t0 = time.perf_counter()
+    hpsiface = interface_registry.load("relation-hot-potato", charm, RELATION_NAME)
+    ifaces = []
+    for _ in range(2):
+        ifaces = [
+            RelationSuperInterface.select(hpsiface, charm.app),
+            RelationSuperInterface.select(hpsiface, charm.unit),
+            RelationSuperInterface.select(hpsiface, remote),
+        ]
+    appiface, selfiface, unitiface = ifaces
+    for name in APP_FIELDS:
+        getattr(appiface, name)
+    for iface in (selfiface, unitiface):
+        for name in UNIT_FIELDS:
+            getattr(iface, name)
+    selfiface.npasses += 1
+    selfiface.claim = "1:2:43:hot-potato/1"
+    times["uncached"] += time.perf_counter() - t0
+
+
+def hook_raw(charm, relation, remote, times):
+    """The same hook on the raw buckets."""
+
+    t0 = time.perf_counter()
+    appdata = relation.data[charm.app]
+    selfdata = relation.data[charm.unit]
+    unitdata = relation.data[remote]
+    for name in APP_FIELDS:
+        appdata.get(name)
+    for data in (selfdata, unitdata):
+        for name in UNIT_FIELDS:
+            data.get(name)
+    selfdata["npasses"] = str(int(selfdata.get("npasses", 0)) + 1)
+    selfdata["claim"] = "1:2:43:hot-potato/1"
+    times["raw"] += time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--units", type=int, default=10)
+    parser.add_argument("--hooks", type=int, default=2000)
+    args = parser.parse_args()
+
+    harness, relation = make_charm(args.units)
+    try:
+        charm = harness.charm
+        remote = harness.model.get_unit("hot-potato/1")
+        times = dict.fromkeys(["load", "select", "read", "commit", "uncached", "raw"], 0.0)
+        for hook in (hook_iface, hook_uncached, hook_raw):
+            for _ in range(args.hooks):
+                invalidate(relation)
+                hook(charm, relation, remote, times)
+    finally:
+        harness.cleanup()
+
+    iface = sum(times[phase] for phase in ["load", "select", "read", "commit"])
+    for phase, seconds in list(times.items()) + [("iface", iface)]:
+        print(f"{phase:<8} {1e6 * seconds / args.hooks:>8.1f}us")
+    print(f"speedup  {times['uncached'] / iface:>8.1f}x (uncached/iface)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Replay of recorded dispatches (see `src/recorder.py`) under `Harness`.
+
+Feeds the records of one or more unit logs (merged in time order) to a
+charm implementation at full speed, each unit in its own harness. Before
+each dispatch, the unit's leadership, config and the relation data
+changes read in the recorded dispatch are applied to its view, so
+each hook runs against the recorded data, in the recorded order.
+
+Reports, by dispatch, the count and CPU time (replayed) against wall
+time (recorded), and the dispatches whose writes (keys written) differ
+from those recorded: the charm is not deterministic (random owner
+selection, times), so a replay only follows the recorded game as long
+as its inputs are replayed. With `--profile`, the replay is profiled
+with cProfile (hot spots printed, and stats saved for, e.g., snakeviz).
+
+Usage:
+    ./run_benchmarks replay <log>... [--impl iface|noiface] [--profile FILE]
+                                     [--repeat N]
+"""
+
+import argparse
+import collections
+import cProfile
+import importlib
+import pstats
+import time
+from unittest.mock import Mock
+
+from benchmarks.bench_game import IMPLEMENTATIONS
+from benchmarks.cluster import RELATION_NAME, make_harness
+from recorder import load
+
+
+class Replayer:
+    """Replays `records` with charm class `charm_cls`."""
+
+    def __init__(self, charm_cls, records):
+        self.charm_cls = charm_cls
+        self.records = records
+        self.harnesses = {}
+        self.writes = {}
+        self.stats = collections.defaultdict(lambda: {"count": 0, "cpu": 0.0, "wall": 0.0})
+        self.diverged = 0
+
+        self.unit_names = set()
+        self.joined = collections.defaultdict(set)
+        for record in records:
+            self.unit_names.add(record["unit"])
+            self.unit_names.update(
+                name for name in list(record["reads"]) + list(record["writes"]) if "/" in name
+            )
+            if record["dispatch"].endswith("-relation-joined") and record["remote"]:
+                self.joined[record["unit"]].add(record["remote"])
+        self.app_name = min(self.unit_names).split("/")[0]
+
+    def get_harness(self, unit_name):
+        """Return harness of unit `unit_name` (created on first use),
+        with all units of the log in the relation, except those that
+        join in it."""
+
+        harness = self.harnesses.get(unit_name)
+        if harness is None:
+            harness = make_harness(self.charm_cls, unit_name)
+            self.relation_id = harness.add_relation(RELATION_NAME, self.app_name)
+            for name in sorted(self.unit_names - self.joined[unit_name] - {unit_name}):
+                harness.add_relation_unit(self.relation_id, name)
+            harness.begin()
+
+            # keys written, by bucket
+            writes = self.writes[unit_name] = {}
+            # noinspection PyProtectedMember
+            backend = harness._backend
+            update_relation_data = backend.update_relation_data
+
+            def recorded_update_relation_data(relation_id, entity, key, value):
+                writes.setdefault(entity.name, set()).add(key)
+                return update_relation_data(relation_id, entity, key, value)
+
+            backend.update_relation_data = recorded_update_relation_data
+            self.harnesses[unit_name] = harness
+        return harness
+
+    def replay(self):
+        """Replay all records."""
+
+        for record in self.records:
+            self.dispatch(record)
+
+    def dispatch(self, record):
+        """Replay `record` (a dispatch)."""
+
+        harness = self.get_harness(record["unit"])
+        # noinspection PyProtectedMember
+        harness._backend._is_leader = record["leader"]
+        if "config" in record:
+            harness._update_config(record["config"])
+
+        raw = harness._backend._relation_data_raw[self.relation_id]
+        for name, changes in record["reads"].items():
+            data = raw.setdefault(name, {})
+            for key, value in changes.items():
+                if value is None:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+
+        # each hook is a fresh process: nothing is cached between hooks
+        relation = harness.model.get_relation(RELATION_NAME, self.relation_id)
+        for content in relation.data.values():
+            content._invalidate()
+
+        fn = self.get_dispatch_fn(harness, record)
+        writes = self.writes[record["unit"]]
+        writes.clear()
+        t0 = time.process_time()
+        fn()
+        harness.framework.commit()
+        cpu = time.process_time() - t0
+
+        kind = record["dispatch"] or "-"
+        stats = self.stats[kind]
+        stats["count"] += 1
+        stats["cpu"] += cpu
+        stats["wall"] += record["wall"]
+        if writes != {name: set(keys) for name, keys in record["writes"].items()}:
+            self.diverged += 1
+
+    def get_dispatch_fn(self, harness, record):
+        """Return function emitting the event of `record`."""
+
+        charm = harness.charm
+        kind, _, name = record["dispatch"].partition("/")
+        remote = record["remote"]
+
+        if kind == "actions":
+            handler = getattr(charm, f"_on_{name.replace('-', '_')}_action")
+            return lambda: handler(Mock(params=record.get("params") or {}))
+
+        if name == f"{RELATION_NAME}-relation-changed":
+            return lambda: harness._emit_relation_changed(self.relation_id, remote)
+        if name == f"{RELATION_NAME}-relation-joined":
+            if remote not in harness.model.get_relation(RELATION_NAME).units:
+                return lambda: harness.add_relation_unit(self.relation_id, remote)
+        if name == f"{RELATION_NAME}-relation-departed":
+            return lambda: harness.remove_relation_unit(self.relation_id, remote)
+
+        event = getattr(charm.on, name.replace("-", "_"), None)
+        if event is None:
+            return lambda: None
+        if name.startswith(f"{RELATION_NAME}-relation-"):
+            relation = harness.model.get_relation(RELATION_NAME, self.relation_id)
+            unit = harness.model.get_unit(remote) if "/" in remote else None
+            return lambda: event.emit(relation, relation.app, unit)
+        return event.emit
+
+    def cleanup(self):
+        for harness in self.harnesses.values():
+            harness.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("logs", nargs="+")
+    parser.add_argument("--impl", choices=sorted(IMPLEMENTATIONS), default="iface")
+    parser.add_argument("--profile", help="save cProfile stats to file")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    records = load(args.logs)
+    charm_cls = importlib.import_module(IMPLEMENTATIONS[args.impl]).HotPotatoCharm
+    profile = cProfile.Profile() if args.profile else None
+
+    for _ in range(args.repeat):
+        replayer = Replayer(charm_cls, records)
+        try:
+            t0 = time.perf_counter()
+            if profile:
+                profile.runcall(replayer.replay)
+            else:
+                replayer.replay()
+            elapsed = time.perf_counter() - t0
+        finally:
+            replayer.cleanup()
+
+        print(f"{len(records)} dispatches in {elapsed:.2f}s ({replayer.diverged} diverged)")
+        print(f"{'dispatch':<45} {'count':>6} {'cpu':>9} {'recorded':>9}")
+        for kind, stats in sorted(replayer.stats.items()):
+            count = stats["count"]
+            print(
+                f"{kind:<45} {count:>6} {1000 * stats['cpu'] / count:>7.2f}ms"
+                f" {1000 * stats['wall'] / count:>7.2f}ms"
+            )
+
+    if profile:
+        profile.dump_stats(args.profile)
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Discrete-event simulation of the hot potato protocol.
+
+Drives the pure protocol (see `src/protocol.py`), without Juju or
+`Harness`, for capacity planning: e.g., 10^6 passes across 1000 units
+in seconds. Random numbers (owner selection, latencies) are drawn by
+NumPy in batches.
+
+Model (one potato, so there is only ever one event in flight and
+events are simply processed in time order):
+
+* a relation data change reaches each other unit as a relation-changed
+  hook after a (lognormal) propagation `latency`
+* each unit runs one hook at a time: a hook that acts on the change
+  costs `hook_time`; one that returns early (hot key fast path) costs
+  `idle_time`. Every change wakes every unit, so a unit may first have
+  to work through a backlog of idle hooks (modelled as a fluid queue)
+* a pass not yet due (see `delay`) is made by a wakeup hook at the
+  deadline
+
+Reports the pass distribution (per-unit npasses), hops on the critical
+path and hooks (all units) per pass, and modelled pass latency and
+throughput.
+
+Usage:
+    ./run_benchmarks sim [--units 1000] [--passes 1000000] [--mode leader|peer]
+                         [--burst K] [--strategy S] [--delay SECS]
+                         [--latency SECS] [--hook-time SECS] [--idle-time SECS]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from protocol import AppState, advance, claim, peer_handoff
+from strategies import STRATEGIES
+
+
+BATCH = 65536
+
+
+class Draws:
+    """Batched random draws: owner indices and hop latencies."""
+
+    def __init__(self, nunits, strategy, latency, sigma, seed=None):
+        self.nunits = nunits
+        self.strategy = strategy
+        self.rng = np.random.default_rng(seed)
+        self.owners = []
+        self.latencies = []
+        # lognormal with mean `latency`
+        self.mu = np.log(latency) - sigma**2 / 2 if latency > 0 else None
+        self.sigma = sigma
+
+    def owner(self, current, npasses):
+        """Return index of next owner, elected by unit `current`."""
+
+        # (no topology is modelled: "nearby" is random)
+        if self.strategy == "round-robin":
+            return (current + 1) % self.nunits
+        if not self.owners:
+            if self.strategy == "fair":
+                # as the charm: table rebuilt every nunits elections
+                weights = 1.0 / (1.0 + np.array(npasses))
+                self.owners = self.rng.choice(
+                    self.nunits, size=self.nunits, p=weights / weights.sum()
+                ).tolist()
+            else:
+                self.owners = self.rng.integers(0, self.nunits, size=BATCH).tolist()
+        return self.owners.pop()
+
+    def latency(self):
+        """Return a hop latency."""
+
+        if self.mu is None:
+            return 0.0
+        if not self.latencies:
+            self.latencies = self.rng.lognormal(self.mu, self.sigma, size=BATCH).tolist()
+        return self.latencies.pop()
+
+
+class Unit:
+    """Unit hook queue (fluid model of idle hooks)."""
+
+    __slots__ = ["free_at", "backlog", "seen"]
+
+    def __init__(self):
+        self.free_at = 0.0
+        self.backlog = 0.0
+        self.seen = 0
+
+    def run(self, arrival, changes, idle_time, hook_time):
+        """Run hook arriving at `arrival` after idle hooks for the
+        `changes` broadcast so far. Return time the hook ends."""
+
+        backlog = self.backlog + (changes - self.seen) * idle_time
+        if arrival > self.free_at:
+            # idle hooks worked off while waiting
+            waited = arrival - self.free_at
+            backlog = backlog - waited if backlog > waited else 0.0
+            start = arrival
+        else:
+            start = self.free_at
+        end = start + backlog + hook_time
+        self.free_at = end
+        self.backlog = 0.0
+        self.seen = changes
+        return end
+
+
+def simulate(
+    nunits=1000,
+    npasses=1000000,
+    mode="leader",
+    burst=1,
+    strategy="random",
+    delay=0.0,
+    latency=0.05,
+    sigma=0.5,
+    hook_time=0.02,
+    idle_time=0.002,
+    seed=None,
+):
+    """Simulate a game of `npasses` passes; return its measurements."""
+
+    names = [f"hot-potato/{i}" for i in range(nunits)]
+    index = {name: i for i, name in enumerate(names)}
+    draws = Draws(nunits, strategy, latency, sigma, seed)
+    units = [Unit() for _ in range(nunits)]
+    leader = units[0]
+
+    # (lists: cheaper than arrays for scalar updates)
+    npasses_by_unit = [0] * nunits
+    pass_times = [0.0] * npasses
+    # changes broadcast (each a hook on every other unit)
+    changes = 0
+    wakeups = 0
+    hops = 0
+
+    t0 = time.perf_counter()
+    now = 0.0
+    owner = nunits - 1
+    total_passes = 0
+
+    if mode == "peer":
+        # holder hands off directly; the leader checkpoints every change
+        while total_passes < npasses:
+            handoff, _ = peer_handoff(
+                0, total_passes, npasses, names[draws.owner(owner, npasses_by_unit)]
+            )
+            npasses_by_unit[owner] += 1
+            pass_times[total_passes] = now
+            total_passes = handoff.next_total_passes
+            changes += 1
+            leader.run(now + draws.latency(), changes, idle_time, hook_time)
+
+            owner = index[handoff.next_owner]
+            end = units[owner].run(now + draws.latency(), changes, idle_time, hook_time)
+            hops += 1
+            if delay > 0:
+                wakeups += 1
+                end = units[owner].run(end + delay, changes, idle_time, hook_time)
+            now = end
+    else:
+        app = AppState(0, 0, 0, names[owner], "", 0.0, True)
+        while app.run:
+            # owner elects and claims (unit change), leader advances
+            chain = [
+                names[draws.owner(owner, npasses_by_unit)] for _ in range(max(burst, 1))
+            ]
+            npasses_by_unit[owner] += 1
+            changes += 1
+            end = leader.run(now + draws.latency(), changes, idle_time, hook_time)
+            app, hot = advance(app, claim(app, chain), npasses, end + delay)
+            for i in range(total_passes, app.total_passes):
+                pass_times[i] = end
+            total_passes = app.total_passes
+            if not app.run:
+                break
+
+            # owner (and relays) woken by app change
+            for relay in hot[:-1]:
+                npasses_by_unit[index[relay]] += 1
+            changes += 1
+            owner = index[app.owner]
+            end = units[owner].run(end + draws.latency(), changes, idle_time, hook_time)
+            hops += 2
+            if app.deadline > end:
+                wakeups += 1
+                end = units[owner].run(app.deadline, changes, idle_time, hook_time)
+            now = end
+
+    elapsed = time.perf_counter() - t0
+
+    npasses_by_unit = np.array(npasses_by_unit)
+    pass_times = np.array(pass_times[:total_passes])
+    intervals = np.diff(pass_times)
+    span = pass_times[total_passes - 1] - pass_times[0] if total_passes > 1 else 0.0
+    return {
+        "units": nunits,
+        "passes": total_passes,
+        "elapsed": elapsed,
+        "sim_passes_per_sec": total_passes / elapsed if elapsed else 0.0,
+        "passes_per_sec": len(intervals) / span if span > 0 else 0.0,
+        "latency_p50": float(np.percentile(intervals, 50)) if len(intervals) else 0.0,
+        "latency_p95": float(np.percentile(intervals, 95)) if len(intervals) else 0.0,
+        "latency_p99": float(np.percentile(intervals, 99)) if len(intervals) else 0.0,
+        "hops_per_pass": hops / max(total_passes, 1),
+        "hooks_per_pass": (changes * (nunits - 1) + wakeups) / max(total_passes, 1),
+        "npasses_min": int(npasses_by_unit.min()),
+        "npasses_max": int(npasses_by_unit.max()),
+        "npasses_mean": float(npasses_by_unit.mean()),
+        "npasses_stdev": float(npasses_by_unit.std()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--units", type=int, nargs="+", default=[1000])
+    parser.add_argument("--passes", type=int, default=1000000)
+    parser.add_argument("--mode", choices=["leader", "peer"], default="leader")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--strategy", choices=STRATEGIES, default="random")
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--hook-time", type=float, default=0.02)
+    parser.add_argument("--idle-time", type=float, default=0.002)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    header = (
+        f"{'units':>5} {'passes':>8} {'sim':>7} {'pass/s':>8} {'p50':>8} {'p95':>8}"
+        f" {'p99':>8} {'hop/pass':>8} {'hook/pass':>9} {'npasses min/mean/max (sd)':>26}"
+    )
+    print(header)
+    print("-" * len(header))
+    for nunits in args.units:
+        r = simulate(
+            nunits,
+            args.passes,
+            mode=args.mode,
+            burst=args.burst,
+            strategy=args.strategy,
+            delay=args.delay,
+            latency=args.latency,
+            hook_time=args.hook_time,
+            idle_time=args.idle_time,
+            seed=args.seed,
+        )
+        npasses = (
+            f"{r['npasses_min']}/{r['npasses_mean']:.1f}/{r['npasses_max']}"
+            f" ({r['npasses_stdev']:.1f})"
+        )
+        print(
+            f"{r['units']:>5} {r['passes']:>8} {r['elapsed']:>6.1f}s"
+            f" {r['passes_per_sec']:>8.2f}"
+            f" {1000 * r['latency_p50']:>6.0f}ms {1000 * r['latency_p95']:>6.0f}ms"
+            f" {1000 * r['latency_p99']:>6.0f}ms"
+            f" {r['hops_per_pass']:>8.2f} {r['hooks_per_pass']:>9.0f} {npasses:>26}"
+        )
+
+
+if __name__ == "__main__":
+    main()
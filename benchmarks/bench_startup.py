@@ -0,0 +1,100 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Startup benchmark: per-dispatch import and charm `__init__` cost.
+
+Every hook is a fresh process, so the cost of importing the charm
+(and its dependencies) and constructing it is paid on every pass. Each
+sample runs in a fresh interpreter and reports:
+
+* ops - importing `ops.main` (paid by any charm)
+* import - importing the implementation module
+* init - constructing the charm (`Harness.begin`)
+
+with and without the `DebuggerCharm` interposition (see `bootconfig`).
+
+Usage:
+    ./run_benchmarks startup [--samples N] [--impl iface noiface]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_game import IMPLEMENTATIONS
+from stats import percentile
+
+
+SAMPLE = """
+import json, sys, time
+t0 = time.perf_counter()
+import ops.main
+t1 = time.perf_counter()
+import importlib
+module = importlib.import_module(sys.argv[1])
+t2 = time.perf_counter()
+from ops.testing import Harness
+harness = Harness(module.HotPotatoCharm)
+t3 = time.perf_counter()
+harness.begin()
+t4 = time.perf_counter()
+print(json.dumps({"ops": t1 - t0, "import": t2 - t1, "init": t4 - t3}))
+"""
+
+
+def sample_startup(module_name, debugger, samples):
+    """Return list of per-sample timings (dicts, in seconds)."""
+
+    results = []
+    with tempfile.TemporaryDirectory() as charm_dir:
+        with open(os.path.join(charm_dir, ".boot-config.json"), "w") as f:
+            json.dump({"debugger-intercept-handler": debugger}, f)
+        env = dict(os.environ, JUJU_CHARM_DIR=charm_dir)
+        for _ in range(samples):
+            out = subprocess.run(
+                [sys.executable, "-c", SAMPLE, module_name],
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results.append(json.loads(out.splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument(
+        "--impl", nargs="+", choices=sorted(IMPLEMENTATIONS), default=["iface", "noiface"]
+    )
+    args = parser.parse_args()
+
+    header = (
+        f"{'impl':<8} {'debugger':>8} {'ops':>8} {'import':>8} {'init':>8}"
+        f" {'total':>8} {'p95':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for impl in args.impl:
+        for debugger in (True, False):
+            results = sample_startup(IMPLEMENTATIONS[impl], debugger, args.samples)
+            totals = [r["ops"] + r["import"] + r["init"] for r in results]
+            means = {
+                key: 1000 * statistics.mean(r[key] for r in results)
+                for key in ("ops", "import", "init")
+            }
+            print(
+                f"{impl:<8} {str(debugger):>8} {means['ops']:>6.2f}ms"
+                f" {means['import']:>6.2f}ms {means['init']:>6.2f}ms"
+                f" {1000 * statistics.mean(totals):>6.2f}ms"
+                f" {1000 * percentile(totals, 95):>6.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Simulated hot potato deployment built on `ops.testing.Harness`.
+
+A `Harness` only ever models a single unit. `PeerCluster` creates one
+harness per unit, all sharing the "hot-potato" peer relation, and
+propagates relation data writes between them the way the Juju agent
+would: each change to a unit (or, from the leader, the application)
+bucket is queued as a relation-changed hook on every other unit and
+hooks are dispatched one at a time, in order.
+
+Every dispatched hook is measured (CPU time, relation reads/writes).
+
+`Federation` relates the leaders of several clusters (applications)
+over the federation/federate relations (see `gateway`).
+"""
+
+import collections
+import os
+import time
+from unittest.mock import Mock
+
+import ops.testing
+from ops.framework import Framework
+from ops.model import Model
+from ops.testing import Harness
+
+from recorder import Recorder
+
+
+ops.testing.SIMULATE_CAN_CONNECT = True
+
+RELATION_NAME = "hot-potato"
+
+HookStats = collections.namedtuple(
+    "HookStats", ["unit", "kind", "cpu", "reads", "writes", "statuses"]
+)
+
+
+def make_harness(charm_cls, unit_name):
+    """Return a harness for `charm_cls` that models unit `unit_name`.
+
+    `Harness` always models "<app>/0"; rebuild its backend view of the
+    model so that each cluster member is a distinct unit.
+    """
+
+    # noinspection PyProtectedMember
+    harness = Harness(charm_cls)
+    harness._unit_name = unit_name
+    harness._backend.unit_name = unit_name
+    harness._backend.app_name = unit_name.split("/")[0]
+    harness._model = Model(harness._meta, harness._backend)
+    harness._framework = Framework(
+        harness._storage, harness._charm_dir, harness._meta, harness._model
+    )
+    return harness
+
+
+def set_address(harness, address):
+    """Make `address` the (fake) ingress address of the unit modelled by
+    `harness`, on all bindings."""
+
+    network = {
+        "bind-addresses": [
+            {"interface-name": "eth0", "addresses": [{"cidr": "", "value": address}]}
+        ],
+        "egress-subnets": [],
+        "ingress-addresses": [address],
+    }
+    # noinspection PyProtectedMember
+    harness._backend.network_get = lambda endpoint_name, relation_id=None: network
+
+
+class PeerCluster:
+    """Cluster of harnesses, one per unit, joined by the peer relation.
+
+    As Juju, the cluster does not wake the leader for changes it makes
+    to the application bucket (the charms act on those in the same
+    dispatch, see `_on_pre_commit`); given `leader_app_events`, it
+    delivers them anyway (as relation-changed), e.g., to check that
+    they are harmless.
+
+    `Harness` does not support `network-get`; given `addresses` (a list,
+    by unit index), each unit gets its address as ingress address, and
+    config-changed is dispatched on each so that it publishes it.
+
+    Given `record_dir`, each unit records its dispatches there (see
+    `recorder`), in "<unit>.jsonl", for replay.
+
+    Units are named "<app_name>/<i>".
+
+    Juju does not order hooks across units, nor those of one unit for
+    changes by different units. Given `rng` (a `random.Random`), queued
+    hooks are dispatched in random order instead; each sees all buckets
+    as last published (as `relation-get` would), and the other hooks
+    queued on the unit for the same bucket are coalesced into it half of
+    the time.
+    """
+
+    def __init__(
+        self,
+        charm_cls,
+        nunits,
+        leader=0,
+        leader_app_events=False,
+        addresses=None,
+        record_dir=None,
+        app_name=RELATION_NAME,
+        rng=None,
+    ):
+        self.app_name = app_name
+        self.rng = rng
+        self.unit_names = [f"{self.app_name}/{i}" for i in range(nunits)]
+        self.leader_app_events = leader_app_events
+
+        self.harnesses = {}
+        self.recorders = {}
+        self.published = {}
+        self.queue = collections.deque()
+        self.hooks = []
+
+        for name in self.unit_names:
+            harness = make_harness(charm_cls, name)
+            if record_dir:
+                path = os.path.join(record_dir, name.replace("/", "-"))
+                recorder = Recorder(f"{path}.jsonl", f"{path}-state.json")
+                # noinspection PyProtectedMember
+                recorder.instrument(harness._backend)
+                self.recorders[name] = recorder
+            self.relation_id = harness.add_relation(RELATION_NAME, self.app_name)
+            for other in self.unit_names:
+                if other != name:
+                    harness.add_relation_unit(self.relation_id, other)
+            if addresses:
+                set_address(harness, addresses[len(self.harnesses)])
+            harness.begin()
+            self.harnesses[name] = harness
+            self.published[name] = {}
+        self.published[self.app_name] = {}
+
+        if addresses:
+            for name in self.unit_names:
+                self.emit(name, "config_changed")
+
+        self.leader_name = self.unit_names[leader]
+        self._dispatch(self.leader, "leader-elected", lambda: self.leader.set_leader(True))
+
+    def elect(self, name):
+        """Make unit `name` the leader (failover); the previous leader
+        stays in the cluster as an ordinary unit.
+
+        The new leader sees all buckets as last published, whether or
+        not the changes have reached it yet (as `relation-get` would).
+        """
+
+        self.leader.set_leader(False)
+        self.leader_name = name
+        for other_name, published in self.published.items():
+            if other_name != name:
+                # noinspection PyProtectedMember
+                raw = self.leader._backend._relation_data_raw[self.relation_id][other_name]
+                raw.clear()
+                raw.update(published)
+        # hooks already queued still run, but their (older) changes are
+        # already seen
+        self.queue = collections.deque(
+            (harness, bucket_name, {} if harness is self.leader else changes)
+            for harness, bucket_name, changes in self.queue
+        )
+        self._dispatch(self.leader, "leader-elected", lambda: self.leader.set_leader(True))
+
+    def switch(self, charm_cls):
+        """Switch every unit to `charm_cls` (the other implementation, as
+        the `implementation` config option does), keeping relation data
+        and stored state, and dispatch config-changed on each."""
+
+        # noinspection PyProtectedMember
+        for harness in self.harnesses.values():
+            harness._charm_cls = charm_cls
+            harness._framework = Framework(
+                harness._storage, harness._charm_dir, harness._meta, harness._model
+            )
+            harness._charm = None
+            harness.begin()
+        for name in self.unit_names:
+            self.emit(name, "config_changed")
+
+    def remove(self, name):
+        """Remove unit `name` (departure): relation-departed on every
+        other unit; its queued hooks and bucket changes are dropped."""
+
+        harness = self.harnesses.pop(name)
+        self.unit_names.remove(name)
+        del self.published[name]
+        self.queue = collections.deque(
+            (other, bucket_name, changes)
+            for other, bucket_name, changes in self.queue
+            if other is not harness and bucket_name != name
+        )
+        harness.cleanup()
+
+        for other in self.harnesses.values():
+            self._dispatch(
+                other,
+                "relation-departed",
+                lambda: other.remove_relation_unit(self.relation_id, name),
+                name,
+            )
+
+    def cleanup(self):
+        for harness in self.harnesses.values():
+            harness.cleanup()
+
+    @property
+    def leader(self):
+        return self.harnesses[self.leader_name]
+
+    def app_data(self):
+        """Return (raw) application bucket as seen by the leader."""
+
+        return self.leader.get_relation_data(self.relation_id, self.app_name)
+
+    def unit_data(self, name):
+        """Return (raw) unit bucket of unit `name`."""
+
+        return self.harnesses[name].get_relation_data(self.relation_id, name)
+
+    def run_action(self, name, params, unit_name=None):
+        """Run action `name` (with `params`) on a unit (default: leader).
+
+        The unit sees all buckets as last published, whether or not the
+        changes have reached it yet (as `relation-get` would).
+        """
+
+        harness = self.harnesses[unit_name or self.leader_name]
+        self._sync(harness)
+        event = Mock(params=params)
+        if harness.model.unit.name in self.recorders:
+            # (not read through the backend)
+            self.recorders[harness.model.unit.name].params = params
+        handler = getattr(harness.charm, f"_on_{name.replace('-', '_')}_action")
+        self._dispatch(harness, f"{name}-action", lambda: handler(event))
+        return event
+
+    def emit(self, unit_name, event_name):
+        """Dispatch charm event `event_name` (e.g., "update_status") on a unit."""
+
+        harness = self.harnesses[unit_name]
+        event = getattr(harness.charm.on, event_name)
+        self._dispatch(harness, event_name.replace("_", "-"), event.emit)
+
+    def drain(self, max_hooks=None):
+        """Dispatch queued hooks until none remain (or `max_hooks` reached).
+
+        Return the number of hooks dispatched.
+        """
+
+        count = 0
+        while self.queue and (max_hooks is None or count < max_hooks):
+            if self.rng is None:
+                harness, name, changes = self.queue.popleft()
+            else:
+                harness, name = self._pop_random()
+                changes = self._sync(harness)
+            self._deliver(harness, name, changes)
+            count += 1
+        return count
+
+    #
+    # internals
+    #
+    def _pop_random(self):
+        """Pop a queued hook at random (possibly coalescing later hooks
+        for its bucket); return (harness, bucket name)."""
+
+        i = self.rng.randrange(len(self.queue))
+        self.queue.rotate(-i)
+        harness, name, _ = self.queue.popleft()
+        self.queue.rotate(i)
+
+        if self.rng.random() < 0.5:
+            self.queue = collections.deque(
+                (other, bucket_name, changes)
+                for other, bucket_name, changes in self.queue
+                if (other, bucket_name) != (harness, name)
+            )
+        return harness, name
+
+    def _sync(self, harness):
+        """Update all buckets in `harness` to the last published, as
+        seen by `relation-get`. Return no changes (to deliver)."""
+
+        # noinspection PyProtectedMember
+        raws = harness._backend._relation_data_raw[self.relation_id]
+        for name, published in self.published.items():
+            owned = name == harness.model.unit.name or (
+                name == self.app_name and harness.model.unit.is_leader()
+            )
+            if not owned:
+                raws[name] = dict(published)
+        return {}
+
+    def _deliver(self, harness, name, changes):
+        """Apply remote bucket `changes` in `harness` and dispatch relation-changed."""
+
+        # noinspection PyProtectedMember
+        owned = name == harness.model.unit.name or (
+            name == self.app_name and harness.model.unit.is_leader()
+        )
+        if not owned:
+            raw = harness._backend._relation_data_raw[self.relation_id][name]
+            for key, value in changes.items():
+                if value is None:
+                    raw.pop(key, None)
+                else:
+                    raw[key] = value
+
+        self._dispatch(
+            harness,
+            "relation-changed",
+            lambda: harness._emit_relation_changed(self.relation_id, name),
+            name,
+        )
+
+    def _dispatch(self, harness, kind, fn, remote=""):
+        """Run hook `fn` on `harness`, record its stats and publish changes."""
+
+        # each hook is a fresh process: nothing is cached between hooks
+        # noinspection PyProtectedMember
+        relation = harness.model.get_relation(RELATION_NAME, self.relation_id)
+        for content in relation.data.values():
+            content._invalidate()
+
+        harness._get_backend_calls(reset=True)
+        t0 = time.process_time()
+        w0 = time.perf_counter()
+        fn()
+        harness.framework.commit()
+        cpu = time.process_time() - t0
+        wall = time.perf_counter() - w0
+        calls = harness._get_backend_calls(reset=True)
+
+        reads = sum(1 for call in calls if call[0] == "relation_get")
+        writes = sum(1 for call in calls if call[0] == "update_relation_data")
+        statuses = sum(1 for call in calls if call[0] == "status_set")
+        self.hooks.append(
+            HookStats(harness.model.unit.name, kind, cpu, reads, writes, statuses)
+        )
+
+        unit = harness.model.unit
+        if unit.name in self.recorders:
+            if kind.endswith("-action"):
+                dispatch = f"actions/{kind[:-len('-action')]}"
+            elif kind.startswith("relation-"):
+                dispatch = f"hooks/{RELATION_NAME}-{kind}"
+            else:
+                dispatch = f"hooks/{kind}"
+            config = dict(harness.charm.config)
+            self.recorders[unit.name].record(
+                unit.name, unit.is_leader(), dispatch, remote, wall, cpu, config
+            )
+
+        self._publish(harness)
+
+    def _publish(self, harness):
+        """Queue relation-changed hooks for buckets changed by `harness`."""
+
+        unit_name = harness.model.unit.name
+        names = [unit_name]
+        if harness.model.unit.is_leader():
+            names.append(self.app_name)
+
+        for name in names:
+            data = dict(harness.get_relation_data(self.relation_id, name))
+            published = self.published[name]
+            changes = {k: v for k, v in data.items() if published.get(k) != v}
+            changes.update({k: None for k in published if k not in data})
+            if not changes:
+                continue
+            self.published[name] = data
+
+            for other_name, other in self.harnesses.items():
+                if other_name != unit_name or (
+                    name == self.app_name and self.leader_app_events
+                ):
+                    self.queue.append((other, name, changes))
+
+
+class Federation:
+    """Clusters (applications) whose leaders are related over the
+    federation relations: each (earlier) cluster provides "federation"
+    to each later one ("federate").
+
+    Only the leaders take part. Changes to a leader's application bucket
+    of a federation relation are delivered, as relation-changed, to the
+    other leader once its cluster has no hooks queued (the clusters are
+    drained in turn), so the applications' games interleave only at
+    turn boundaries.
+    """
+
+    def __init__(self, clusters):
+        self.clusters = clusters
+        # (cluster, relation id, remote cluster), per leader relation
+        self.links = []
+        self.published = {}
+        self.queue = collections.deque()
+
+        for i, cluster in enumerate(clusters):
+            for other in clusters[i + 1:]:
+                self._relate(cluster, "federation", other)
+                self._relate(other, "federate", cluster)
+
+    def app_data(self, cluster, remote):
+        """Return (raw) application bucket of `cluster` in its relation
+        with cluster `remote`."""
+
+        relation_id = self._get_relation_id(cluster, remote)
+        return cluster.leader.get_relation_data(relation_id, cluster.app_name)
+
+    def drain(self, max_hooks=None):
+        """Drain clusters and deliver federation changes until none
+        remain (or `max_hooks` reached). Return the number of hooks
+        dispatched."""
+
+        count = 0
+        while max_hooks is None or count < max_hooks:
+            for cluster in self.clusters:
+                count += cluster.drain(None if max_hooks is None else max_hooks - count)
+            self._publish()
+            if not self.queue:
+                break
+            cluster, relation_id, app_name, changes = self.queue.popleft()
+            harness = cluster.leader
+            values = {key: value or "" for key, value in changes.items()}
+            cluster._dispatch(
+                harness,
+                "federation-relation-changed",
+                lambda: harness.update_relation_data(relation_id, app_name, values),
+                app_name,
+            )
+            count += 1
+        return count
+
+    #
+    # internals
+    #
+    def _relate(self, cluster, name, remote):
+        relation_id = cluster.leader.add_relation(name, remote.app_name)
+        self.links.append((cluster, relation_id, remote))
+        self.published[(cluster.app_name, remote.app_name)] = {}
+
+    def _get_relation_id(self, cluster, remote):
+        for link_cluster, relation_id, link_remote in self.links:
+            if (link_cluster, link_remote) == (cluster, remote):
+                return relation_id
+        raise KeyError(remote.app_name)
+
+    def _publish(self):
+        """Queue relation-changed for application buckets changed by a
+        leader."""
+
+        for cluster, relation_id, remote in self.links:
+            key = (cluster.app_name, remote.app_name)
+            data = dict(cluster.leader.get_relation_data(relation_id, cluster.app_name))
+            published = self.published[key]
+            changes = {k: v for k, v in data.items() if published.get(k) != v}
+            changes.update({k: None for k in published if k not in data})
+            if not changes:
+                continue
+            self.published[key] = data
+            self.queue.append(
+                (
+                    remote,
+                    self._get_relation_id(remote, cluster),
+                    cluster.app_name,
+                    changes,
+                )
+            )
@@ -0,0 +1,74 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Boot configuration.
+
+Some configuration is needed at import, before the charm (and so its
+config) is available, e.g., whether to interpose `DebuggerCharm`. It
+is cached in a file in the charm directory, written by config-changed,
+and read (once) at import. Changes apply from the next dispatch.
+"""
+
+import json
+import os
+
+
+BOOT_CONFIG_NAME = ".boot-config.json"
+
+# config keys (and defaults, matching config.yaml) used at boot
+DEFAULTS = {
+    "debugger-intercept-handler": True,
+    "implementation": "iface",
+    "record-hooks": False,
+    "trace-sample-rate": 0.0,
+}
+
+_cache = None
+
+
+def get_charm_dir():
+    """Return charm directory (also available before the charm is)."""
+
+    return os.environ.get("JUJU_CHARM_DIR") or os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+
+
+def get_path():
+    """Return path of boot config file."""
+
+    return os.path.join(get_charm_dir(), BOOT_CONFIG_NAME)
+
+
+def load():
+    """Return boot config (defaults, if not yet saved)."""
+
+    global _cache
+
+    if _cache is None:
+        config = dict(DEFAULTS)
+        try:
+            with open(get_path()) as f:
+                config.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        _cache = config
+    return _cache
+
+
+def save(config):
+    """Save boot config from (charm) `config`. Return True if changed."""
+
+    global _cache
+
+    boot_config = {key: config.get(key, default) for key, default in DEFAULTS.items()}
+    if boot_config == load():
+        return False
+
+    path = get_path()
+    tmppath = f"{path}.tmp"
+    with open(tmppath, "w") as f:
+        json.dump(boot_config, f)
+    os.replace(tmppath, path)
+    _cache = boot_config
+    return True
@@ -14,13 +14,15 @@ import logging
 
 from ops.main import main
 
+import bootconfig
+
 
-USE_IFACE = True
 logger = logging.getLogger(__name__)
 
 
 if __name__ == "__main__":
-    if USE_IFACE:
+    # selected per dispatch (see `bootconfig`)
+    if bootconfig.load()["implementation"] != "noiface":
         import charmiface
 
         HotPotatoCharm = charmiface.HotPotatoCharm
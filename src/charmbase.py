@@ -8,21 +8,69 @@
 """
 
 
+import json
 import logging
+import os
 import random
 import sys
+import time
 
 sys.path.insert(1, sys.path[0] + "/vendor")
 
 from hpctops.charm.service import ServiceCharm
-from hpctops.misc import get_methodname, log_enter_exit
+from hpctops.misc import get_methodname
+from ops.model import ModelError
+
+import bootconfig
+import recorder
+from gateway import (
+    FederatedPass,
+    aggregate,
+    decode_pass,
+    encode_pass,
+    encode_passes,
+    hand_on,
+    is_newer_pass,
+    turn_passes,
+)
+from pacing import adjust_delay
+from protocol import Claim, encode_claim, is_newer
+from stats import RING_SIZE, ring_append, ring_values
+from tracing import traced
 
 
 logger = logging.getLogger(__name__)
 
+# raw key (in app and unit buckets) naming the units that need to act
+# on a change; "*" for all
+HOT_KEY = "hot"
+# raw key (in unit buckets) with the unit's (ingress) address, for the
+# "nearby" strategy
+ADDRESS_KEY = "address"
+# raw keys (in unit buckets) for "side-channel" mode: the unit daemon's
+# endpoint and token (required in every message), and its last
+# checkpoint (claim record)
+ENDPOINT_KEY = "endpoint"
+TOKEN_KEY = "token"
+CHECKPOINT_KEY = "checkpoint"
+
+# inter-application relations of federated games (see `gateway`), and
+# their (raw) app bucket keys
+FEDERATION_RELATIONS = ("federation", "federate")
+PASS_KEY = "pass"
+PASSES_KEY = "passes"
+
+# configure action parameters that change the game: claims made under
+# the old values are stale (a new epoch is started)
+EPOCH_PARAMS = frozenset(["burst", "max-passes", "mode", "owner", "potatoes"])
 
-if 1:
-    # interpose DebuggerCharm
+# set once the missing juju-exec/juju-run has been warned about (once
+# per process)
+_wakeup_warned = False
+
+
+if bootconfig.load()["debugger-intercept-handler"]:
+    # interpose DebuggerCharm (see `bootconfig`)
     from hpctops.charm import set_base_charm
 
     set_base_charm(ServiceCharm)
@@ -32,11 +80,71 @@ if 1:
 class BaseHotPotatoCharm(ServiceCharm):
     """Hot potato operator."""
 
+    # "implementation" config value (see charm.py)
+    IMPLEMENTATION = None
+
     # _stored already available
 
     def __init__(self, *args):
         super().__init__(*args)
 
+        self._stored.set_default(
+            alias_alias=[],
+            alias_prob=[],
+            alias_uses=0,
+            app_epoch=0,
+            app_seq=0,
+            bench_base=0,
+            bench_ended_at=0.0,
+            bench_hooks=0,
+            bench_npasses=0,
+            bench_started_at=0.0,
+            credited_epoch=0,
+            credited_relays=0,
+            fed_epoch=0,
+            fed_max=0,
+            fed_passes=0,
+            fed_total=0,
+            fed_turn=0,
+            held_deadline=0.0,
+            held_passes=-1,
+            hold_ring=[],
+            hold_ring_index=0,
+            hot=True,
+            nearby=[],
+            nearby_uses=0,
+            pass_ring=[],
+            pass_ring_index=0,
+            paced_delay=-1.0,
+            peer_epoch=0,
+            progress_at=0.0,
+            received_at=0.0,
+            recorded_passes=0,
+            roster=[],
+            roster_index=0,
+            seen_passes=0,
+            side_epoch=0,
+            side_npasses=0,
+            side_passes=0,
+            side_token="",
+            status="",
+            turn_base=0,
+            turn_end=0,
+            wakeup_at=0.0,
+            wakeup_degraded=False,
+        )
+
+        # status is rendered (at most) once per dispatch, see
+        # `service_update_status`
+        self._status_dirty = False
+        # app bucket changed by this (leader) unit, see `_on_pre_commit`
+        self._app_changed = False
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+        if recorder.RECORDING:
+            # (see `recorder`)
+            recorder.get_recorder().instrument(self.model._backend)
+            self.framework.observe(self.framework.on.commit, self._on_commit)
+
         # standard handlers registered
 
         self.framework.observe(self.on.config_changed, self._on_config_changed)
@@ -46,43 +154,834 @@ class BaseHotPotatoCharm(ServiceCharm):
         self.framework.observe(
             self.on.hot_potato_relation_departed, self._on_hot_potato_relation_departed
         )
+        self.framework.observe(self.on.stats_action, self._on_stats_action)
+        self.framework.observe(self.on.federate_action, self._on_federate_action)
+        for name in FEDERATION_RELATIONS:
+            self.framework.observe(
+                self.on[name].relation_changed, self._on_federation_relation_changed
+            )
 
-    @log_enter_exit()
+    @traced()
     def _on_config_changed(self, event):
-        logger.debug(f"CONFIG CHANGED")
+        logger.debug("CONFIG CHANGED")
+        if bootconfig.save(self.config):
+            logger.debug("boot config changed; applies from next dispatch")
+        self.publish_address()
         self.service_update_status()
 
-    @log_enter_exit()
+    @traced()
+    def _on_federate_action(self, event):
+        """Start federated game of `passes` passes, in turns of `turn`
+        passes, starting with this application (leader)."""
+
+        try:
+            if not self.unit.is_leader():
+                event.fail("leader only")
+                return
+
+            fpass = FederatedPass(
+                self._stored.fed_epoch + 1,
+                0,
+                event.params["passes"],
+                event.params.get("turn", 10),
+                self.app.name,
+            )
+            self.receive_federated_pass(fpass)
+            event.set_results({"epoch": fpass.epoch, "started": True})
+        finally:
+            self.service_update_status()
+
+    @traced()
+    def _on_federation_relation_changed(self, event):
+        """'federation/federate-relation-changed' handler: potato (or end
+        of game) from another application (leader)."""
+
+        if not self.unit.is_leader() or event.app is None:
+            return
+
+        fpass = decode_pass(event.relation.data[event.app].get(PASS_KEY))
+        if is_newer_pass(fpass, self._stored.fed_epoch, self._stored.fed_total):
+            self.receive_federated_pass(fpass)
+            self.service_update_status()
+
+    @traced()
     def _on_hot_potato_relation_departed(self, event):
         """'hot-potato-relation-departed' handler."""
 
         try:
             logger.debug("DEPARTED")
+            if event.unit:
+                self.update_roster(removed=event.unit.name)
+                if self.unit.is_leader():
+                    self.reelect(gone=event.unit.name)
         except Exception as e:
-            logger.debug(f"[{get_methodname(self)} e ({e})")
+            logger.debug("[%s e (%s)", get_methodname(self), e)
 
         self.service_update_status()
 
-    @log_enter_exit()
+    @traced()
     def _on_hot_potato_relation_joined(self, event):
         """'hot-potato-relation-joined' handler."""
 
         try:
             logger.debug("JOINED")
+            if event.unit:
+                self.update_roster(added=event.unit.name)
+            self.publish_address()
         except Exception as e:
-            logger.debug(f"[{get_methodname(self)} e ({e})")
+            logger.debug("[%s e (%s)", get_methodname(self), e)
 
         self.service_update_status()
 
-    @log_enter_exit()
-    def determine_next_owner(self):
+    @traced()
+    def _on_stats_action(self, event):
+        """Report pass statistics: hold latency (self) and, on the
+        leader, pass latency, passes/sec and npasses distribution."""
+
+        # not needed on most dispatches
+        from stats import summarize_latencies, summarize_npasses, summarize_passes
+
+        results = {
+            "unit": self.unit.name,
+            "hold": summarize_latencies(
+                ring_values(self._stored.hold_ring, self._stored.hold_ring_index)
+            ),
+        }
+        if self.unit.is_leader():
+            results.update(
+                summarize_passes(
+                    ring_values(self._stored.pass_ring, self._stored.pass_ring_index)
+                )
+            )
+            results["npasses"] = summarize_npasses(self.get_npasses())
+            if self._stored.paced_delay >= 0:
+                results["paced-delay"] = self._stored.paced_delay
+            if self._stored.fed_epoch:
+                results["global-passes"] = self.get_global_passes()
+        event.set_results(results)
+
+    @traced()
+    def _on_pre_commit(self, event):
+        """Act on own app bucket changes (leader), and render and set
+        status, if marked dirty during this dispatch and changed since
+        last set.
+
+        Juju does not wake the leader for its own app bucket changes: it
+        acts on them here, as any unit would on relation-changed (e.g.,
+        when it is the new owner), until it leaves the app unchanged.
+        """
+
+        while self._app_changed and self.unit.is_leader():
+            self._app_changed = False
+            self.act_on_own_app_change()
+            self.service_update_status()
+
+        if self._stored.bench_started_at and not self._stored.bench_ended_at:
+            self._stored.bench_hooks += 1
+
+        if not self._status_dirty:
+            return
+        self._status_dirty = False
+
+        status = self.render_status()
+        rendered = f"{status.name}:{status.message}"
+        if rendered != self._stored.status:
+            self.unit.status = status
+            self._stored.status = rendered
+
+    def _on_commit(self, event):
+        """Record dispatch (after pre-commit, so including all writes)."""
+
+        recorder.record(self.unit.name, self.unit.is_leader(), dict(self.config))
+
+    def service_update_status(self):
+        """Mark status dirty.
+
+        Handlers may call this any number of times; the status is
+        rendered once, at the end of the dispatch (framework pre-commit),
+        and set only if it changed (each set is a round trip to the
+        agent).
+        """
+
+        self._status_dirty = True
+
+    def render_status(self):
+        """Return unit status (StatusBase)."""
+
+        raise NotImplementedError()
+
+    def is_hot(self, event):
+        """Return True if relation-changed `event` may need action by
+        this unit.
+
+        A single raw key (see `set_hot`) is checked, so a unit not
+        named does (almost) no work: no interface/bucket decoding and
+        no status update. A unit that was named in its previous change
+        always does the full work, once, to catch up (e.g., status).
+        """
+
+        if event.unit is not None and self.unit.is_leader():
+            # leader always reconciles unit changes
+            return True
+
+        hot = event.relation.data[event.unit or event.app].get(HOT_KEY)
+        ishot = hot is None or hot == "*" or self.unit.name in hot.split()
+        washot = self._stored.hot
+        if ishot != washot:
+            self._stored.hot = ishot
+        return ishot or washot
+
+    def set_hot(self, entity, names):
+        """Set (raw) hot key in bucket of `entity` (app or self unit) to
+        `names` (or "*")."""
+
+        data = self.model.get_relation("hot-potato").data[entity]
+        if entity.name == self.app.name:
+            self._app_changed = True
+        value = names if names == "*" else " ".join(sorted(set(names))) or "-"
+        if data.get(HOT_KEY) != value:
+            data[HOT_KEY] = value
+
+    def is_new_app(self, app):
+        """Return True if app state `app` (AppState) is newer than any
+        seen by this unit (and note it as seen).
+
+        Stale or duplicate app changes (e.g., only the hot key changed)
+        are rejected on the (epoch, seq) of the one state record.
+        """
+
+        if not is_newer(app, self._stored.app_epoch, self._stored.app_seq):
+            return False
+        self._stored.app_epoch = app.epoch
+        self._stored.app_seq = app.seq
+        return True
+
+    def get_unit_names(self):
+        """Return sorted names of all units (including self)."""
+
         # relation.units does not include self.unit!
         relation = self.model.get_relation("hot-potato")
-        names = sorted([self.unit.name] + [unit.name for unit in relation.units])
-        logger.debug(f"*** names ({names})")
-        if names:
-            i = random.randint(0, len(names) - 1)
-            name = names[i]
+        return sorted([self.unit.name] + [unit.name for unit in relation.units])
+
+    def get_unit(self, name):
+        """Return unit `name` (self or peer), or None if not in roster."""
+
+        if name == self.unit.name:
+            return self.unit
+        if name not in self.get_roster():
+            return None
+        return self.model.get_unit(name)
+
+    def get_roster(self):
+        """Return roster: sorted names of all units (including self).
+
+        Kept in stored state and updated on relation joined/departed,
+        rather than rebuilt (and sorted) from the relation every pass.
+        """
+
+        if not self._stored.roster:
+            self.update_roster()
+        return self._stored.roster
+
+    def update_roster(self, added=None, removed=None):
+        """Update roster with `added`/`removed` unit (rebuild if empty)."""
+
+        if self._stored.roster:
+            names = set(self._stored.roster)
         else:
-            name = ""
-        return name
+            names = set(self.get_unit_names())
+        if added:
+            names.add(added)
+        if removed:
+            names.discard(removed)
+
+        roster = sorted(names)
+        self._stored.roster = roster
+        self._stored.roster_index = roster.index(self.unit.name) if self.unit.name in names else 0
+        # weights (and nearby units) no longer match
+        self._stored.alias_prob = []
+        self._stored.nearby_uses = 0
+
+    def get_address(self):
+        """Return (ingress) address of this unit on the peer relation, or
+        "" if not available (e.g., under test)."""
+
+        try:
+            address = self.model.get_binding("hot-potato").network.ingress_address
+        except (ModelError, NotImplementedError):
+            return ""
+        return str(address) if address else ""
+
+    def publish_address(self):
+        """Publish address of this unit in its bucket, if changed."""
+
+        relation = self.model.get_relation("hot-potato")
+        if relation is None:
+            return
+        address = self.get_address()
+        data = relation.data[self.unit]
+        if address and data.get(ADDRESS_KEY) != address:
+            data[ADDRESS_KEY] = address
+
+    def get_nearby_units(self):
+        """Return sorted names of other units in the same locality as
+        this one (see `locality_key`), by their published addresses."""
+
+        # not needed on most dispatches
+        from strategies import locality_key
+
+        relation = self.model.get_relation("hot-potato")
+        locality = locality_key(relation.data[self.unit].get(ADDRESS_KEY))
+        if not locality:
+            return []
+        return sorted(
+            unit.name
+            for unit in relation.units
+            if locality_key(relation.data[unit].get(ADDRESS_KEY)) == locality
+        )
+
+    def record_received(self):
+        """Record time potato was received (first call only, until
+        handed off)."""
+
+        if not self._stored.received_at:
+            self._stored.received_at = time.time()
+
+    def record_handoff(self):
+        """Record hold latency (received to handed off)."""
+
+        if self._stored.received_at:
+            self._stored.hold_ring_index = ring_append(
+                self._stored.hold_ring,
+                self._stored.hold_ring_index,
+                time.time() - self._stored.received_at,
+            )
+            self._stored.received_at = 0.0
+
+    def record_passes(self, total_passes):
+        """Record time of passes up to `total_passes` (leader)."""
+
+        if total_passes < self._stored.recorded_passes:
+            # new game
+            self._stored.recorded_passes = 0
+
+        now = time.time()
+        if total_passes != self._stored.recorded_passes:
+            self._stored.progress_at = now
+        if (
+            self._stored.bench_npasses
+            and not self._stored.bench_ended_at
+            and total_passes - self._stored.bench_base >= self._stored.bench_npasses
+        ):
+            self._stored.bench_ended_at = now
+        for _ in range(min(total_passes - self._stored.recorded_passes, RING_SIZE)):
+            self._stored.pass_ring_index = ring_append(
+                self._stored.pass_ring, self._stored.pass_ring_index, now
+            )
+        self._stored.recorded_passes = total_passes
+
+        if self._stored.turn_end and total_passes >= self._stored.turn_end:
+            self.end_turn(total_passes)
+
+    def act_on_own_app_change(self):
+        """Act on app bucket change made by this unit (leader), see
+        `_on_pre_commit`."""
+
+        raise NotImplementedError()
+
+    def get_settings_error(self, mode, burst, potatoes):
+        """Return why game settings cannot be played together (None if
+        they can)."""
+
+        if potatoes > 1 and mode != "leader":
+            return f"multiple potatoes are not supported in {mode} mode"
+        if potatoes > 1 and burst > 1:
+            return "burst is not supported with multiple potatoes"
+        return None
+
+    def get_federation_relations(self):
+        """Return inter-application relations (see `gateway`)."""
+
+        return [
+            relation for name in FEDERATION_RELATIONS for relation in self.model.relations[name]
+        ]
+
+    def receive_federated_pass(self, fpass):
+        """Note federated pass `fpass` and, if it is to this application,
+        play a turn (leader)."""
+
+        if fpass.epoch != self._stored.fed_epoch:
+            self._stored.fed_passes = 0
+        self._stored.fed_epoch = fpass.epoch
+        self._stored.fed_total = fpass.total_passes
+        self._stored.fed_max = fpass.max_passes
+        self._stored.fed_turn = fpass.turn
+        if fpass.app == self.app.name:
+            self.start_turn()
+
+    def start_turn(self):
+        """Play turn of federated game: a local game (leader)."""
+
+        fpass = self.get_federated_pass()
+        npasses = turn_passes(fpass)
+        base = self.start_game(npasses)
+        self._stored.turn_base = base
+        self._stored.turn_end = base + npasses
+
+    def end_turn(self, total_passes):
+        """Hand potato on to another application (leader), at the end
+        of the turn (local game) at `total_passes`. The potato stays if
+        there is none."""
+
+        npasses = total_passes - self._stored.turn_base
+        self._stored.turn_end = 0
+        self._stored.fed_passes += npasses
+
+        relations = self.get_federation_relations()
+        target = random.choice(relations) if relations else None
+        fpass = hand_on(
+            self.get_federated_pass(),
+            npasses,
+            target.app.name if target is not None else self.app.name,
+        )
+        self._stored.fed_total = fpass.total_passes
+
+        passes = encode_passes(fpass.epoch, self._stored.fed_passes)
+        for relation in relations:
+            data = relation.data[self.app]
+            data[PASSES_KEY] = passes
+            if relation is target or not fpass.app:
+                # (every application learns that the game is over)
+                data[PASS_KEY] = encode_pass(fpass)
+
+        if fpass.app == self.app.name:
+            self.start_turn()
+
+    def get_federated_pass(self):
+        """Return the federated pass last seen (FederatedPass)."""
+
+        stored = self._stored
+        return FederatedPass(
+            stored.fed_epoch, stored.fed_total, stored.fed_max, stored.fed_turn, self.app.name
+        )
+
+    def get_global_passes(self):
+        """Return passes of the federated game, aggregated over this and
+        the related applications."""
+
+        return aggregate(
+            self._stored.fed_epoch,
+            self._stored.fed_passes,
+            [
+                relation.data[relation.app].get(PASSES_KEY)
+                for relation in self.get_federation_relations()
+            ],
+        )
+
+    def start_game(self, npasses):
+        """Start (local) game of `npasses` passes, from the current total
+        passes and owner (leader). Return the total passes it starts
+        from."""
+
+        raise NotImplementedError()
+
+    def get_pass_delay(self, pacing, delay, target_rate):
+        """Return delay before the next pass, for `pacing` (see `pacing`
+        module).
+
+        With "rate" pacing, it is the delay as last adjusted (see
+        `adjust_pass_delay`), at first the target interval. No side
+        effects.
+        """
+
+        if pacing == "none":
+            return 0.0
+        if pacing != "rate" or target_rate <= 0:
+            return delay
+        if self._stored.paced_delay < 0:
+            return 1.0 / target_rate
+        return self._stored.paced_delay
+
+    def adjust_pass_delay(self, pacing, delay, target_rate):
+        """Adjust "rate" pacing delay from the pass times recorded
+        (leader), and return the delay before the next pass (see
+        `get_pass_delay`).
+
+        Steps the rate control: call once per pass (or passes) applied,
+        not for stale changes.
+        """
+
+        if pacing == "rate" and target_rate > 0:
+            self._stored.paced_delay = adjust_delay(
+                self.get_pass_delay(pacing, delay, target_rate),
+                ring_values(self._stored.pass_ring, self._stored.pass_ring_index),
+                target_rate,
+            )
+        return self.get_pass_delay(pacing, delay, target_rate)
+
+    def get_npasses(self):
+        """Return mapping of unit name to its number of passes."""
+
+        return {}
+
+    def start_benchmark(self, npasses, base):
+        """Start measuring a benchmark game of `npasses` passes, from
+        `base` total passes (leader). Pass statistics are reset."""
+
+        self._stored.bench_base = base
+        self._stored.bench_ended_at = 0.0
+        self._stored.bench_hooks = 0
+        self._stored.bench_npasses = npasses
+        self._stored.bench_started_at = time.time()
+        self._stored.hold_ring = []
+        self._stored.hold_ring_index = 0
+        self._stored.pass_ring = []
+        self._stored.pass_ring_index = 0
+        self._stored.recorded_passes = base
+
+    def get_benchmark_results(self):
+        """Return results of the last benchmark game (so far).
+
+        Hooks per pass are estimated from the leader's own: each bucket
+        change is a hook on every other unit, and the leader sees
+        (almost) all of them.
+        """
+
+        if not self._stored.bench_started_at:
+            return {"done": False}
+
+        done = bool(self._stored.bench_ended_at)
+        end = self._stored.bench_ended_at if done else time.time()
+        wall = end - self._stored.bench_started_at
+        npasses = min(
+            max(self._stored.recorded_passes - self._stored.bench_base, 0),
+            self._stored.bench_npasses,
+        )
+        nunits = len(self.get_roster())
+        return {
+            "done": done,
+            "implementation": self.IMPLEMENTATION,
+            "units": nunits,
+            "passes": npasses,
+            "wall-time": wall,
+            "passes-per-sec": npasses / wall if wall > 0 else 0.0,
+            "hooks-per-pass": self._stored.bench_hooks * nunits / max(npasses, 1),
+        }
+
+    def reelect(self, gone=None):
+        """Re-elect owner(s) lost: departed (unit `gone`) or stalled
+        (see `is_lost`) (leader)."""
+
+        raise NotImplementedError()
+
+    def is_lost(self, owner, since, gone=None):
+        """Return True if `owner` is gone (departed unit `gone`, or not
+        in the roster) or has made no progress since `since` within
+        `owner-timeout` seconds."""
+
+        if owner == gone or owner not in self.get_roster():
+            return True
+        timeout = self.config.get("owner-timeout", 0)
+        return timeout > 0 and time.time() - since > timeout
+
+    def elect_other_owner(self, strategy, owner):
+        """Elect next owner using `strategy`, other than `owner` (if
+        there is any other)."""
+
+        roster = self.get_roster()
+        for _ in range(len(roster)):
+            name = self.determine_next_owner(strategy)
+            if name != owner:
+                return name
+        others = [name for name in roster if name != owner]
+        return others[0] if others else owner
+
+    @traced()
+    def determine_next_owner(self, strategy="random"):
+        """Elect next owner using `strategy`. O(1) per pass (amortized).
+
+        See `strategies` module.
+        """
+
+        roster = self.get_roster()
+        if not roster:
+            return ""
+
+        if strategy == "round-robin":
+            return roster[(self._stored.roster_index + 1) % len(roster)]
+        elif strategy == "fair":
+            if self._stored.alias_uses >= len(roster) or len(self._stored.alias_prob) != len(
+                roster
+            ):
+                # (re)build alias table, once per len(roster) elections
+                from strategies import build_alias_table
+
+                npasses = self.get_npasses()
+                weights = [1.0 / (1 + npasses.get(name, 0)) for name in roster]
+                prob, alias = build_alias_table(weights)
+                self._stored.alias_prob = prob
+                self._stored.alias_alias = alias
+                self._stored.alias_uses = 0
+            self._stored.alias_uses += 1
+            from strategies import sample_alias
+
+            return roster[sample_alias(self._stored.alias_prob, self._stored.alias_alias)]
+        elif strategy == "nearby":
+            if not self._stored.nearby_uses or self._stored.nearby_uses >= len(roster):
+                # (re)read nearby units, once per len(roster) elections
+                self._stored.nearby = self.get_nearby_units()
+                self._stored.nearby_uses = 0
+            self._stored.nearby_uses += 1
+            from strategies import sample_nearby
+
+            return sample_nearby(
+                self._stored.nearby, roster, self.config.get("locality-bias", 0.0)
+            )
+
+        return roster[random.randrange(len(roster))]
+
+    def get_side_channel_endpoint(self):
+        """Return endpoint (see `sidechannel`) of this unit's daemon, by
+        the `side-channel` config ("" if disabled)."""
+
+        side_channel = self.config.get("side-channel", "")
+        if side_channel == "unix":
+            return f"unix:{self.get_side_channel_path('sock')}"
+        if side_channel.startswith("tcp:"):
+            # not needed on most dispatches
+            from sidechannel import format_endpoint
+
+            return format_endpoint(self.get_address() or "127.0.0.1", side_channel[len("tcp:"):])
+        return ""
+
+    def get_side_channel_path(self, suffix):
+        """Return path of side-channel file (socket, checkpoint) of this
+        unit in the charm directory (unit named: units may share a host)."""
+
+        name = self.unit.name.replace("/", "-")
+        return os.path.join(bootconfig.get_charm_dir(), f".side-channel-{name}.{suffix}")
+
+    def service_start(self, event=None):
+        """Start side-channel daemon (if enabled), with a new token, and
+        publish its endpoint and token.
+
+        A TCP daemon listens on the unit's ingress address only, and
+        ignores messages without its token.
+        """
+
+        endpoint = self.get_side_channel_endpoint()
+        if not endpoint or self.service_is_running():
+            return
+
+        relation = self.model.get_relation("hot-potato")
+        if relation is None:
+            # nowhere to publish the endpoint yet
+            return
+
+        # not needed on most dispatches
+        import secrets
+
+        from sidechannel import TOKEN_ENV
+
+        token = secrets.token_hex(16)
+        self._stored.side_token = token
+        self.spawn(
+            [
+                sys.executable,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "sidechannel.py"),
+                "serve",
+                self.unit.name,
+                endpoint,
+                self.get_side_channel_path("json"),
+                self.get_dispatch_command("update-status") or "",
+            ],
+            env={TOKEN_ENV: token},
+        )
+
+        data = relation.data[self.unit]
+        if data.get(ENDPOINT_KEY) != endpoint:
+            data[ENDPOINT_KEY] = endpoint
+        data[TOKEN_KEY] = token
+
+    def service_stop(self, event=None, force=False):
+        """Stop side-channel daemon."""
+
+        endpoint = self.get_side_channel_endpoint()
+        if endpoint:
+            from sidechannel import send
+
+            try:
+                send(endpoint, self._stored.side_token, "quit")
+            except OSError:
+                pass
+
+    def service_sync(self, event=None, force=False):
+        """Send game config to side-channel daemon (see
+        `sync_side_channel`)."""
+
+        raise NotImplementedError()
+
+    def service_is_running(self):
+        """Return True if side-channel daemon is running."""
+
+        endpoint = self.get_side_channel_endpoint()
+        if not endpoint:
+            return False
+        from sidechannel import send
+
+        try:
+            send(endpoint, self._stored.side_token, "status")
+        except OSError:
+            return False
+        return True
+
+    def sync_side_channel(self, app, max_passes, delay, strategy):
+        """Send game config to this unit's daemon and, if this unit owns
+        the potato of running game `app`, the potato. Return False if
+        the daemon is disabled or not reachable."""
+
+        endpoint = self.get_side_channel_endpoint()
+        if not endpoint:
+            return False
+        from sidechannel import send
+
+        relation = self.model.get_relation("hot-potato")
+        token = self._stored.side_token
+        peers = {
+            unit.name: [relation.data[unit].get(ENDPOINT_KEY), relation.data[unit].get(TOKEN_KEY)]
+            for unit in relation.units
+        }
+        peers[self.unit.name] = [endpoint, token]
+        config = {
+            "epoch": app.epoch,
+            "max_passes": max_passes,
+            "every": self.config.get("checkpoint-every", 0),
+            "delay": delay,
+            "run": app.run,
+            "strategy": strategy,
+            "peers": {name: peer for name, peer in peers.items() if all(peer)},
+        }
+        try:
+            send(endpoint, token, f"config {json.dumps(config)}")
+            if app.run and app.owner == self.unit.name:
+                held = Claim(app.epoch, app.total_passes, app.owner, "")
+                send(endpoint, token, f"pass {encode_claim(held)}")
+        except OSError as e:
+            logger.debug("side channel not reachable (%s)", e)
+            return False
+        return True
+
+    def read_side_channel_checkpoint(self):
+        """Return (checkpoint, npasses) of the last checkpoint of this
+        unit's daemon, if not yet read: checkpoint (Claim) of the passes
+        made and the holder, and npasses made since the last one read.
+        None otherwise."""
+
+        try:
+            with open(self.get_side_channel_path("json")) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        epoch, total_passes, npasses = state["epoch"], state["total_passes"], state["npasses"]
+        stored = self._stored
+        if (epoch, total_passes, npasses) == (
+            stored.side_epoch,
+            stored.side_passes,
+            stored.side_npasses,
+        ):
+            return None
+        delta = npasses - stored.side_npasses if epoch == stored.side_epoch else npasses
+        stored.side_epoch = epoch
+        stored.side_passes = total_passes
+        stored.side_npasses = npasses
+        return Claim(epoch, total_passes, state["owner"], ""), delta
+
+    def write_side_channel_checkpoint(self, checkpoint):
+        """Write `checkpoint` (Claim) to this unit's bucket, for the
+        leader."""
+
+        data = self.model.get_relation("hot-potato").data[self.unit]
+        data[CHECKPOINT_KEY] = encode_claim(checkpoint)
+
+    def get_dispatch_command(self, hook):
+        """Return shell command dispatching `hook` for this unit from
+        outside a hook, using juju-exec (juju-run for Juju 2.9); None if
+        neither is available (e.g., under test)."""
+
+        # not needed on most dispatches
+        import shlex
+        import shutil
+
+        juju_exec = shutil.which("juju-exec") or shutil.which("juju-run")
+        if not juju_exec:
+            return None
+
+        dispatch = self.charm_dir / "dispatch"
+        return (
+            f"{juju_exec} -u {shlex.quote(self.unit.name)}"
+            f" JUJU_DISPATCH_PATH=hooks/{hook} {shlex.quote(str(dispatch))}"
+        )
+
+    def spawn(self, args, env=None):
+        """Run `args` detached from the current hook (with `env` added
+        to its environment)."""
+
+        # not needed on most dispatches
+        import subprocess
+
+        # juju-exec refuses to run from within a hook context
+        env = {
+            **{k: v for k, v in os.environ.items() if k != "JUJU_CONTEXT_ID"},
+            **(env or {}),
+        }
+        subprocess.Popen(
+            args,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def schedule_wakeup(self, delay):
+        """Schedule an 'update-status' dispatch for this unit in `delay`
+        seconds, without holding up the current hook.
+
+        A detached process sleeps and then dispatches using juju-exec
+        (juju-run for Juju 2.9). Return False if neither is available
+        (e.g., under test): paced passes then wait for the next hook,
+        and the unit status says so (see `render_wakeup_status`).
+        """
+
+        global _wakeup_warned
+
+        now = time.time()
+        if now < self._stored.wakeup_at <= now + delay:
+            # earlier wakeup already pending
+            return True
+
+        command = self.get_dispatch_command("update-status")
+        if not command:
+            if not _wakeup_warned:
+                logger.warning("no juju-exec/juju-run; wakeups not scheduled")
+                _wakeup_warned = True
+            if not self._stored.wakeup_degraded:
+                self._stored.wakeup_degraded = True
+                self.service_update_status()
+            return False
+
+        self.spawn(["/bin/sh", "-c", f"sleep {delay:.3f}; exec {command}"])
+        self._stored.wakeup_at = now + delay
+        if self._stored.wakeup_degraded:
+            self._stored.wakeup_degraded = False
+            self.service_update_status()
+        return True
+
+    def render_wakeup_status(self):
+        """Return unit status text for wakeups: empty, unless they could
+        not be scheduled (see `schedule_wakeup`)."""
+
+        if self._stored.wakeup_degraded:
+            return " wakeup (degraded: no juju-exec)"
+        return ""
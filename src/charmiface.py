@@ -10,13 +10,40 @@
 import logging
 import time
 
-from hpctinterfaces import interface_registry
-from hpctops.misc import log_enter_exit, service_forced_update
-
 from ops.model import ActiveStatus, WaitingStatus
 
-from charmbase import BaseHotPotatoCharm
-import interfaces.hotpotato
+from charmbase import CHECKPOINT_KEY, EPOCH_PARAMS, BaseHotPotatoCharm
+from protocol import (
+    NO_APP,
+    advance,
+    apply_checkpoint,
+    claim,
+    decode_app,
+    decode_claim,
+    encode_app,
+    encode_claim,
+    is_claimed,
+    latest_claim,
+    new_epoch,
+    peer_accepts,
+    peer_handoff,
+    peer_holds,
+    relay_count,
+    transition,
+)
+from shards import (
+    apply_handoffs,
+    decode_handoffs,
+    decode_shards,
+    encode_handoffs,
+    encode_shards,
+    finished,
+    fresh_handoffs,
+    new_shards,
+    reassign_shards,
+    take_shards,
+)
+from tracing import traced
 
 
 logger = logging.getLogger(__name__)
@@ -26,156 +53,755 @@ class HotPotatoCharm(BaseHotPotatoCharm):
 
     """Hot potato charm with interfaces."""
 
+    IMPLEMENTATION = "iface"
+
     def __init__(self, *args):
         super().__init__(*args)
 
-        # superinterface
-        self.hpsiface = interface_registry.load("relation-hot-potato", self, "hot-potato")
+        # superinterface (loaded on first use)
+        self._hpsiface = None
 
         self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(self.on.update_status, self._on_update_status)
 
         self.framework.observe(
             self.on.hot_potato_relation_changed, self._on_hot_potato_relation_changed
         )
 
+        self.framework.observe(self.on.benchmark_action, self._on_benchmark_action)
         self.framework.observe(self.on.configure_action, self._on_configure_action)
         self.framework.observe(self.on.run_action, self._on_run_action)
 
-    @log_enter_exit()
+    @property
+    def hpsiface(self):
+        """Hot potato superinterface.
+
+        Buckets are accessed through snapshots, written back (changes
+        only) at the end of the dispatch.
+        """
+
+        if self._hpsiface is None:
+            # deferred: not needed by dispatches that return early
+            from hpctinterfaces import interface_registry
+            import interfaces.hotpotato
+
+            self._hpsiface = interface_registry.load("relation-hot-potato", self, "hot-potato")
+        return self._hpsiface
+
+    @traced()
+    def _on_pre_commit(self, event):
+        super()._on_pre_commit(event)
+        if self._hpsiface is not None:
+            self._hpsiface.commit()
+
+    @traced()
     def _on_leader_elected(self, event):
         try:
             relation = self.model.get_relation("hot-potato")
             if relation:
-                appiface = self.hpsiface.select(self.app)
+                appiface = self.hpsiface.snapshot(self.app)
                 if not appiface.initialized:
                     # initialize
                     appiface.initialized = True
+                    appiface.burst = 1
                     appiface.delay = 1.0
                     appiface.max_passes = 10
-                    appiface.owner = "-"
-                    appiface.run = False
-                    appiface.total_passes = 0
+                    appiface.mode = "leader"
+                    appiface.pacing = "delay"
+                    appiface.potatoes = 1
+                    appiface.strategy = "random"
+                    appiface.target_rate = 0.0
+                    appiface.state = encode_app(new_epoch(NO_APP))
+                    self.set_hot(self.app, "*")
+                else:
+                    self.recover(appiface)
         finally:
             self.service_set_updated("leader-elected")
             self.service_update_status()
 
+    @traced()
+    def _on_update_status(self, event):
+        """'update-status' handler.
+
+        Also the wakeup for a paced pass (see `schedule_wakeup`).
+        """
+
+        try:
+            relation = self.model.get_relation("hot-potato")
+            if relation:
+                appiface = self.hpsiface.snapshot(self.app)
+                if appiface.mode == "side-channel":
+                    self.checkpoint_side_channel(appiface)
+                elif decode_app(appiface.state).run:
+                    if appiface.mode == "peer":
+                        self.peer_pass(appiface)
+                    self.take_turn(appiface)
+                    if self.unit.is_leader():
+                        self.reelect()
+        finally:
+            self.service_set_updated("update-status")
+            self.service_update_status()
+
     #
     # relations
     #
-    @log_enter_exit()
+    @traced()
     def _on_hot_potato_relation_changed(self, event):
         """'hot-potato-relation-changed' handler."""
 
-        def update_app_from_unit(appiface, unitiface, unit):
-            """Update app from unit (which has changed)"""
+        if not self.is_hot(event):
+            # not for this unit
+            return
+
+        try:
+            appiface = self.hpsiface.snapshot(self.app)
+            if event.unit is None:
+                self.update_unit_from_app_change(appiface)
+                return
+
+            if appiface.mode == "side-channel":
+                # daemons pass; only configs and checkpoints go by relation
+                if self.unit.is_leader():
+                    self.apply_side_channel_checkpoint(appiface, event.unit)
+                return
 
-            if unitiface.next_total_passes > appiface.total_passes:
-                appiface.total_passes = unitiface.next_total_passes
-                appiface.owner = unitiface.next_owner
+            if not decode_app(appiface.state).run:
+                return
+
+            # run
+            if appiface.mode == "peer":
+                # leaderless: units pick up from each other's buckets
+                unitiface = self.hpsiface.snapshot(event.unit)
+                self.peer_receive(appiface, unitiface)
+            elif self.unit.is_leader():
+                # update app from (all) units
+                self.reconcile(appiface)
 
-                if appiface.total_passes >= appiface.max_passes:
-                    # stop passing
-                    appiface.run = False
+        finally:
+            self.service_set_updated("hot-potato-relation-changed")
+            self.service_update_status()
 
-        def update_unit_from_app(unit, unitiface, appiface):
-            """Update unit from app iff unit is now owner."""
+    def update_unit_from_app_change(self, appiface):
+        """Act on app change: take turn (if for self)."""
 
-            if appiface.owner == unit.name:
-                unitiface.next_total_passes = appiface.total_passes + 1
-                unitiface.next_owner = self.determine_next_owner()
-                unitiface.npasses += 1
+        app = decode_app(appiface.state)
+        if appiface.mode == "side-channel":
+            if self.is_new_app(app):
+                self.service_sync()
+            return
 
-        try:
-            appiface = self.hpsiface.select(self.app)
+        if not app.run:
+            # relays of the last burst (which ended the game)
+            self.credit_relays(appiface)
+            return
+
+        if appiface.mode == "peer":
+            self.take_turn(appiface)
+            return
+
+        if not self.is_new_app(app):
+            # stale or duplicate
+            return
 
-            if not appiface.run:
+        self.credit_relays(appiface)
+        self.take_turn(appiface)
+
+    def act_on_own_app_change(self):
+        if self.model.get_relation("hot-potato"):
+            self.update_unit_from_app_change(self.hpsiface.snapshot(self.app))
+
+    def recover(self, appiface):
+        """Resume game inherited by a new leader.
+
+        Passes claimed (or, with multiple potatoes, handed off) but not
+        yet applied by the previous leader are picked up from all unit
+        buckets, in this one hook. If there are none, the owners are
+        woken again in case the previous leader's last update was not
+        acted on.
+        """
+
+        app = decode_app(appiface.state)
+        if not app.run:
+            return
+
+        relation = self.model.get_relation("hot-potato")
+        units = {unit.name: unit for unit in relation.units}
+        units[self.unit.name] = self.unit
+
+        if appiface.potatoes > 1:
+            shards = appiface.shards
+            self.reconcile(appiface)
+            if appiface.shards == shards:
+                appiface.state = encode_app(transition(app))
+                self.set_hot(
+                    self.app,
+                    [
+                        shard.owner
+                        for shard in decode_shards(shards)
+                        if shard.passes < shard.max_passes
+                    ],
+                )
+            return
+
+        claims = {
+            name: decode_claim(self.hpsiface.snapshot(unit).claim) for name, unit in units.items()
+        }
+        name = latest_claim(app, claims)
+        if appiface.mode == "peer":
+            if name is not None:
+                self.peer_checkpoint(appiface, claims[name])
+        elif name is not None:
+            self.update_app_from_unit(appiface, self.hpsiface.snapshot(units[name]), units[name])
+        else:
+            appiface.state = encode_app(transition(app))
+            self.set_hot(self.app, [app.owner])
+
+    def reelect(self, gone=None):
+        """Re-elect owner(s) lost: departed (unit `gone`) or stalled
+        (leader).
+
+        With a single potato, a new epoch is started with the new owner,
+        so that any claim the lost owner may yet make is stale: no pass
+        is counted twice.
+        """
+
+        relation = self.model.get_relation("hot-potato")
+        if not relation:
+            return
+
+        appiface = self.hpsiface.snapshot(self.app)
+        app = decode_app(appiface.state)
+        if not app.run:
+            return
+
+        if appiface.potatoes > 1:
+            shards = decode_shards(appiface.shards)
+            if reassign_shards(
+                shards,
+                lambda shard: self.is_lost(shard.owner, shard.deadline, gone),
+                lambda owner: self.elect_other_owner(appiface.strategy, owner),
+                time.time(),
+            ):
+                appiface.shards = encode_shards(shards)
+                appiface.state = encode_app(transition(app))
+                self.set_hot(
+                    self.app,
+                    [shard.owner for shard in shards if shard.passes < shard.max_passes],
+                )
+            return
+
+        if appiface.mode == "peer":
+            # potato is held by the next owner of the latest claim
+            units = list(relation.units) + [self.unit]
+            claims = {
+                unit.name: decode_claim(self.hpsiface.snapshot(unit).claim) for unit in units
+            }
+            name = latest_claim(app, claims)
+            if name is not None:
+                app = app._replace(
+                    total_passes=claims[name].next_total_passes, owner=claims[name].next_owner
+                )
+            since = max(self._stored.progress_at, app.deadline)
+        else:
+            since = app.deadline
+
+        if self.is_lost(app.owner, since, gone):
+            owner = self.elect_other_owner(appiface.strategy, app.owner)
+            app = new_epoch(app, owner=owner, relays="", deadline=time.time())
+            appiface.state = encode_app(app)
+            self.set_hot(self.app, [owner])
+
+    def take_turn(self, appiface):
+        """Pass potato iff unit is owner and pass is due.
+
+        Passes are paced by the app `deadline` (set by the leader) rather
+        than by sleeping in the leader's hook: if it is not yet due, a
+        wakeup is scheduled instead.
+        """
+
+        if appiface.potatoes > 1:
+            return self.take_turns(appiface)
+
+        app = decode_app(appiface.state)
+        if app.owner != self.unit.name:
+            return
+
+        selfiface = self.hpsiface.snapshot(self.unit)
+        if is_claimed(app, decode_claim(selfiface.claim)):
+            # already passed; waiting on leader
+            return
+
+        if appiface.mode == "peer":
+            # start of leaderless game: potato taken from app
+            if not peer_accepts(
+                self._stored.peer_epoch, self._stored.seen_passes, claim(app, [app.owner])
+            ):
                 return
+            self._stored.peer_epoch = app.epoch
+            self._stored.seen_passes = app.total_passes
+            self.peer_hold(app.total_passes, app.deadline)
+            self.peer_pass(appiface)
+            return
 
-            # run
-            if self.unit.is_leader() and event.unit != None:
-                # update app from unit
-                unitiface = self.hpsiface.select(event.unit)
-                update_app_from_unit(appiface, unitiface, event.unit)
-                time.sleep(appiface.delay)
-            else:
-                # update unit from app (if for self)
-                if event.unit != None:
-                    # not an app update
-                    return
+        self.record_received()
+        if appiface.pacing != "none":
+            remaining = app.deadline - time.time()
+            if remaining > 0:
+                self.schedule_wakeup(remaining)
+                return
 
-                selfiface = self.hpsiface.select(self.unit)
-                update_unit_from_app(self.unit, selfiface, appiface)
+        self.update_unit_from_app(self.unit, selfiface, appiface)
 
-                # SPECIAL: leader will not get self unit change event
-                # ensure leader can respond
-                if self.unit.is_leader():
-                    update_app_from_unit(appiface, selfiface, self.unit)
+        # SPECIAL: leader will not get self unit change event
+        # ensure leader can respond
+        if self.unit.is_leader():
+            self.update_app_from_unit(appiface, selfiface, self.unit)
+
+    def take_turns(self, appiface):
+        """Pass all potatoes unit owns and are due (multiple potatoes)."""
+
+        shards = decode_shards(appiface.shards)
+        selfiface = self.hpsiface.snapshot(self.unit)
+        handoffs, npasses, wait = take_shards(
+            shards,
+            decode_handoffs(selfiface.next_shards),
+            self.unit.name,
+            time.time(),
+            lambda: self.determine_next_owner(appiface.strategy),
+        )
 
-        finally:
-            self.service_set_updated("hot-potato-relation-changed")
-            self.service_update_status()
+        if wait is not None:
+            self.schedule_wakeup(wait)
+
+        if npasses:
+            selfiface.next_shards = encode_handoffs(handoffs)
+            selfiface.npasses += npasses
+            self.set_hot(self.unit, [])
+
+            # SPECIAL: leader will not get self unit change event
+            if self.unit.is_leader():
+                self.update_app_from_unit(appiface, selfiface, self.unit)
+
+    def peer_hold(self, total_passes, deadline):
+        """Hold potato (peer mode) until `deadline`."""
+
+        self._stored.held_passes = total_passes
+        self._stored.held_deadline = deadline
+        self.record_received()
+
+    def peer_receive(self, appiface, unitiface):
+        """Pick up potato (peer mode) from a changed unit bucket.
+
+        Claims only ever increase, so anything not newer than what has
+        already been seen is stale or a duplicate.
+        """
+
+        unitclaim = decode_claim(unitiface.claim)
+        if not peer_accepts(self._stored.peer_epoch, self._stored.seen_passes, unitclaim):
+            return
+        self._stored.peer_epoch = unitclaim.epoch
+        self._stored.seen_passes = unitclaim.next_total_passes
+
+        if self.unit.is_leader():
+            self.peer_checkpoint(appiface, unitclaim)
+
+        if peer_holds(self.unit.name, appiface.max_passes, unitclaim):
+            self.peer_hold(unitclaim.next_total_passes, time.time() + self.get_delay(appiface))
+            self.peer_pass(appiface)
+
+    def peer_pass(self, appiface):
+        """Pass held potato (peer mode) directly to the next owner."""
+
+        while self._stored.held_passes >= 0:
+            remaining = self._stored.held_deadline - time.time()
+            if remaining > 0:
+                self.schedule_wakeup(remaining)
+                return
+
+            selfclaim, hot = peer_handoff(
+                self._stored.peer_epoch,
+                self._stored.held_passes,
+                appiface.max_passes,
+                self.determine_next_owner(appiface.strategy),
+            )
+
+            selfiface = self.hpsiface.snapshot(self.unit)
+            selfiface.claim = encode_claim(selfclaim)
+            selfiface.npasses += 1
+            self.set_hot(self.unit, hot)
+            self._stored.held_passes = -1
+            self.record_handoff()
+            self._stored.seen_passes = selfclaim.next_total_passes
+
+            # SPECIAL: no self unit change event
+            if self.unit.is_leader():
+                self.peer_checkpoint(appiface, selfclaim)
+            if peer_holds(self.unit.name, appiface.max_passes, selfclaim):
+                self.peer_hold(selfclaim.next_total_passes, time.time() + self.get_delay(appiface))
+
+    def peer_checkpoint(self, appiface, unitclaim):
+        """Record end of leaderless game in app (leader only)."""
+
+        app = decode_app(appiface.state)
+        if unitclaim.epoch == app.epoch and unitclaim.next_total_passes >= appiface.max_passes:
+            app = transition(
+                app,
+                total_passes=unitclaim.next_total_passes,
+                owner=unitclaim.next_owner,
+                run=False,
+            )
+            appiface.state = encode_app(app)
+            self.set_hot(self.app, "*")
+        self.record_passes(unitclaim.next_total_passes)
+
+    def service_sync(self, event=None, force=False):
+        """Send game config to side-channel daemon."""
+
+        appiface = self.hpsiface.snapshot(self.app)
+        self.sync_side_channel(
+            decode_app(appiface.state),
+            appiface.max_passes,
+            self.get_delay(appiface),
+            appiface.strategy,
+        )
+
+    def checkpoint_side_channel(self, appiface):
+        """Copy new side-channel daemon checkpoint to unit bucket."""
+
+        result = self.read_side_channel_checkpoint()
+        if result is None:
+            return
+
+        checkpoint, npasses = result
+        selfiface = self.hpsiface.snapshot(self.unit)
+        selfiface.npasses += npasses
+        self.write_side_channel_checkpoint(checkpoint)
+        self.set_hot(self.unit, [])
+
+        # SPECIAL: leader will not get self unit change event
+        if self.unit.is_leader():
+            self.apply_side_channel_checkpoint(appiface, self.unit)
+
+    def apply_side_channel_checkpoint(self, appiface, unit):
+        """Apply checkpoint in bucket of `unit` to app (leader)."""
+
+        relation = self.model.get_relation("hot-potato")
+        app, hot = apply_checkpoint(
+            decode_app(appiface.state),
+            decode_claim(relation.data[unit].get(CHECKPOINT_KEY)),
+            appiface.max_passes,
+        )
+        if hot is None:
+            # stale
+            return
+
+        appiface.state = encode_app(app)
+        self.set_hot(self.app, hot)
+        self.record_passes(app.total_passes)
+
+    def start_game(self, npasses):
+        appiface = self.hpsiface.snapshot(self.app)
+        app = decode_app(appiface.state)
+        roster = list(self.get_roster())
+        owner = app.owner if app.owner in roster else self.unit.name
+
+        if appiface.potatoes > 1:
+            # potatoes are dealt afresh
+            base = 0
+            appiface.shards = encode_shards(new_shards(appiface.potatoes, roster, owner, npasses))
+        else:
+            base = app.total_passes
+        appiface.max_passes = base + npasses
+        app = new_epoch(
+            app, total_passes=base, owner=owner, relays="", deadline=time.time(), run=True
+        )
+        appiface.state = encode_app(app)
+        self.set_hot(self.app, "*")
+        return base
+
+    def credit_relays(self, appiface):
+        """Credit unit with passes it relayed (in the epoch) that are not
+        yet credited."""
+
+        app = decode_app(appiface.state)
+        if app.epoch < self._stored.credited_epoch:
+            # stale
+            return
+        if app.epoch > self._stored.credited_epoch:
+            # relays are tallied afresh every epoch
+            self._stored.credited_epoch = app.epoch
+            self._stored.credited_relays = 0
+
+        count = relay_count(app.relays, self.unit.name) - self._stored.credited_relays
+        if count > 0:
+            selfiface = self.hpsiface.snapshot(self.unit)
+            selfiface.npasses += count
+            self.set_hot(self.unit, [])
+            self._stored.credited_relays += count
+
+    def update_app_from_unit(self, appiface, unitiface, unit):
+        """Update app from unit (which has changed).
+
+        In burst mode, the unit names a chain of next owners; all hops
+        (up to `max_passes`) are applied at once.
+
+        With multiple potatoes, all potatoes handed off by the unit are
+        reconciled at once.
+        """
+
+        if appiface.potatoes > 1:
+            self.apply_unit_handoffs(appiface, decode_handoffs(unitiface.next_shards))
+            return
+
+        app = decode_app(appiface.state)
+        unitclaim = decode_claim(unitiface.claim)
+        if not is_claimed(app, unitclaim):
+            # stale (rate control is not stepped)
+            return
+
+        app, hot = advance(
+            app, unitclaim, appiface.max_passes, time.time() + self.step_delay(appiface)
+        )
+
+        appiface.state = encode_app(app)
+        self.set_hot(self.app, hot)
+        self.record_passes(app.total_passes)
+
+        # leader is not woken by its own app update
+        self.credit_relays(appiface)
+
+    def apply_unit_handoffs(self, appiface, handoffs):
+        """Apply unit `handoffs` (of any number of units) to app shards
+        (multiple potatoes), in one update."""
+
+        shards = decode_shards(appiface.shards)
+        handoffs = fresh_handoffs(shards, handoffs)
+        if not handoffs:
+            # stale (rate control is not stepped)
+            return
+        apply_handoffs(shards, handoffs, time.time() + self.step_delay(appiface))
+
+        appiface.shards = encode_shards(shards)
+        total_passes = sum(shard.passes for shard in shards)
+        appiface.state = encode_app(
+            transition(
+                decode_app(appiface.state),
+                total_passes=total_passes,
+                run=not finished(shards),
+            )
+        )
+        self.record_passes(total_passes)
+        if finished(shards):
+            # stop passing
+            self.set_hot(self.app, "*")
+        else:
+            self.set_hot(
+                self.app,
+                [shard.owner for shard in shards if shard.passes < shard.max_passes],
+            )
+
+    def reconcile(self, appiface):
+        """Apply all pending unit changes to app (leader).
+
+        Only the owner (with multiple potatoes, the owners) can have a
+        pending claim (handoffs), so only the owners' buckets are read,
+        whichever unit changed: a backlog of unit changes is applied in
+        one hook, and the hooks for the rest are no-ops.
+        """
+
+        if appiface.potatoes > 1:
+            owners = {
+                shard.owner
+                for shard in decode_shards(appiface.shards)
+                if shard.passes < shard.max_passes
+            }
+            handoffs = []
+            for owner in sorted(owners):
+                unit = self.get_unit(owner)
+                if unit is not None:
+                    handoffs.extend(decode_handoffs(self.hpsiface.snapshot(unit).next_shards))
+            self.apply_unit_handoffs(appiface, handoffs)
+            return
+
+        unit = self.get_unit(decode_app(appiface.state).owner)
+        if unit is not None:
+            self.update_app_from_unit(appiface, self.hpsiface.snapshot(unit), unit)
+
+    def update_unit_from_app(self, unit, unitiface, appiface):
+        """Update unit from app iff unit is now owner.
+
+        Elects the next `burst` owners as a chain.
+        """
+
+        app = decode_app(appiface.state)
+        if app.owner == unit.name:
+            chain = [
+                self.determine_next_owner(appiface.strategy)
+                for _ in range(max(appiface.burst, 1))
+            ]
+            unitiface.claim = encode_claim(claim(app, chain))
+            unitiface.npasses += 1
+            self.set_hot(unit, [])
+            self.record_handoff()
+
+    def get_delay(self, appiface):
+        """Return delay before the next pass (see `get_pass_delay`)."""
+
+        return self.get_pass_delay(appiface.pacing, appiface.delay, appiface.target_rate)
+
+    def step_delay(self, appiface):
+        """Return delay before the next pass, stepping rate control (see
+        `adjust_pass_delay`)."""
+
+        return self.adjust_pass_delay(appiface.pacing, appiface.delay, appiface.target_rate)
+
+    def get_npasses(self):
+        relation = self.model.get_relation("hot-potato")
+        npasses = {unit.name: self.hpsiface.snapshot(unit).npasses for unit in relation.units}
+        npasses[self.unit.name] = self.hpsiface.snapshot(self.unit).npasses
+        return npasses
 
     #
     # actions
     #
-    @log_enter_exit()
+    @traced()
+    def _on_benchmark_action(self, event):
+        try:
+            if not self.unit.is_leader():
+                event.fail("leader only")
+                return
+
+            if "passes" not in event.params:
+                event.set_results(self.get_benchmark_results())
+                return
+
+            npasses = event.params["passes"]
+            self.start_benchmark(npasses, self.start_game(npasses))
+            event.set_results(
+                {"implementation": self.IMPLEMENTATION, "passes": npasses, "started": True}
+            )
+        finally:
+            self.service_set_updated("benchmark-action")
+            self.service_update_status()
+
+    @traced()
     def _on_configure_action(self, event):
         try:
             if self.unit.is_leader():
-                appiface = self.hpsiface.select(self.app)
+                appiface = self.hpsiface.snapshot(self.app)
+                app = decode_app(appiface.state)
+
+                error = self.get_settings_error(
+                    event.params.get("mode", appiface.mode),
+                    event.params.get("burst", appiface.burst),
+                    event.params.get("potatoes", appiface.potatoes),
+                )
+                if error:
+                    event.fail(error)
+                    return
+
+                new_game = bool(EPOCH_PARAMS & set(event.params))
+                if new_game and app.run and appiface.mode == "leader":
+                    # count the pending claim (if any) before it goes stale
+                    self.reconcile(appiface)
+                    app = decode_app(appiface.state)
 
+                if "burst" in event.params:
+                    appiface.burst = event.params["burst"]
                 if "delay" in event.params:
                     appiface.delay = event.params["delay"]
                 if "owner" in event.params:
-                    appiface.owner = event.params["owner"]
+                    app = app._replace(owner=event.params["owner"])
                 if "max-passes" in event.params:
                     appiface.max_passes = event.params["max-passes"]
+                if "mode" in event.params:
+                    appiface.mode = event.params["mode"]
+                if "pacing" in event.params:
+                    appiface.pacing = event.params["pacing"]
+                if "potatoes" in event.params:
+                    appiface.potatoes = event.params["potatoes"]
                 if "run" in event.params:
-                    appiface.run = event.params["run"]
-
-                self.service_update_status()
+                    app = app._replace(run=event.params["run"])
+                if "strategy" in event.params:
+                    appiface.strategy = event.params["strategy"]
+                if "target-rate" in event.params:
+                    appiface.target_rate = event.params["target-rate"]
+
+                if {"pacing", "target-rate"} & set(event.params):
+                    # restart rate control
+                    self._stored.paced_delay = -1.0
+
+                if new_game:
+                    # claims made under the old configuration are stale
+                    app = new_epoch(app)
+                else:
+                    app = transition(app)
+                appiface.state = encode_app(app)
+
+                if appiface.potatoes > 1 and {"max-passes", "owner", "potatoes"} & set(
+                    event.params
+                ):
+                    # (re)deal potatoes
+                    shards = new_shards(
+                        appiface.potatoes,
+                        list(self.get_roster()),
+                        app.owner,
+                        appiface.max_passes,
+                    )
+                    appiface.shards = encode_shards(shards)
+
+                self.set_hot(self.app, "*")
         finally:
             self.service_set_updated("configure-action")
             self.service_update_status()
 
-    @log_enter_exit()
+    @traced()
     def _on_run_action(self, event):
         try:
             if self.unit.is_leader():
-                appiface = self.hpsiface.select(self.app)
-                appiface.run = event.params["run"]
-
-                self.service_update_status()
+                appiface = self.hpsiface.snapshot(self.app)
+                app = decode_app(appiface.state)
+                if event.params["run"]:
+                    # first pass is due now
+                    app = app._replace(deadline=time.time())
+                appiface.state = encode_app(transition(app, run=event.params["run"]))
+                self.set_hot(self.app, "*")
         finally:
             self.service_set_updated("run-action")
             self.service_update_status()
 
-    @log_enter_exit()
-    def service_update_status(self):
+    @traced()
+    def render_status(self):
         relation = self.model.get_relation("hot-potato")
         if not relation:
-            self.unit.status = WaitingStatus()
-            return
+            return WaitingStatus()
 
-        appiface = self.hpsiface.select(self.app)
+        appiface = self.hpsiface.snapshot(self.app)
         if not appiface:
-            self.unit.status = WaitingStatus()
-            return
+            return WaitingStatus()
 
-        isowner = appiface.owner == self.unit.name
-        selfiface = self.hpsiface.select(self.unit)
+        app = decode_app(appiface.state)
+        isowner = app.owner == self.unit.name
+        selfiface = self.hpsiface.snapshot(self.unit)
+        selfclaim = decode_claim(selfiface.claim)
         updated = tuple(self.service_get_updated())
 
         if self.unit.is_leader():
             # update app info
             appstatus = (
                 f"APP"
+                f" burst ({appiface.burst})"
                 f" delay ({appiface.delay})"
+                f" epoch ({app.epoch})"
                 f" max_passes ({appiface.max_passes})"
+                f" mode ({appiface.mode})"
+                f" pacing ({appiface.pacing})"
                 f" nunits ({len(relation.units)+1})"
-                f" owner ({appiface.owner})"
-                f" run ({appiface.run})"
-                f" total_passes ({appiface.total_passes})"
+                f" owner ({app.owner})"
+                f" potatoes ({appiface.potatoes})"
+                f" run ({app.run})"
+                f" strategy ({appiface.strategy})"
+                f" total_passes ({app.total_passes})"
                 f" :: "
             )
         else:
@@ -186,8 +812,9 @@ class HotPotatoCharm(BaseHotPotatoCharm):
             f" id ({self.unit.name})"
             f" isowner? ({isowner})"
             f" npasses ({selfiface.npasses})"
-            f" next_owner ({selfiface.next_owner})"
-            f" next_total_passes ({selfiface.next_total_passes})"
+            f" next_owner ({selfclaim.next_owner})"
+            f" next_total_passes ({selfclaim.next_total_passes})"
+            f"{self.render_wakeup_status()}"
         )
 
-        self.unit.status = ActiveStatus(f"{updated} :: {appstatus}{unitstatus}")
+        return ActiveStatus(f"{updated} :: {appstatus}{unitstatus}")
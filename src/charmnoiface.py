@@ -10,11 +10,41 @@
 import logging
 import time
 
-from hpctops.misc import log_enter_exit
-
 from ops.model import ActiveStatus, WaitingStatus
 
-from charmbase import BaseHotPotatoCharm
+from charmbase import CHECKPOINT_KEY, EPOCH_PARAMS, BaseHotPotatoCharm
+from protocol import (
+    NO_APP,
+    advance,
+    apply_checkpoint,
+    claim,
+    decode_app,
+    decode_claim,
+    encode_app,
+    encode_claim,
+    get_setting,
+    is_claimed,
+    latest_claim,
+    new_epoch,
+    peer_accepts,
+    peer_handoff,
+    peer_holds,
+    relay_count,
+    transition,
+)
+from shards import (
+    apply_handoffs,
+    decode_handoffs,
+    decode_shards,
+    encode_handoffs,
+    encode_shards,
+    finished,
+    fresh_handoffs,
+    new_shards,
+    reassign_shards,
+    take_shards,
+)
+from tracing import traced
 
 
 logger = logging.getLogger(__name__)
@@ -24,162 +54,759 @@ class HotPotatoCharm(BaseHotPotatoCharm):
 
     """Hot potato charm without interfaces (standard way)."""
 
+    IMPLEMENTATION = "noiface"
+
     def __init__(self, *args):
         super().__init__(*args)
 
         self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(self.on.update_status, self._on_update_status)
 
         self.framework.observe(
             self.on.hot_potato_relation_changed, self._on_hot_potato_relation_changed
         )
 
+        self.framework.observe(self.on.benchmark_action, self._on_benchmark_action)
         self.framework.observe(self.on.configure_action, self._on_configure_action)
         self.framework.observe(self.on.run_action, self._on_run_action)
 
-    @log_enter_exit()
+    @traced()
     def _on_leader_elected(self, event):
         try:
             relation = self.model.get_relation("hot-potato")
             if relation:
                 appdata = relation.data[self.app]
-                if not bool(appdata.get("initialized", False)):
-                    # initialize
-                    appdata.update(
+                if not get_setting(appdata, "initialized"):
+                    # initialize (settings left unset are their defaults)
+                    self.update_data(
+                        appdata,
                         {
-                            "initialized": "x",
-                            "delay": str(1.0),
-                            "max_passes": str(10),
-                            "owner": "-",
-                            "run": "",
-                            "total_passes": str(0),
-                        }
+                            "initialized": str(True),
+                            "state": encode_app(new_epoch(NO_APP)),
+                        },
                     )
+                    self.set_hot(self.app, "*")
+                else:
+                    self.recover(relation, appdata)
         finally:
             self.service_set_updated("leader-elected")
             self.service_update_status()
 
+    @traced()
+    def _on_update_status(self, event):
+        """'update-status' handler.
+
+        Also the wakeup for a paced pass (see `schedule_wakeup`).
+        """
+
+        try:
+            relation = self.model.get_relation("hot-potato")
+            if relation:
+                appdata = relation.data[self.app]
+                if get_setting(appdata, "mode") == "side-channel":
+                    self.checkpoint_side_channel(relation, appdata)
+                elif decode_app(appdata.get("state")).run:
+                    if get_setting(appdata, "mode") == "peer":
+                        self.peer_pass(relation, appdata)
+                    self.take_turn(relation, appdata)
+                    if self.unit.is_leader():
+                        self.reelect()
+        finally:
+            self.service_set_updated("update-status")
+            self.service_update_status()
+
     #
     # relations
     #
-    @log_enter_exit()
+    @traced()
     def _on_hot_potato_relation_changed(self, event):
-        def update_app_from_unit(appdata, unitdata, unit):
-            """Update app from unit (which has changed)."""
-
-            max_passes = int(appdata.get("max_passes", 0))
-            total_passes = int(appdata.get("total_passes", 0))
-            next_total_passes = int(unitdata.get("next_total_passes", 0))
-
-            if next_total_passes > total_passes:
-                total_passes = next_total_passes
-                appdata.update(
-                    {
-                        "total_passes": str(next_total_passes),
-                        "owner": unitdata.get("next_owner"),
-                    }
-                )
-
-                if total_passes >= max_passes:
-                    # stop passing
-                    appdata.update({"run": ""})
-
-        def update_unit_from_app(unit, unitdata, appdata):
-            """Update unit from app iff unit is now owner."""
-
-            if appdata.get("owner") == unit.name:
-                unitdata.update(
-                    {
-                        "next_total_passes": str(int(appdata.get("total_passes", 0)) + 1),
-                        "next_owner": self.determine_next_owner(),
-                        "npasses": str(int(unitdata.get("npasses", 0)) + 1),
-                    }
-                )
+        if not self.is_hot(event):
+            # not for this unit
+            return
 
         try:
             relation = self.model.get_relation("hot-potato")
             appdata = relation.data[self.app]
+            if event.unit is None:
+                self.update_unit_from_app_change(relation, appdata)
+                return
 
-            if not bool(appdata.get("run")):
+            if get_setting(appdata, "mode") == "side-channel":
+                # daemons pass; only configs and checkpoints go by relation
+                if self.unit.is_leader():
+                    self.apply_side_channel_checkpoint(appdata, relation.data[event.unit])
                 return
 
-            if self.unit.is_leader() and event.unit != None:
-                # update app from unit
-                unitdata = relation.data[event.unit]
-                update_app_from_unit(appdata, unitdata, event.unit)
-                delay = float(appdata.get("delay"))
-                time.sleep(delay)
-            else:
-                # update unit from app (if for self)
-                if event.unit != None:
-                    # not an app update
-                    return
+            if not decode_app(appdata.get("state")).run:
+                return
 
-                selfdata = relation.data[self.unit]
-                update_unit_from_app(self.unit, selfdata, appdata)
-
-                # SPECIAL: leader does not get self unit change evnet;
-                # ensure leader can respond
-                if self.unit.is_leader():
-                    update_app_from_unit(appdata, selfdata, self.unit)
+            if get_setting(appdata, "mode") == "peer":
+                # leaderless: units pick up from each other's buckets
+                self.peer_receive(relation, appdata, relation.data[event.unit])
+            elif self.unit.is_leader():
+                # update app from (all) units
+                self.reconcile(relation, appdata)
 
         finally:
             self.service_set_updated("hot-potator-relation-changed")
             self.service_update_status()
 
+    def update_unit_from_app_change(self, relation, appdata):
+        """Act on app change: take turn (if for self)."""
+
+        app = decode_app(appdata.get("state"))
+        if get_setting(appdata, "mode") == "side-channel":
+            if self.is_new_app(app):
+                self.service_sync()
+            return
+
+        if not app.run:
+            # relays of the last burst (which ended the game)
+            self.credit_relays(relation, appdata)
+            return
+
+        if get_setting(appdata, "mode") == "peer":
+            self.take_turn(relation, appdata)
+            return
+
+        if not self.is_new_app(app):
+            # stale or duplicate
+            return
+
+        self.credit_relays(relation, appdata)
+        self.take_turn(relation, appdata)
+
+    def act_on_own_app_change(self):
+        relation = self.model.get_relation("hot-potato")
+        if relation:
+            self.update_unit_from_app_change(relation, relation.data[self.app])
+
+    def recover(self, relation, appdata):
+        """Resume game inherited by a new leader.
+
+        Passes claimed (or, with multiple potatoes, handed off) but not
+        yet applied by the previous leader are picked up from all unit
+        buckets, in this one hook. If there are none, the owners are
+        woken again in case the previous leader's last update was not
+        acted on.
+        """
+
+        app = decode_app(appdata.get("state"))
+        if not app.run:
+            return
+
+        units = {unit.name: unit for unit in relation.units}
+        units[self.unit.name] = self.unit
+
+        if get_setting(appdata, "potatoes") > 1:
+            shards = appdata.get("shards")
+            self.reconcile(relation, appdata)
+            if appdata.get("shards") == shards:
+                self.update_data(appdata, {"state": encode_app(transition(app))})
+                self.set_hot(
+                    self.app,
+                    [
+                        shard.owner
+                        for shard in decode_shards(shards)
+                        if shard.passes < shard.max_passes
+                    ],
+                )
+            return
+
+        claims = {
+            name: decode_claim(relation.data[unit].get("claim")) for name, unit in units.items()
+        }
+        name = latest_claim(app, claims)
+        if get_setting(appdata, "mode") == "peer":
+            if name is not None:
+                self.peer_checkpoint(appdata, claims[name])
+        elif name is not None:
+            self.update_app_from_unit(appdata, relation.data[units[name]], units[name])
+        else:
+            self.update_data(appdata, {"state": encode_app(transition(app))})
+            self.set_hot(self.app, [app.owner])
+
+    def reelect(self, gone=None):
+        """Re-elect owner(s) lost: departed (unit `gone`) or stalled
+        (leader).
+
+        With a single potato, a new epoch is started with the new owner,
+        so that any claim the lost owner may yet make is stale: no pass
+        is counted twice.
+        """
+
+        relation = self.model.get_relation("hot-potato")
+        if not relation:
+            return
+
+        appdata = relation.data[self.app]
+        app = decode_app(appdata.get("state"))
+        if not app.run:
+            return
+
+        strategy = get_setting(appdata, "strategy")
+        if get_setting(appdata, "potatoes") > 1:
+            shards = decode_shards(appdata.get("shards"))
+            if reassign_shards(
+                shards,
+                lambda shard: self.is_lost(shard.owner, shard.deadline, gone),
+                lambda owner: self.elect_other_owner(strategy, owner),
+                time.time(),
+            ):
+                self.update_data(
+                    appdata,
+                    {"shards": encode_shards(shards), "state": encode_app(transition(app))},
+                )
+                self.set_hot(
+                    self.app,
+                    [shard.owner for shard in shards if shard.passes < shard.max_passes],
+                )
+            return
+
+        if get_setting(appdata, "mode") == "peer":
+            # potato is held by the next owner of the latest claim
+            units = list(relation.units) + [self.unit]
+            claims = {unit.name: decode_claim(relation.data[unit].get("claim")) for unit in units}
+            name = latest_claim(app, claims)
+            if name is not None:
+                app = app._replace(
+                    total_passes=claims[name].next_total_passes, owner=claims[name].next_owner
+                )
+            since = max(self._stored.progress_at, app.deadline)
+        else:
+            since = app.deadline
+
+        if self.is_lost(app.owner, since, gone):
+            owner = self.elect_other_owner(strategy, app.owner)
+            app = new_epoch(app, owner=owner, relays="", deadline=time.time())
+            self.update_data(appdata, {"state": encode_app(app)})
+            self.set_hot(self.app, [owner])
+
+    def take_turn(self, relation, appdata):
+        """Pass potato iff unit is owner and pass is due.
+
+        Passes are paced by the app deadline (set by the leader) rather
+        than by sleeping in the leader's hook: if it is not yet due, a
+        wakeup is scheduled instead.
+        """
+
+        if get_setting(appdata, "potatoes") > 1:
+            return self.take_turns(relation, appdata)
+
+        app = decode_app(appdata.get("state"))
+        if app.owner != self.unit.name:
+            return
+
+        selfdata = relation.data[self.unit]
+        if is_claimed(app, decode_claim(selfdata.get("claim"))):
+            # already passed; waiting on leader
+            return
+
+        if get_setting(appdata, "mode") == "peer":
+            # start of leaderless game: potato taken from app
+            if peer_accepts(
+                self._stored.peer_epoch, self._stored.seen_passes, claim(app, [app.owner])
+            ):
+                self._stored.peer_epoch = app.epoch
+                self._stored.seen_passes = app.total_passes
+                self.peer_hold(app.total_passes, app.deadline)
+                self.peer_pass(relation, appdata)
+            return
+
+        self.record_received()
+        if get_setting(appdata, "pacing") != "none":
+            remaining = app.deadline - time.time()
+            if remaining > 0:
+                self.schedule_wakeup(remaining)
+                return
+
+        self.update_unit_from_app(self.unit, selfdata, appdata)
+
+        # SPECIAL: leader does not get self unit change evnet;
+        # ensure leader can respond
+        if self.unit.is_leader():
+            self.update_app_from_unit(appdata, selfdata, self.unit)
+
+    def take_turns(self, relation, appdata):
+        """Pass all potatoes unit owns and are due (multiple potatoes)."""
+
+        shards = decode_shards(appdata.get("shards"))
+        selfdata = relation.data[self.unit]
+        handoffs, npasses, wait = take_shards(
+            shards,
+            decode_handoffs(selfdata.get("next_shards")),
+            self.unit.name,
+            time.time(),
+            lambda: self.determine_next_owner(get_setting(appdata, "strategy")),
+        )
+
+        if wait is not None:
+            self.schedule_wakeup(wait)
+
+        if npasses:
+            self.update_data(
+                selfdata,
+                {
+                    "next_shards": encode_handoffs(handoffs),
+                    "npasses": str(int(selfdata.get("npasses", 0)) + npasses),
+                },
+            )
+            self.set_hot(self.unit, [])
+
+            # SPECIAL: leader does not get self unit change event
+            if self.unit.is_leader():
+                self.update_app_from_unit(appdata, selfdata, self.unit)
+
+    def peer_hold(self, total_passes, deadline):
+        """Hold potato (peer mode) until `deadline`."""
+
+        self._stored.held_passes = total_passes
+        self._stored.held_deadline = deadline
+        self.record_received()
+
+    def peer_receive(self, relation, appdata, unitdata):
+        """Pick up potato (peer mode) from a changed unit bucket.
+
+        Claims only ever increase, so anything not newer than what has
+        already been seen is stale or a duplicate.
+        """
+
+        unitclaim = decode_claim(unitdata.get("claim"))
+        if not peer_accepts(self._stored.peer_epoch, self._stored.seen_passes, unitclaim):
+            return
+        self._stored.peer_epoch = unitclaim.epoch
+        self._stored.seen_passes = unitclaim.next_total_passes
+
+        if self.unit.is_leader():
+            self.peer_checkpoint(appdata, unitclaim)
+
+        if peer_holds(self.unit.name, get_setting(appdata, "max_passes"), unitclaim):
+            self.peer_hold(unitclaim.next_total_passes, time.time() + self.get_delay(appdata))
+            self.peer_pass(relation, appdata)
+
+    def peer_pass(self, relation, appdata):
+        """Pass held potato (peer mode) directly to the next owner."""
+
+        max_passes = get_setting(appdata, "max_passes")
+        while self._stored.held_passes >= 0:
+            remaining = self._stored.held_deadline - time.time()
+            if remaining > 0:
+                self.schedule_wakeup(remaining)
+                return
+
+            selfclaim, hot = peer_handoff(
+                self._stored.peer_epoch,
+                self._stored.held_passes,
+                max_passes,
+                self.determine_next_owner(get_setting(appdata, "strategy")),
+            )
+
+            selfdata = relation.data[self.unit]
+            self.update_data(
+                selfdata,
+                {
+                    "claim": encode_claim(selfclaim),
+                    "npasses": str(int(selfdata.get("npasses", 0)) + 1),
+                },
+            )
+            self.set_hot(self.unit, hot)
+            self._stored.held_passes = -1
+            self.record_handoff()
+            self._stored.seen_passes = selfclaim.next_total_passes
+
+            # SPECIAL: no self unit change event
+            if self.unit.is_leader():
+                self.peer_checkpoint(appdata, selfclaim)
+            if peer_holds(self.unit.name, max_passes, selfclaim):
+                self.peer_hold(selfclaim.next_total_passes, time.time() + self.get_delay(appdata))
+
+    def peer_checkpoint(self, appdata, unitclaim):
+        """Record end of leaderless game in app (leader only)."""
+
+        app = decode_app(appdata.get("state"))
+        max_passes = get_setting(appdata, "max_passes")
+        if unitclaim.epoch == app.epoch and unitclaim.next_total_passes >= max_passes:
+            app = transition(
+                app,
+                total_passes=unitclaim.next_total_passes,
+                owner=unitclaim.next_owner,
+                run=False,
+            )
+            self.update_data(appdata, {"state": encode_app(app)})
+            self.set_hot(self.app, "*")
+        self.record_passes(unitclaim.next_total_passes)
+
+    def service_sync(self, event=None, force=False):
+        """Send game config to side-channel daemon."""
+
+        appdata = self.model.get_relation("hot-potato").data[self.app]
+        self.sync_side_channel(
+            decode_app(appdata.get("state")),
+            get_setting(appdata, "max_passes"),
+            self.get_delay(appdata),
+            get_setting(appdata, "strategy"),
+        )
+
+    def checkpoint_side_channel(self, relation, appdata):
+        """Copy new side-channel daemon checkpoint to unit bucket."""
+
+        result = self.read_side_channel_checkpoint()
+        if result is None:
+            return
+
+        checkpoint, npasses = result
+        selfdata = relation.data[self.unit]
+        self.update_data(selfdata, {"npasses": str(int(selfdata.get("npasses", 0)) + npasses)})
+        self.write_side_channel_checkpoint(checkpoint)
+        self.set_hot(self.unit, [])
+
+        # SPECIAL: leader will not get self unit change event
+        if self.unit.is_leader():
+            self.apply_side_channel_checkpoint(appdata, selfdata)
+
+    def apply_side_channel_checkpoint(self, appdata, unitdata):
+        """Apply checkpoint in unit bucket `unitdata` to app (leader)."""
+
+        app, hot = apply_checkpoint(
+            decode_app(appdata.get("state")),
+            decode_claim(unitdata.get(CHECKPOINT_KEY)),
+            get_setting(appdata, "max_passes"),
+        )
+        if hot is None:
+            # stale
+            return
+
+        self.update_data(appdata, {"state": encode_app(app)})
+        self.set_hot(self.app, hot)
+        self.record_passes(app.total_passes)
+
+    def start_game(self, npasses):
+        appdata = self.model.get_relation("hot-potato").data[self.app]
+        app = decode_app(appdata.get("state"))
+        roster = list(self.get_roster())
+        owner = app.owner if app.owner in roster else self.unit.name
+
+        npotatoes = get_setting(appdata, "potatoes")
+        if npotatoes > 1:
+            # potatoes are dealt afresh
+            base = 0
+            shards = new_shards(npotatoes, roster, owner, npasses)
+            self.update_data(appdata, {"shards": encode_shards(shards)})
+        else:
+            base = app.total_passes
+        app = new_epoch(
+            app, total_passes=base, owner=owner, relays="", deadline=time.time(), run=True
+        )
+        self.update_data(appdata, {"max_passes": str(base + npasses), "state": encode_app(app)})
+        self.set_hot(self.app, "*")
+        return base
+
+    def credit_relays(self, relation, appdata):
+        """Credit unit with passes it relayed (in the epoch) that are not
+        yet credited."""
+
+        app = decode_app(appdata.get("state"))
+        if app.epoch < self._stored.credited_epoch:
+            # stale
+            return
+        if app.epoch > self._stored.credited_epoch:
+            # relays are tallied afresh every epoch
+            self._stored.credited_epoch = app.epoch
+            self._stored.credited_relays = 0
+
+        count = relay_count(app.relays, self.unit.name) - self._stored.credited_relays
+        if count > 0:
+            selfdata = relation.data[self.unit]
+            self.update_data(selfdata, {"npasses": str(int(selfdata.get("npasses", 0)) + count)})
+            self.set_hot(self.unit, [])
+            self._stored.credited_relays += count
+
+    def update_app_from_unit(self, appdata, unitdata, unit):
+        """Update app from unit (which has changed).
+
+        In burst mode, the unit names a chain of next owners; all hops
+        (up to "max_passes") are applied at once.
+
+        With multiple potatoes, all potatoes handed off by the unit are
+        reconciled at once.
+        """
+
+        if get_setting(appdata, "potatoes") > 1:
+            self.apply_unit_handoffs(appdata, decode_handoffs(unitdata.get("next_shards")))
+            return
+
+        app = decode_app(appdata.get("state"))
+        unitclaim = decode_claim(unitdata.get("claim"))
+        if not is_claimed(app, unitclaim):
+            # stale (rate control is not stepped)
+            return
+
+        app, hot = advance(
+            app,
+            unitclaim,
+            get_setting(appdata, "max_passes"),
+            time.time() + self.step_delay(appdata),
+        )
+
+        self.update_data(appdata, {"state": encode_app(app)})
+        self.set_hot(self.app, hot)
+        self.record_passes(app.total_passes)
+
+        # leader is not woken by its own app update
+        self.credit_relays(self.model.get_relation("hot-potato"), appdata)
+
+    def apply_unit_handoffs(self, appdata, handoffs):
+        """Apply unit `handoffs` (of any number of units) to app shards
+        (multiple potatoes), in one update."""
+
+        shards = decode_shards(appdata.get("shards"))
+        handoffs = fresh_handoffs(shards, handoffs)
+        if not handoffs:
+            # stale (rate control is not stepped)
+            return
+        apply_handoffs(shards, handoffs, time.time() + self.step_delay(appdata))
+
+        total_passes = sum(shard.passes for shard in shards)
+        app = transition(
+            decode_app(appdata.get("state")),
+            total_passes=total_passes,
+            run=not finished(shards),
+        )
+        self.update_data(appdata, {"shards": encode_shards(shards), "state": encode_app(app)})
+        self.record_passes(total_passes)
+        if finished(shards):
+            # stop passing
+            self.set_hot(self.app, "*")
+        else:
+            self.set_hot(
+                self.app,
+                [shard.owner for shard in shards if shard.passes < shard.max_passes],
+            )
+
+    def reconcile(self, relation, appdata):
+        """Apply all pending unit changes to app (leader).
+
+        Only the owner (with multiple potatoes, the owners) can have a
+        pending claim (handoffs), so only the owners' buckets are read,
+        whichever unit changed: a backlog of unit changes is applied in
+        one hook, and the hooks for the rest are no-ops.
+        """
+
+        if get_setting(appdata, "potatoes") > 1:
+            owners = {
+                shard.owner
+                for shard in decode_shards(appdata.get("shards"))
+                if shard.passes < shard.max_passes
+            }
+            handoffs = []
+            for owner in sorted(owners):
+                unit = self.get_unit(owner)
+                if unit is not None:
+                    handoffs.extend(decode_handoffs(relation.data[unit].get("next_shards")))
+            self.apply_unit_handoffs(appdata, handoffs)
+            return
+
+        unit = self.get_unit(decode_app(appdata.get("state")).owner)
+        if unit is not None:
+            self.update_app_from_unit(appdata, relation.data[unit], unit)
+
+    def update_unit_from_app(self, unit, unitdata, appdata):
+        """Update unit from app iff unit is now owner.
+
+        Elects the next "burst" owners as a chain.
+        """
+
+        app = decode_app(appdata.get("state"))
+        if app.owner == unit.name:
+            burst = max(get_setting(appdata, "burst"), 1)
+            strategy = get_setting(appdata, "strategy")
+            chain = [self.determine_next_owner(strategy) for _ in range(burst)]
+            self.update_data(
+                unitdata,
+                {
+                    "claim": encode_claim(claim(app, chain)),
+                    "npasses": str(int(unitdata.get("npasses", 0)) + 1),
+                },
+            )
+            self.set_hot(unit, [])
+            self.record_handoff()
+
+    def update_data(self, data, values):
+        """Update bucket `data` with `values`, writing only those keys
+        whose values changed."""
+
+        for key, value in values.items():
+            if data.get(key) != value:
+                data[key] = value
+
+    def get_delay(self, appdata):
+        """Return delay before the next pass (see `get_pass_delay`)."""
+
+        return self.get_pass_delay(
+            get_setting(appdata, "pacing"),
+            get_setting(appdata, "delay"),
+            get_setting(appdata, "target_rate"),
+        )
+
+    def step_delay(self, appdata):
+        """Return delay before the next pass, stepping rate control (see
+        `adjust_pass_delay`)."""
+
+        return self.adjust_pass_delay(
+            get_setting(appdata, "pacing"),
+            get_setting(appdata, "delay"),
+            get_setting(appdata, "target_rate"),
+        )
+
+    def get_npasses(self):
+        relation = self.model.get_relation("hot-potato")
+        return {
+            unit.name: int(relation.data[unit].get("npasses", 0))
+            for unit in [self.unit] + list(relation.units)
+        }
+
     #
     # actions
     #
-    @log_enter_exit()
+    @traced()
+    def _on_benchmark_action(self, event):
+        try:
+            if not self.unit.is_leader():
+                event.fail("leader only")
+                return
+
+            if "passes" not in event.params:
+                event.set_results(self.get_benchmark_results())
+                return
+
+            npasses = event.params["passes"]
+            self.start_benchmark(npasses, self.start_game(npasses))
+            event.set_results(
+                {"implementation": self.IMPLEMENTATION, "passes": npasses, "started": True}
+            )
+        finally:
+            self.service_set_updated("benchmark-action")
+            self.service_update_status()
+
+    @traced()
     def _on_configure_action(self, event):
         try:
             if self.unit.is_leader():
-                appdata = self.model.get_relation("hot-potato").data[self.app]
+                relation = self.model.get_relation("hot-potato")
+                appdata = relation.data[self.app]
+                app = decode_app(appdata.get("state"))
+
+                error = self.get_settings_error(
+                    event.params.get("mode", get_setting(appdata, "mode")),
+                    event.params.get("burst", get_setting(appdata, "burst")),
+                    event.params.get("potatoes", get_setting(appdata, "potatoes")),
+                )
+                if error:
+                    event.fail(error)
+                    return
 
+                new_game = bool(EPOCH_PARAMS & set(event.params))
+                if new_game and app.run and get_setting(appdata, "mode") == "leader":
+                    # count the pending claim (if any) before it goes stale
+                    self.reconcile(relation, appdata)
+                    app = decode_app(appdata.get("state"))
+
+                if "burst" in event.params:
+                    self.update_data(appdata, {"burst": str(event.params["burst"])})
                 if "delay" in event.params:
-                    appdata.update({"delay": str(event.params["delay"])})
+                    self.update_data(appdata, {"delay": str(event.params["delay"])})
                 if "owner" in event.params:
-                    appdata.update({"owner": event.params["owner"]})
+                    app = app._replace(owner=event.params["owner"])
                 if "max-passes" in event.params:
-                    appdata.update({"max_passes": str(event.params["max-passes"])})
+                    self.update_data(appdata, {"max_passes": str(event.params["max-passes"])})
+                if "mode" in event.params:
+                    self.update_data(appdata, {"mode": event.params["mode"]})
+                if "pacing" in event.params:
+                    self.update_data(appdata, {"pacing": event.params["pacing"]})
+                if "potatoes" in event.params:
+                    self.update_data(appdata, {"potatoes": str(event.params["potatoes"])})
+                if "run" in event.params:
+                    app = app._replace(run=event.params["run"])
+                if "strategy" in event.params:
+                    self.update_data(appdata, {"strategy": event.params["strategy"]})
+                if "target-rate" in event.params:
+                    self.update_data(appdata, {"target_rate": str(event.params["target-rate"])})
+
+                if {"pacing", "target-rate"} & set(event.params):
+                    # restart rate control
+                    self._stored.paced_delay = -1.0
+
+                if new_game:
+                    # claims made under the old configuration are stale
+                    app = new_epoch(app)
+                else:
+                    app = transition(app)
+                self.update_data(appdata, {"state": encode_app(app)})
+
+                npotatoes = get_setting(appdata, "potatoes")
+                if npotatoes > 1 and {"max-passes", "owner", "potatoes"} & set(event.params):
+                    # (re)deal potatoes
+                    shards = new_shards(
+                        npotatoes,
+                        list(self.get_roster()),
+                        app.owner,
+                        get_setting(appdata, "max_passes"),
+                    )
+                    self.update_data(appdata, {"shards": encode_shards(shards)})
+
+                self.set_hot(self.app, "*")
         finally:
             self.service_set_updated("configure-action")
             self.service_update_status()
 
-    @log_enter_exit()
+    @traced()
     def _on_run_action(self, event):
         try:
             if self.unit.is_leader():
                 appdata = self.model.get_relation("hot-potato").data[self.app]
-                appdata.update({"run": event.params["run"] and "x" or ""})
+                app = decode_app(appdata.get("state"))
+                if event.params["run"]:
+                    # first pass is due now
+                    app = app._replace(deadline=time.time())
+                app = transition(app, run=event.params["run"])
+                self.update_data(appdata, {"state": encode_app(app)})
+                self.set_hot(self.app, "*")
         finally:
             self.service_set_updated("run-action")
             self.service_update_status()
 
-    def service_update_status(self):
+    @traced()
+    def render_status(self):
         relation = self.model.get_relation("hot-potato")
         if not relation:
-            self.unit.status = WaitingStatus()
-            return
+            return WaitingStatus()
 
         appdata = relation.data[self.app]
         if not appdata:
-            self.unit.status = WaitingStatus()
-            return
+            return WaitingStatus()
 
-        isowner = appdata.get("owner") == self.unit.name
+        app = decode_app(appdata.get("state"))
+        isowner = app.owner == self.unit.name
         selfdata = relation.data[self.unit]
+        selfclaim = decode_claim(selfdata.get("claim"))
         updated = tuple(self.service_get_updated())
 
         if self.unit.is_leader():
             # update app info
             appstatus = (
                 f"""APP"""
-                f""" delay ({appdata.get("delay")})"""
-                f""" max_passes ({appdata.get("max_passes")})"""
+                f""" burst ({get_setting(appdata, "burst")})"""
+                f""" delay ({get_setting(appdata, "delay")})"""
+                f""" epoch ({app.epoch})"""
+                f""" max_passes ({get_setting(appdata, "max_passes")})"""
+                f""" mode ({get_setting(appdata, "mode")})"""
+                f""" pacing ({get_setting(appdata, "pacing")})"""
                 f""" nunits ({len(relation.units)+1})"""
-                f""" owner ({appdata.get("owner")})"""
-                f""" run ({bool(appdata.get("run"))})"""
-                f""" total_passes ({appdata.get("total_passes")})"""
+                f""" owner ({app.owner})"""
+                f""" potatoes ({get_setting(appdata, "potatoes")})"""
+                f""" run ({app.run})"""
+                f""" strategy ({get_setting(appdata, "strategy")})"""
+                f""" total_passes ({app.total_passes})"""
                 f""" :: """
             )
         else:
@@ -190,8 +817,9 @@ class HotPotatoCharm(BaseHotPotatoCharm):
             f""" id ({self.unit.name})"""
             f""" isowner? ({isowner})"""
             f""" npasses ({selfdata.get("npasses")})"""
-            f""" next_owner ({selfdata.get("next_owner")})"""
-            f""" next_total_passes ({selfdata.get("next_total_passes")})"""
+            f""" next_owner ({selfclaim.next_owner})"""
+            f""" next_total_passes ({selfclaim.next_total_passes})"""
+            f"""{self.render_wakeup_status()}"""
         )
 
-        self.unit.status = ActiveStatus(f"{updated} :: {appstatus}{unitstatus}")
+        return ActiveStatus(f"{updated} :: {appstatus}{unitstatus}")
@@ -0,0 +1,92 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Federated (multi-application) games.
+
+Several hot potato applications, related through their `federation`
+(provides) and `federate` (requires) endpoints, play one game. The
+potato is passed between applications by their leaders (gateways), in
+the application bucket of the relation between two of them ("pass"):
+
+    1:<epoch>:<total_passes>:<max_passes>:<turn>:<app>
+
+is the potato handed to application `app` ("" once the game is over)
+at (global) `total_passes`. The application plays a local game (a
+turn) of up to `turn` passes, with its own leader, peer relation and
+configuration, and its gateway then hands the potato on. So the load
+(hooks, relation data) of each turn is on one application only.
+
+Each gateway also publishes the passes its application has made in the
+game ("passes": `<epoch>:<passes>`); the global count is their sum
+(see `aggregate`).
+"""
+
+import collections
+
+from protocol import RECORD_VERSION
+
+
+FederatedPass = collections.namedtuple(
+    "FederatedPass", ["epoch", "total_passes", "max_passes", "turn", "app"]
+)
+
+NO_PASS = FederatedPass(0, 0, 0, 0, "")
+
+
+def decode_pass(value):
+    """Decode "pass" record (NO_PASS if unset or unknown version)."""
+
+    fields = value.split(":") if value else []
+    if len(fields) != 6 or fields[0] != RECORD_VERSION:
+        return NO_PASS
+    _, epoch, total_passes, max_passes, turn, app = fields
+    return FederatedPass(int(epoch), int(total_passes), int(max_passes), int(turn), app)
+
+
+def encode_pass(fpass):
+    """Encode FederatedPass as "pass" record."""
+
+    return (
+        f"{RECORD_VERSION}:{fpass.epoch}:{fpass.total_passes}:{fpass.max_passes}"
+        f":{fpass.turn}:{fpass.app}"
+    )
+
+
+def is_newer_pass(fpass, epoch, total_passes):
+    """Return True if `fpass` is newer than (`epoch`, `total_passes`)."""
+
+    return (fpass.epoch, fpass.total_passes) > (epoch, total_passes)
+
+
+def turn_passes(fpass):
+    """Return number of passes of the turn of `fpass`."""
+
+    return max(min(fpass.turn, fpass.max_passes - fpass.total_passes), 0)
+
+
+def hand_on(fpass, npasses, app):
+    """Return FederatedPass handing potato of `fpass`, after a turn of
+    `npasses`, to application `app` (or ending the game)."""
+
+    total_passes = fpass.total_passes + npasses
+    return fpass._replace(
+        total_passes=total_passes, app=app if total_passes < fpass.max_passes else ""
+    )
+
+
+def encode_passes(epoch, passes):
+    """Encode "passes" record: passes of an application in game `epoch`."""
+
+    return f"{epoch}:{passes}"
+
+
+def aggregate(epoch, passes, published):
+    """Return global passes of game `epoch`: `passes` (own) and those of
+    the `published` "passes" records (of other applications)."""
+
+    total = passes
+    for value in published:
+        other_epoch, _, other_passes = (value or "").partition(":")
+        if other_epoch == str(epoch):
+            total += int(other_passes)
+    return total
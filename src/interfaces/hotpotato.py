@@ -14,7 +14,92 @@ from hpctinterfaces.relation import (
     RelationSuperInterface,
     UnitBucketInterface,
 )
-from hpctinterfaces.value import Boolean, NonNegativeFloat, NonNegativeInteger, String
+from hpctinterfaces.value import (
+    Boolean,
+    NonNegativeFloat,
+    NonNegativeInteger,
+    String,
+    Value,
+)
+
+from protocol import APP_DEFAULTS
+
+
+class BucketSnapshot:
+    """Snapshot of a bucket interface.
+
+    Fields are decoded on first access (only) and assignments are kept
+    until `commit`, which writes only the fields whose values changed.
+
+    Fields are accessors of a subclass compiled, once per process, from
+    the bucket interface class (see `get_snapshot_class`).
+    """
+
+    __slots__ = ("_iface", "_original", "_values")
+
+    def __init__(self, iface):
+        self._iface = iface
+        self._original = {}
+        self._values = {}
+
+    def __bool__(self):
+        return bool(self._iface)
+
+    def commit(self):
+        """Write changed fields to bucket. Return number written."""
+
+        changed = [
+            (name, value)
+            for name, value in self._values.items()
+            if value != self._original[name]
+        ]
+        for name, value in changed:
+            setattr(self._iface, name, value)
+            self._original[name] = value
+        return len(changed)
+
+
+def _compile_field(name):
+    """Return accessor (property) of snapshot field `name`."""
+
+    def get(self):
+        values = self._values
+        try:
+            return values[name]
+        except KeyError:
+            value = getattr(self._iface, name)
+            self._original[name] = value
+            values[name] = value
+            return value
+
+    def set(self, value):
+        if name not in self._values:
+            # decode original, to detect no-op assignments
+            get(self)
+        self._values[name] = value
+
+    return property(get, set)
+
+
+_snapshot_classes = {}
+
+
+def get_snapshot_class(iface_cls):
+    """Return BucketSnapshot subclass for bucket interface class
+    `iface_cls`, with an accessor per field (compiled on first use)."""
+
+    cls = _snapshot_classes.get(iface_cls)
+    if cls is None:
+        fields = {
+            name: _compile_field(name)
+            for klass in reversed(iface_cls.__mro__)
+            for name, attr in vars(klass).items()
+            if isinstance(attr, Value)
+        }
+        fields["__slots__"] = ()
+        cls = type(f"{iface_cls.__name__}Snapshot", (BucketSnapshot,), fields)
+        _snapshot_classes[iface_cls] = cls
+    return cls
 
 
 class HotPotatoRelationSuperInterface(RelationSuperInterface):
@@ -22,24 +107,69 @@ class HotPotatoRelationSuperInterface(RelationSuperInterface):
 
     class AppInterface(AppBucketInterface):
 
-        initialized = Boolean(False)
-        delay = NonNegativeFloat(1.0)
-        max_passes = NonNegativeInteger(10)
-        owner = String("")
-        run = Boolean(False)
-        total_passes = NonNegativeInteger(0)
+        # (defaults shared with `noiface`)
+        initialized = Boolean(APP_DEFAULTS["initialized"])
+        burst = NonNegativeInteger(APP_DEFAULTS["burst"])
+        delay = NonNegativeFloat(APP_DEFAULTS["delay"])
+        max_passes = NonNegativeInteger(APP_DEFAULTS["max_passes"])
+        mode = String(APP_DEFAULTS["mode"])
+        pacing = String(APP_DEFAULTS["pacing"])
+        potatoes = NonNegativeInteger(APP_DEFAULTS["potatoes"])
+        shards = String(APP_DEFAULTS["shards"])
+        state = String(APP_DEFAULTS["state"])
+        strategy = String(APP_DEFAULTS["strategy"])
+        target_rate = NonNegativeFloat(APP_DEFAULTS["target_rate"])
 
     class UnitInterface(UnitBucketInterface):
 
-        next_owner = String("")
-        next_total_passes = NonNegativeInteger(0)
+        claim = String("")
+        next_shards = String("")
         npasses = NonNegativeInteger(0)
 
+    INTERFACE_CLASSES = {
+        ("peer", "app"): AppInterface,
+        ("peer", "unit"): UnitInterface,
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.interface_classes[("peer", "app")] = self.AppInterface
-        self.interface_classes[("peer", "unit")] = self.UnitInterface
+        self.interface_classes.update(self.INTERFACE_CLASSES)
+
+        self._buckets = {}
+        self._snapshots = {}
+
+    def select(self, app_or_unit):
+        """Return bucket interface for `app_or_unit`; the same one until
+        `commit`."""
+
+        bucket = self._buckets.get(app_or_unit.name)
+        if bucket is None:
+            bucket = self._buckets[app_or_unit.name] = super().select(app_or_unit)
+        return bucket
+
+    def snapshot(self, app_or_unit):
+        """Return snapshot (see `BucketSnapshot`) of bucket for
+        `app_or_unit`; the same one until `commit`."""
+
+        snapshot = self._snapshots.get(app_or_unit.name)
+        if snapshot is None:
+            bucket = self.select(app_or_unit)
+            snapshot = get_snapshot_class(type(bucket))(bucket)
+            self._snapshots[app_or_unit.name] = snapshot
+        return snapshot
+
+    def commit(self):
+        """Write changed fields of all snapshots and drop them (and the
+        bucket interfaces). Return number of fields written.
+
+        Called once, at the end of a dispatch.
+        """
+
+        nchanged = sum(snapshot.commit() for snapshot in self._snapshots.values())
+        self._buckets = {}
+        self._snapshots = {}
+        return nchanged
 
 
 interface_registry.register("relation-hot-potato", HotPotatoRelationSuperInterface)
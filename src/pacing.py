@@ -0,0 +1,49 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Pass pacing.
+
+After each pass, the new owner may not pass before a deadline (see
+`protocol.advance`), set by the leader from the delay for the pacing:
+
+* delay - fixed `delay`
+* rate - adaptive: the delay is adjusted, from the measured interval
+  between recent passes, so that passes are made at `target_rate` per
+  second whatever the hook latency
+* none - as fast as possible: no delay, and owners do not check the
+  deadline
+"""
+
+
+PACINGS = ("delay", "rate", "none")
+
+# recent passes measured
+WINDOW = 8
+# fraction of the interval error corrected per pass
+GAIN = 0.25
+
+
+def measure_interval(times, window=WINDOW):
+    """Return mean interval between the last `window` pass `times`
+    (oldest first), or None if there are too few to tell."""
+
+    times = times[-window:]
+    if len(times) < 2 or times[-1] <= times[0]:
+        return None
+    return (times[-1] - times[0]) / (len(times) - 1)
+
+
+def adjust_delay(delay, times, target_rate, gain=GAIN):
+    """Return `delay` adjusted toward passes at `target_rate` per second,
+    given recent pass `times` (oldest first).
+
+    The interval between passes is the delay plus the (unknown) hook
+    latency, so the delay is corrected by (a fraction of) the error in
+    the measured interval, within 0 and the target interval.
+    """
+
+    target = 1.0 / target_rate
+    interval = measure_interval(times)
+    if interval is None:
+        return min(delay, target)
+    return min(max(delay + gain * (target - interval), 0.0), target)
@@ -0,0 +1,320 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Hot potato protocol (single potato).
+
+The pass logic as pure functions of plain values, without side
+effects: the charms only map relation buckets to and from these values
+(and write what changed), and the simulator (see
+`benchmarks/bench_sim.py`) drives them directly.
+
+The pass state is a single, versioned record in the app bucket
+("state"), and a unit's claim a single record in its bucket ("claim"):
+
+    1:<epoch>:<seq>:<total_passes>:<owner>:<relays>:<deadline>:<run>
+    1:<epoch>:<next_total_passes>:<next_owners>
+
+The leader starts a new epoch when the game is (re)configured (owner,
+max passes, potatoes, mode or burst; a pending claim is applied first)
+and bumps the sequence on every transition, so a stale or duplicate record
+(or claim from an earlier epoch) is rejected after reading one key,
+and each transition is written as one key.
+
+`relays` tallies the passes relayed by each unit in the epoch so far
+(`<unit>=<count>,...`): it only grows, so a unit that misses app
+changes (coalesced, or overwritten in the same hook) is still credited
+in full on the next one it sees.
+
+Leader mode:
+
+1. the owner elects a chain of (`burst`) next owners and claims the
+   passes in its unit bucket (`claim`)
+2. the leader applies the claim to the app bucket (`advance`); the last
+   in the chain is the new owner and the others are relays. A new
+   leader applies the latest claim found in the unit buckets
+   (`latest_claim`)
+3. units named (as hot) in the app bucket pick it up: relays are
+   credited with their relays not yet credited (`relay_count`) and
+   the new owner goes to 1
+
+Peer (leaderless) mode:
+
+1. the holder hands off directly in its unit bucket (`peer_handoff`)
+2. units accept only claims newer than any seen (`peer_accepts`), and
+   the next owner holds the potato (`peer_holds`)
+
+Side-channel mode (see `sidechannel`):
+
+1. unit daemons pass the potato directly; the unit holding it at a
+   checkpoint copies it, as a claim (of the passes made and the
+   holder), to its unit bucket (`checkpoint`)
+2. the leader applies the latest checkpoint to the app bucket
+   (`apply_checkpoint`)
+
+Multiple potatoes are handled by the `shards` module.
+"""
+
+import collections
+import functools
+import math
+
+
+RECORD_VERSION = "1"
+
+# app bucket settings and their defaults (unset is the default), shared
+# by both implementations: the hot potato interface declares its fields
+# with these (see `interfaces/hotpotato.py`) and does not write a field
+# set to its default, and `get_setting` decodes the raw bucket the same
+# way, so that either implementation can take over a deployment of the
+# other
+APP_DEFAULTS = {
+    "initialized": False,
+    "burst": 1,
+    "delay": 1.0,
+    "max_passes": 10,
+    "mode": "leader",
+    "pacing": "delay",
+    "potatoes": 1,
+    "shards": "",
+    "state": "",
+    "strategy": "random",
+    "target_rate": 0.0,
+}
+
+AppState = collections.namedtuple(
+    "AppState", ["epoch", "seq", "total_passes", "owner", "relays", "deadline", "run"]
+)
+Claim = collections.namedtuple(
+    "Claim", ["epoch", "next_total_passes", "next_owner", "next_owners"]
+)
+
+NO_APP = AppState(0, 0, 0, "-", "", 0.0, False)
+NO_CLAIM = Claim(0, 0, "", "")
+
+
+def get_setting(data, name):
+    """Return app setting `name` from (raw) bucket `data`, decoded as
+    the hot potato interface does: its default (see `APP_DEFAULTS`) if
+    unset."""
+
+    default = APP_DEFAULTS[name]
+    value = data.get(name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value == str(True)
+    return type(default)(value)
+
+
+@functools.lru_cache(maxsize=16)
+def decode_app(value):
+    """Decode app "state" record (NO_APP if unset or unknown version)."""
+
+    fields = value.split(":") if value else []
+    if len(fields) != 8 or fields[0] != RECORD_VERSION:
+        return NO_APP
+    _, epoch, seq, total_passes, owner, relays, deadline, run = fields
+    return AppState(
+        int(epoch), int(seq), int(total_passes), owner, relays, float(deadline), run == "1"
+    )
+
+
+def encode_app(app):
+    """Encode AppState as app "state" record.
+
+    The deadline is truncated (not rounded) to milliseconds, so that it
+    is never later than set.
+    """
+
+    deadline = math.floor(app.deadline * 1000) / 1000
+    return (
+        f"{RECORD_VERSION}:{app.epoch}:{app.seq}:{app.total_passes}:{app.owner}"
+        f":{app.relays}:{deadline:.3f}:{int(app.run)}"
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def decode_claim(value):
+    """Decode unit "claim" record (NO_CLAIM if unset or unknown version)."""
+
+    fields = value.split(":") if value else []
+    if len(fields) != 4 or fields[0] != RECORD_VERSION:
+        return NO_CLAIM
+    _, epoch, next_total_passes, next_owners = fields
+    chain = next_owners.split(",")
+    return Claim(
+        int(epoch), int(next_total_passes), chain[-1], next_owners if len(chain) > 1 else ""
+    )
+
+
+def encode_claim(claim):
+    """Encode Claim as unit "claim" record."""
+
+    return (
+        f"{RECORD_VERSION}:{claim.epoch}:{claim.next_total_passes}"
+        f":{claim.next_owners or claim.next_owner}"
+    )
+
+
+def transition(app, **changes):
+    """Return `app` with `changes`, as the next in sequence."""
+
+    return app._replace(seq=app.seq + 1, **changes)
+
+
+def new_epoch(app, **changes):
+    """Return `app` with `changes`, starting a new epoch."""
+
+    return app._replace(epoch=app.epoch + 1, seq=0, **changes)
+
+
+def is_newer(app, epoch, seq):
+    """Return True if `app` is newer than (`epoch`, `seq`)."""
+
+    return (app.epoch, app.seq) > (epoch, seq)
+
+
+def claim(app, chain):
+    """Return Claim, by the owner, of passes to `chain` of next owners."""
+
+    return Claim(
+        app.epoch,
+        app.total_passes + len(chain),
+        chain[-1],
+        ",".join(chain) if len(chain) > 1 else "",
+    )
+
+
+def claim_chain(claim):
+    """Return chain of next owners of `claim`."""
+
+    return claim.next_owners.split(",") if claim.next_owners else [claim.next_owner]
+
+
+def is_claimed(app, claim):
+    """Return True if `claim` is (still) pending for `app`: the owner
+    has already passed and is waiting on the leader."""
+
+    return claim.epoch == app.epoch and claim.next_total_passes > app.total_passes
+
+
+def latest_claim(app, claims):
+    """Return key of the latest of `claims` (mapping of key to Claim)
+    still pending for `app`, or None if none is.
+
+    Used by a new leader to pick up a pass its predecessor had not yet
+    applied: only the owner claims, so the latest claim is the one to
+    apply and any others are stale.
+    """
+
+    latest = None
+    for key, claim in claims.items():
+        if is_claimed(app, claim) and (
+            latest is None or claim.next_total_passes > claims[latest].next_total_passes
+        ):
+            latest = key
+    return latest
+
+
+def advance(app, claim, max_passes, deadline):
+    """Apply `claim` to `app` (leader).
+
+    Return (app, hot): the new app state and the units to wake ("*" for
+    all), or hot None if the claim is stale (app unchanged). Hops beyond
+    `max_passes` are dropped; `deadline` is when the new owner may pass.
+    """
+
+    if not is_claimed(app, claim):
+        return app, None
+
+    chain = claim_chain(claim)
+    nhops = min(len(chain), max_passes - app.total_passes)
+    if nhops <= 0:
+        return transition(app, run=False), "*"
+
+    chain = chain[:nhops]
+    total_passes = app.total_passes + nhops
+    # stop passing at max passes
+    run = app.run and total_passes < max_passes
+    app = AppState(
+        app.epoch,
+        app.seq + 1,
+        total_passes,
+        chain[-1],
+        add_relays(app.relays, chain[:-1]),
+        deadline,
+        run,
+    )
+    return app, chain if run else "*"
+
+
+def apply_checkpoint(app, checkpoint, max_passes):
+    """Apply side-channel `checkpoint` (Claim) to `app` (leader).
+
+    Return (app, hot) as `advance`: hot is None if the checkpoint is
+    stale, none ([]) while the game runs (the daemons pass), or all
+    ("*") once it is over.
+    """
+
+    if not is_claimed(app, checkpoint):
+        return app, None
+
+    run = app.run and checkpoint.next_total_passes < max_passes
+    app = transition(
+        app,
+        total_passes=checkpoint.next_total_passes,
+        owner=checkpoint.next_owner,
+        relays="",
+        run=run,
+    )
+    return app, [] if run else "*"
+
+
+def decode_relays(relays):
+    """Decode `relays` tally as a dict of unit name to count."""
+
+    counts = {}
+    for entry in relays.split(",") if relays else []:
+        name, _, count = entry.partition("=")
+        counts[name] = int(count)
+    return counts
+
+
+def add_relays(relays, names):
+    """Return `relays` tally with a pass relayed by each of `names`."""
+
+    if not names:
+        return relays
+    counts = collections.Counter(decode_relays(relays))
+    counts.update(names)
+    return ",".join(f"{name}={counts[name]}" for name in sorted(counts))
+
+
+def relay_count(relays, unit_name):
+    """Return number of passes relayed by `unit_name` in the epoch, per
+    `relays` tally."""
+
+    return decode_relays(relays).get(unit_name, 0)
+
+
+def peer_handoff(epoch, held_passes, max_passes, next_owner):
+    """Return (Claim, hot) handing off potato held at `held_passes` to
+    `next_owner` (peer mode)."""
+
+    total_passes = held_passes + 1
+    hot = "*" if total_passes >= max_passes else [next_owner]
+    return Claim(epoch, total_passes, next_owner, ""), hot
+
+
+def peer_accepts(epoch, seen_passes, claim):
+    """Return True if `claim` is newer than any seen, (`epoch`,
+    `seen_passes`) (peer mode)."""
+
+    return (claim.epoch, claim.next_total_passes) > (epoch, seen_passes)
+
+
+def peer_holds(unit_name, max_passes, claim):
+    """Return True if `unit_name` is to hold the potato after `claim`
+    (peer mode)."""
+
+    return claim.next_owner == unit_name and claim.next_total_passes < max_passes
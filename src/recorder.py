@@ -0,0 +1,183 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Hook recording (for offline replay).
+
+With `record-hooks` (boot config, see `bootconfig`), every dispatch
+appends a record (a JSON line) to `.record.jsonl` in the charm
+directory, with:
+
+* ts - end time
+* unit, leader - unit and whether it was leader
+* dispatch, remote - dispatch (hook/action) path and remote unit/app
+* params - action parameters (actions only)
+* config - charm config, if changed since the last record
+* reads - relation buckets read, by name: the keys changed since the
+  last record (None for a key removed)
+* writes - relation data written, by bucket name and key
+* wall, cpu - wall clock and CPU time of the dispatch (from import)
+
+Only changes are recorded: the bucket contents last recorded are kept
+in `.record-state.json`, so each record is small. The log is replayed,
+under `Harness`, by `benchmarks/bench_replay.py`.
+"""
+
+import json
+import os
+import time
+
+import bootconfig
+
+
+RECORD_NAME = ".record.jsonl"
+STATE_NAME = ".record-state.json"
+
+RECORDING = bootconfig.load()["record-hooks"]
+
+_t0 = time.perf_counter()
+_c0 = time.process_time()
+
+
+class Recorder:
+    """Records relation data read and written, and action params,
+    through a model backend (see `instrument`)."""
+
+    def __init__(self, path, state_path):
+        self.path = path
+        self.state_path = state_path
+        self.reads = {}
+        self.writes = {}
+        self.params = None
+
+    def instrument(self, backend):
+        """Record calls made through model `backend`."""
+
+        if getattr(backend, "_recorded", False):
+            return
+
+        relation_get = backend.relation_get
+        update_relation_data = backend.update_relation_data
+        action_get = backend.action_get
+
+        def recorded_relation_get(relation_id, member_name, is_app):
+            data = relation_get(relation_id, member_name, is_app)
+            self.reads.setdefault(member_name, {}).update(data)
+            return data
+
+        def recorded_update_relation_data(relation_id, entity, key, value):
+            self.writes.setdefault(entity.name, {})[key] = value
+            return update_relation_data(relation_id, entity, key, value)
+
+        def recorded_action_get():
+            self.params = action_get()
+            return self.params
+
+        backend.relation_get = recorded_relation_get
+        backend.update_relation_data = recorded_update_relation_data
+        backend.action_get = recorded_action_get
+        backend._recorded = True
+
+    def load_state(self):
+        """Return contents last recorded: buckets (by name) and config."""
+
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"buckets": {}, "config": None}
+
+    def save_state(self, state):
+        tmppath = f"{self.state_path}.tmp"
+        with open(tmppath, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(tmppath, self.state_path)
+
+    def record(self, unit_name, leader, dispatch, remote="", wall=0.0, cpu=0.0, config=None):
+        """Append record of the dispatch (with charm `config`); return it."""
+
+        state = self.load_state()
+        buckets = state["buckets"]
+
+        reads = {}
+        for name, data in self.reads.items():
+            known = buckets.setdefault(name, {})
+            diff = {key: value for key, value in data.items() if known.get(key) != value}
+            diff.update({key: None for key in known if key not in data})
+            if diff:
+                reads[name] = diff
+            buckets[name] = dict(data)
+        for name, data in self.writes.items():
+            known = buckets.setdefault(name, {})
+            for key, value in data.items():
+                if value:
+                    known[key] = value
+                else:
+                    known.pop(key, None)
+
+        record = {
+            "ts": time.time(),
+            "unit": unit_name,
+            "leader": leader,
+            "dispatch": dispatch,
+            "remote": remote,
+            "reads": reads,
+            "writes": self.writes,
+            "wall": wall,
+            "cpu": cpu,
+        }
+        if self.params is not None:
+            record["params"] = self.params
+        if config is not None and config != state["config"]:
+            record["config"] = config
+            state["config"] = config
+
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.save_state(state)
+
+        self.reads = {}
+        self.writes = {}
+        self.params = None
+        return record
+
+
+_recorder = None
+
+
+def get_recorder():
+    """Return recorder of this dispatch (files in the charm directory)."""
+
+    global _recorder
+
+    if _recorder is None:
+        charm_dir = bootconfig.get_charm_dir()
+        _recorder = Recorder(
+            os.path.join(charm_dir, RECORD_NAME), os.path.join(charm_dir, STATE_NAME)
+        )
+    return _recorder
+
+
+def record(unit_name, leader, config):
+    """Append record of this dispatch (see `Recorder.record`)."""
+
+    return get_recorder().record(
+        unit_name,
+        leader,
+        os.environ.get("JUJU_DISPATCH_PATH", ""),
+        os.environ.get("JUJU_REMOTE_UNIT") or os.environ.get("JUJU_REMOTE_APP", ""),
+        time.perf_counter() - _t0,
+        time.process_time() - _c0,
+        config,
+    )
+
+
+def load(paths):
+    """Return records of logs at `paths` (e.g., of several units),
+    merged in time order."""
+
+    records = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record["ts"])
+    return records
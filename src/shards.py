@@ -0,0 +1,164 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Multiple potato (sharded) state.
+
+With more than one potato, each potato has its own state, encoded in
+the app bucket as "shards":
+
+    <owner>:<passes>:<max_passes>:<deadline>;...
+
+(one entry per potato, in potato order), and units hand off the
+potatoes they own in "next_shards":
+
+    <potato>:<next_owner>:<next_passes>;...
+"""
+
+import collections
+import math
+
+
+Shard = collections.namedtuple("Shard", ["owner", "passes", "max_passes", "deadline"])
+Handoff = collections.namedtuple("Handoff", ["potato", "next_owner", "next_passes"])
+
+
+def decode_shards(value):
+    """Decode app "shards" value into a list of Shard."""
+
+    shards = []
+    for entry in value.split(";") if value else []:
+        owner, passes, max_passes, deadline = entry.split(":")
+        shards.append(Shard(owner, int(passes), int(max_passes), float(deadline)))
+    return shards
+
+
+def encode_shards(shards):
+    """Encode list of Shard as app "shards" value.
+
+    Deadlines are truncated (not rounded) to milliseconds, as in
+    `protocol.encode_app`.
+    """
+
+    return ";".join(
+        f"{shard.owner}:{shard.passes}:{shard.max_passes}"
+        f":{math.floor(shard.deadline * 1000) / 1000:.3f}"
+        for shard in shards
+    )
+
+
+def decode_handoffs(value):
+    """Decode unit "next_shards" value into a list of Handoff."""
+
+    handoffs = []
+    for entry in value.split(";") if value else []:
+        potato, next_owner, next_passes = entry.split(":")
+        handoffs.append(Handoff(int(potato), next_owner, int(next_passes)))
+    return handoffs
+
+
+def encode_handoffs(handoffs):
+    """Encode list of Handoff as unit "next_shards" value."""
+
+    return ";".join(
+        f"{handoff.potato}:{handoff.next_owner}:{handoff.next_passes}"
+        for handoff in sorted(handoffs)
+    )
+
+
+def new_shards(npotatoes, names, owner, max_passes):
+    """Return initial shards for `npotatoes` potatoes.
+
+    Potatoes start with consecutive units (from `owner`, in `names`
+    order) and share `max_passes` between them.
+    """
+
+    start = names.index(owner) if owner in names else 0
+    shards = []
+    for i in range(npotatoes):
+        shard_max_passes = max_passes // npotatoes + (1 if i < max_passes % npotatoes else 0)
+        shards.append(Shard(names[(start + i) % len(names)], 0, shard_max_passes, 0.0))
+    return shards
+
+
+def fresh_handoffs(shards, handoffs):
+    """Return those of `handoffs` that are ahead of their potato (not
+    stale), i.e., that `apply_handoffs` would apply."""
+
+    return [
+        handoff
+        for handoff in handoffs
+        if handoff.potato < len(shards)
+        and min(handoff.next_passes, shards[handoff.potato].max_passes)
+        > shards[handoff.potato].passes
+    ]
+
+
+def apply_handoffs(shards, handoffs, deadline):
+    """Apply unit `handoffs` to `shards` (in place).
+
+    Stale handoffs (not ahead of the potato) are ignored. Return the
+    number of passes applied.
+    """
+
+    npasses = 0
+    for handoff in handoffs:
+        if handoff.potato >= len(shards):
+            continue
+        shard = shards[handoff.potato]
+        next_passes = min(handoff.next_passes, shard.max_passes)
+        if next_passes > shard.passes:
+            npasses += next_passes - shard.passes
+            shards[handoff.potato] = Shard(
+                handoff.next_owner, next_passes, shard.max_passes, deadline
+            )
+    return npasses
+
+
+def take_shards(shards, handoffs, unit_name, now, elect):
+    """Hand off the potatoes owned by `unit_name` that are due.
+
+    `handoffs` are the unit's current handoffs (those not yet applied
+    are kept) and `elect` returns a next owner. Return (handoffs,
+    npasses, wait), with `wait` the seconds until the next owned potato
+    is due (None if none waiting).
+    """
+
+    pending = {
+        handoff.potato: handoff
+        for handoff in handoffs
+        if handoff.potato < len(shards) and handoff.next_passes > shards[handoff.potato].passes
+    }
+    npasses = 0
+    wait = None
+    for i, shard in enumerate(shards):
+        if shard.owner != unit_name or shard.passes >= shard.max_passes or i in pending:
+            continue
+        if shard.deadline > now:
+            wait = min(wait, shard.deadline - now) if wait is not None else shard.deadline - now
+            continue
+        pending[i] = Handoff(i, elect(), shard.passes + 1)
+        npasses += 1
+    return list(pending.values()), npasses, wait
+
+
+def reassign_shards(shards, is_lost, elect, deadline):
+    """Reassign (in place) unfinished potatoes whose owner is lost
+    (`is_lost(shard)`) to `elect(shard.owner)`, due at `deadline`.
+
+    Passes are kept: a pass is counted once, whichever of the previous
+    and new owner's handoffs is applied first. Return the number of
+    potatoes reassigned.
+    """
+
+    nreassigned = 0
+    for i, shard in enumerate(shards):
+        if shard.passes < shard.max_passes and is_lost(shard):
+            shards[i] = Shard(elect(shard.owner), shard.passes, shard.max_passes, deadline)
+            nreassigned += 1
+    return nreassigned
+
+
+def finished(shards):
+    """Return True if all potatoes have reached their max passes."""
+
+    return all(shard.passes >= shard.max_passes for shard in shards)
@@ -0,0 +1,314 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Side-channel passing service.
+
+In "side-channel" mode, passes do not go through relation data and
+hook dispatch: each unit runs a daemon (started by the charm, see
+`service_start`) and the holder hands the potato directly to the next
+owner's daemon over a socket, in milliseconds. The relation buckets
+only hold checkpoints.
+
+Endpoints are "unix:<path>" (Unix socket) or "<host>:<port>" (TCP,
+bound to that host only: the unit's ingress address; "[<host>]:<port>"
+for IPv6).
+Messages are single lines, each answered by a single line ("ok",
+unless noted). Each starts with the token of the daemon it is sent to
+(set from `TOKEN_ENV` when the daemon starts, and shared with the peers
+in the relation): a message with any other is answered "error: bad
+token" and ignored.
+
+* config <json> - game config (from the local charm): epoch,
+  max_passes, every, delay, run, strategy, peers (unit name to
+  [endpoint, token])
+* pass <claim> - potato handed to this unit: a claim record (see
+  `protocol`) of the total passes made and the holder (this unit)
+* stop <claim> - game over (the claim of the last pass): checkpoint
+* status - answered with the daemon state (JSON)
+* quit - exit
+
+Passes are accepted only if newer than any seen (`peer_accepts`); a pass
+of a newer epoch than configured is held until its config arrives.
+
+The daemon writes a checkpoint (JSON: epoch, total_passes, owner,
+npasses) every `every` passes, when the game ends (on every unit) and
+when it is stopped, and then runs the `dispatch` command (e.g.,
+juju-exec of update-status) so that the charm copies it to the
+relation (see `BaseHotPotatoCharm.read_side_channel_checkpoint`).
+
+Usage:
+    python3 src/sidechannel.py serve <unit> <endpoint> <checkpoint-file> [<dispatch>]
+    python3 src/sidechannel.py send <endpoint> <message>
+with the token in the SIDE_CHANNEL_TOKEN environment variable.
+"""
+
+import hmac
+import json
+import os
+import random
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+from protocol import NO_CLAIM, Claim, decode_claim, encode_claim, peer_accepts
+
+
+# seconds to wait on a peer
+TIMEOUT = 2.0
+# environment variable with the daemon's token
+TOKEN_ENV = "SIDE_CHANNEL_TOKEN"
+
+
+def format_endpoint(host, port):
+    """Return TCP endpoint of `host` (IPv4 or IPv6 address) and `port`."""
+
+    if ":" in host:
+        return f"[{host}]:{port}"
+    return f"{host}:{port}"
+
+
+def parse_endpoint(endpoint):
+    """Return (family, address) of `endpoint`."""
+
+    if endpoint.startswith("unix:"):
+        return socket.AF_UNIX, endpoint.split(":", 1)[1]
+    host, _, port = endpoint.rpartition(":")
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return family, (host, int(port))
+
+
+def send(endpoint, token, message, timeout=TIMEOUT):
+    """Send `message` (line) to daemon at `endpoint` (with its `token`);
+    return the reply."""
+
+    family, address = parse_endpoint(endpoint)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(f"{token} {message}".encode() + b"\n")
+        with sock.makefile("r") as f:
+            return f.readline().strip()
+
+
+class Daemon:
+    """Side-channel daemon of unit `unit_name`, listening at `endpoint`
+    for messages with `token`.
+
+    Single threaded: messages are handled one at a time, and the held
+    potato is passed on when due, between messages.
+    """
+
+    def __init__(self, unit_name, endpoint, token, checkpoint_path, dispatch=None):
+        self.unit_name = unit_name
+        self.token = token
+        self.checkpoint_path = checkpoint_path
+        self.dispatch = dispatch
+
+        self.config = {"epoch": 0, "run": False, "peers": {}}
+        self.seen = (0, 0)
+        self.held = None
+        self.pending = NO_CLAIM
+        self.due = 0.0
+        self.npasses = 0
+        self.running = True
+
+        family, address = parse_endpoint(endpoint)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(address)
+        self.sock.listen(64)
+        if family != socket.AF_UNIX:
+            # (bound port, if 0)
+            self.endpoint = format_endpoint(*self.sock.getsockname()[:2])
+        else:
+            self.endpoint = endpoint
+
+    def serve(self):
+        """Handle messages and pass the potato until told to quit."""
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        try:
+            while self.running:
+                timeout = None
+                if self.held is not None:
+                    timeout = max(self.due - time.monotonic(), 0.0)
+                if selector.select(timeout):
+                    self.accept()
+                if self.held is not None and time.monotonic() >= self.due:
+                    self.hand_off()
+        finally:
+            selector.close()
+            self.sock.close()
+
+    def accept(self):
+        """Accept a connection and handle its message."""
+
+        conn, _ = self.sock.accept()
+        with conn:
+            conn.settimeout(TIMEOUT)
+            try:
+                with conn.makefile("rw") as f:
+                    token, _, message = f.readline().strip().partition(" ")
+                    if hmac.compare_digest(token.encode(), self.token.encode()):
+                        command, _, arg = message.partition(" ")
+                        reply = self.handle(command, arg)
+                    else:
+                        reply = "error: bad token"
+                    f.write(reply + "\n")
+            except OSError:
+                pass
+
+    def handle(self, command, arg):
+        """Handle message; return reply."""
+
+        if command == "pass":
+            self.receive(decode_claim(arg))
+        elif command == "config":
+            self.configure(json.loads(arg))
+        elif command == "stop":
+            last = decode_claim(arg)
+            if last.epoch == self.config["epoch"]:
+                self.seen = max(self.seen, (last.epoch, last.next_total_passes))
+                self.held = None
+                self.checkpoint()
+        elif command == "status":
+            return json.dumps(self.get_state())
+        elif command == "quit":
+            self.running = False
+        else:
+            return "error: unknown command"
+        return "ok"
+
+    def configure(self, config):
+        """Apply `config`: a new epoch (re)starts the count of passes."""
+
+        if config["epoch"] < self.config["epoch"]:
+            return
+        if config["epoch"] > self.config["epoch"]:
+            self.npasses = 0
+        self.config = config
+
+        if not config["run"]:
+            if self.held is not None:
+                self.held = None
+                self.checkpoint()
+        elif self.pending.epoch == config["epoch"]:
+            pending, self.pending = self.pending, NO_CLAIM
+            self.receive(pending)
+
+    def receive(self, claim):
+        """Hold potato of `claim`, if newer than any seen."""
+
+        if claim.epoch > self.config["epoch"]:
+            # config not yet received
+            self.pending = claim
+            return
+        if not peer_accepts(*self.seen, claim) or not self.config["run"]:
+            return
+        self.seen = (claim.epoch, claim.next_total_passes)
+        self.held = claim.next_total_passes
+        self.due = time.monotonic() + self.config.get("delay", 0.0)
+
+    def elect(self):
+        """Return next owner (unit name), by configured strategy."""
+
+        names = sorted(self.config["peers"])
+        if self.config.get("strategy") == "round-robin" and self.unit_name in names:
+            return names[(names.index(self.unit_name) + 1) % len(names)]
+        return random.choice(names)
+
+    def hand_off(self):
+        """Pass held potato to the next owner (or, if it cannot be
+        reached, another)."""
+
+        total_passes = self.held + 1
+        self.held = None
+        self.npasses += 1
+        epoch = self.config["epoch"]
+        max_passes = self.config["max_passes"]
+
+        if total_passes >= max_passes:
+            self.seen = (epoch, total_passes)
+            self.checkpoint(owner=self.unit_name)
+            last = encode_claim(Claim(epoch, total_passes, self.unit_name, ""))
+            for name, peer in self.config["peers"].items():
+                if name != self.unit_name:
+                    self.send_quietly(peer, f"stop {last}")
+            return
+
+        for name in [self.elect()] + sorted(self.config["peers"]):
+            claim = Claim(epoch, total_passes, name, "")
+            if name == self.unit_name:
+                self.receive(claim)
+                break
+            if self.send_quietly(self.config["peers"][name], f"pass {encode_claim(claim)}"):
+                break
+
+        every = self.config.get("every", 0)
+        if every and total_passes % every == 0:
+            self.checkpoint(total_passes=total_passes, owner=name)
+
+    def send_quietly(self, peer, message):
+        """Send `message` to `peer` ([endpoint, token]); return False if
+        it failed."""
+
+        endpoint, token = peer
+        try:
+            return send(endpoint, token, message) == "ok"
+        except OSError:
+            return False
+
+    def get_state(self):
+        """Return daemon state (for the checkpoint, and status)."""
+
+        epoch, total_passes = self.seen
+        return {
+            "epoch": epoch,
+            "total_passes": total_passes,
+            "owner": self.unit_name if self.held is not None else "",
+            "npasses": self.npasses,
+            "held": self.held is not None,
+        }
+
+    def checkpoint(self, **changes):
+        """Write checkpoint (the state, with `changes`) and run the
+        dispatch command."""
+
+        state = self.get_state()
+        state.update(changes)
+        tmppath = f"{self.checkpoint_path}.tmp"
+        with open(tmppath, "w") as f:
+            json.dump(state, f)
+        os.replace(tmppath, self.checkpoint_path)
+
+        if self.dispatch:
+            subprocess.Popen(
+                ["/bin/sh", "-c", self.dispatch],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+
+
+def main():
+    token = os.environ.get(TOKEN_ENV, "")
+    if token and len(sys.argv) >= 5 and sys.argv[1] == "serve":
+        Daemon(sys.argv[2], sys.argv[3], token, *sys.argv[4:6]).serve()
+    elif token and len(sys.argv) == 4 and sys.argv[1] == "send":
+        print(send(sys.argv[2], token, sys.argv[3]))
+    else:
+        print(__doc__.split("Usage:")[1], file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Pass statistics.
+
+Timings are kept in fixed size ring buffers (lists, with the index of
+the oldest entry once full), so memory stays constant however long a
+game runs.
+"""
+
+
+RING_SIZE = 128
+
+
+def ring_append(ring, index, value, size=RING_SIZE):
+    """Add `value` to `ring` (overwriting the oldest entry once full).
+    Return the new index."""
+
+    if len(ring) < size:
+        ring.append(value)
+        return 0
+    ring[index] = value
+    return (index + 1) % size
+
+
+def ring_values(ring, index):
+    """Return values of `ring`, oldest first."""
+
+    values = list(ring)
+    return values[index:] + values[:index]
+
+
+def percentile(values, pct):
+    """Return the `pct` percentile (nearest rank) of `values`."""
+
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def summarize_latencies(values):
+    """Return p50/p95/p99 of `values`."""
+
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def summarize_passes(times):
+    """Return pass latency (time between passes) and passes/sec for
+    pass `times` (oldest first)."""
+
+    intervals = [t1 - t0 for t0, t1 in zip(times, times[1:])]
+    span = times[-1] - times[0] if times else 0.0
+    return {
+        "latency": summarize_latencies(intervals),
+        "passes-per-sec": len(intervals) / span if span > 0 else 0.0,
+    }
+
+
+def summarize_npasses(npasses):
+    """Return distribution of per-unit `npasses` (mapping)."""
+
+    # not needed on most dispatches
+    import statistics
+
+    values = list(npasses.values())
+    return {
+        "min": min(values, default=0),
+        "max": max(values, default=0),
+        "mean": statistics.mean(values) if values else 0.0,
+        "stdev": statistics.pstdev(values) if values else 0.0,
+        "units": " ".join(f"{name}={n}" for name, n in sorted(npasses.items())),
+    }
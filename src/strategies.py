@@ -0,0 +1,87 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Owner selection strategies.
+
+* random - uniform random unit
+* round-robin - next unit in (sorted) roster order
+* fair - random, weighted by inverse number of passes (alias table)
+* nearby - random, preferring (with probability `locality-bias`) units
+  in the same locality as the owner: subnet, or host (see
+  `locality_key`)
+"""
+
+import ipaddress
+import random
+
+
+STRATEGIES = ("random", "round-robin", "fair", "nearby")
+
+# subnet prefix lengths grouping addresses by locality
+IPV4_PREFIX = 24
+IPV6_PREFIX = 64
+
+
+def build_alias_table(weights):
+    """Build alias table (Vose) for `weights`.
+
+    Return (prob, alias) lists for O(1) sampling with `sample_alias`.
+    """
+
+    n = len(weights)
+    total = float(sum(weights))
+    if not n or total <= 0:
+        return [1.0] * n, list(range(n))
+
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        if scaled[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+
+    for i in small + large:
+        prob[i] = 1.0
+
+    return prob, alias
+
+
+def sample_alias(prob, alias, rng=random):
+    """Return index sampled from alias table (prob, alias)."""
+
+    i = rng.randrange(len(prob))
+    return i if rng.random() < prob[i] else alias[i]
+
+
+def locality_key(address):
+    """Return locality of unit `address`: its subnet (see `IPV4_PREFIX`,
+    `IPV6_PREFIX`), or, if not an IP address, the address (host name)
+    itself. "" if no address."""
+
+    if not address:
+        return ""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address
+    prefix = IPV4_PREFIX if ip.version == 4 else IPV6_PREFIX
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+def sample_nearby(nearby, roster, bias, rng=random):
+    """Return unit sampled from `nearby` with probability `bias`, or
+    else (or if none nearby) from `roster`, uniformly."""
+
+    if nearby and rng.random() < bias:
+        return nearby[rng.randrange(len(nearby))]
+    return roster[rng.randrange(len(roster))]
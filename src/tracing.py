@@ -0,0 +1,162 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Sampled tracing.
+
+Replaces per-call enter/exit logging of handlers and hot paths. A
+dispatch is traced with probability `trace-sample-rate` (boot config,
+see `bootconfig`), decided once, at import. If it is not, `traced`
+returns functions undecorated: tracing costs nothing.
+
+If it is, each call of a traced function appends a record (a JSON
+line) to `.trace.jsonl` in the charm directory, with:
+
+* ts - start time
+* unit, dispatch - unit and dispatch (hook/action) path
+* fn - (qualified) function name
+* wall, cpu - wall clock and CPU time (seconds)
+* reads, writes, statuses - relation reads/writes and status sets
+
+Counts (and times) are inclusive of nested traced calls.
+
+Usage (summary by function):
+    python3 src/tracing.py [<trace-file>]
+"""
+
+import functools
+import json
+import os
+import random
+import sys
+import time
+
+import bootconfig
+
+
+TRACE_NAME = ".trace.jsonl"
+
+# backend methods counted
+COUNTED = {
+    "relation_get": "reads",
+    "update_relation_data": "writes",
+    "status_set": "statuses",
+}
+
+_rate = bootconfig.load()["trace-sample-rate"]
+SAMPLED = _rate > 0 and random.random() < _rate
+
+_counts = dict.fromkeys(COUNTED.values(), 0)
+_file = None
+
+
+def get_path():
+    """Return path of trace file."""
+
+    return os.path.join(bootconfig.get_charm_dir(), TRACE_NAME)
+
+
+def instrument(backend):
+    """Count calls (see `COUNTED`) made through model `backend`."""
+
+    if getattr(backend, "_traced", False):
+        return
+
+    for name, key in COUNTED.items():
+        method = getattr(backend, name, None)
+        if method is None:
+            continue
+
+        def counted(*args, _key=key, _method=method, **kwargs):
+            _counts[_key] += 1
+            return _method(*args, **kwargs)
+
+        setattr(backend, name, counted)
+    backend._traced = True
+
+
+def write(record):
+    """Append `record` to trace file."""
+
+    global _file
+
+    if _file is None:
+        _file = open(get_path(), "a", buffering=1)
+    _file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def traced():
+    """Decorator tracing calls of (charm) method, if dispatch sampled."""
+
+    def decorator(f):
+        if not SAMPLED:
+            return f
+
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            instrument(self.model._backend)
+            counts = dict(_counts)
+            ts = time.time()
+            t0 = time.perf_counter()
+            c0 = time.process_time()
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                record = {
+                    "ts": ts,
+                    "unit": self.unit.name,
+                    "dispatch": os.environ.get("JUJU_DISPATCH_PATH", ""),
+                    "fn": f.__qualname__,
+                    "wall": time.perf_counter() - t0,
+                    "cpu": time.process_time() - c0,
+                }
+                record.update({key: _counts[key] - counts[key] for key in _counts})
+                write(record)
+
+        return wrapper
+
+    return decorator
+
+
+def summarize(records):
+    """Return summary, by function, of trace `records`."""
+
+    # (offline only)
+    import statistics
+
+    byfn = {}
+    for record in records:
+        byfn.setdefault(record["fn"], []).append(record)
+
+    summary = {}
+    for fn, fnrecords in sorted(byfn.items()):
+        walls = sorted(record["wall"] for record in fnrecords)
+        summary[fn] = {
+            "calls": len(fnrecords),
+            "wall_p50": walls[len(walls) // 2],
+            "wall_max": walls[-1],
+            "cpu_mean": statistics.mean(record["cpu"] for record in fnrecords),
+        }
+        for key in COUNTED.values():
+            summary[fn][key] = statistics.mean(record[key] for record in fnrecords)
+    return summary
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else get_path()
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    print(
+        f"{'fn':<50} {'calls':>6} {'wall p50':>9} {'wall max':>9} {'cpu':>8}"
+        f" {'reads':>6} {'writes':>6} {'status':>6}"
+    )
+    for fn, s in summarize(records).items():
+        print(
+            f"{fn:<50} {s['calls']:>6} {1000 * s['wall_p50']:>7.2f}ms"
+            f" {1000 * s['wall_max']:>7.2f}ms {1000 * s['cpu_mean']:>6.2f}ms"
+            f" {s['reads']:>6.1f} {s['writes']:>6.1f} {s['statuses']:>6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,577 @@
-# Copyright 2022 John
+# Copyright 2022 Canonical Ltd.
 # See LICENSE file for licensing details.
 #
 # Learn more about testing at: https://juju.is/docs/sdk/testing
 
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
 import unittest
-from unittest.mock import Mock
+from unittest.mock import patch
 
-from charm import GitCharm
-from ops.model import ActiveStatus
-from ops.testing import Harness
+import charmbase
+import charmiface
+import charmnoiface
+from benchmarks.cluster import Federation, PeerCluster
+from gateway import decode_pass
+from protocol import decode_app, decode_claim, is_claimed
 
 
-class TestCharm(unittest.TestCase):
+class HotPotatoCharmTests:
+    """Tests common to both implementations."""
+
+    charm_cls = None
+
     def setUp(self):
-        self.harness = Harness(GitCharm)
-        self.addCleanup(self.harness.cleanup)
-        self.harness.begin()
-
-    def test_config_changed(self):
-        self.assertEqual(list(self.harness.charm._stored.things), [])
-        self.harness.update_config({"thing": "foo"})
-        self.assertEqual(list(self.harness.charm._stored.things), ["foo"])
-
-    def test_action(self):
-        # the harness doesn't (yet!) help much with actions themselves
-        action_event = Mock(params={"fail": ""})
-        self.harness.charm._on_fortune_action(action_event)
-
-        self.assertTrue(action_event.set_results.called)
-
-    def test_action_fail(self):
-        action_event = Mock(params={"fail": "fail this"})
-        self.harness.charm._on_fortune_action(action_event)
-
-        self.assertEqual(action_event.fail.call_args, [("fail this",)])
-
-    def test_httpbin_pebble_ready(self):
-        # Simulate making the Pebble socket available
-        self.harness.set_can_connect("httpbin", True)
-        # Check the initial Pebble plan is empty
-        initial_plan = self.harness.get_container_pebble_plan("httpbin")
-        self.assertEqual(initial_plan.to_yaml(), "{}\n")
-        # Expected plan after Pebble ready with default config
-        expected_plan = {
-            "services": {
-                "httpbin": {
-                    "override": "replace",
-                    "summary": "httpbin",
-                    "command": "gunicorn -b 0.0.0.0:80 httpbin:app -k gevent",
-                    "startup": "enabled",
-                    "environment": {"thing": "🎁"},
-                }
-            },
-        }
-        # Get the httpbin container from the model
-        container = self.harness.model.unit.get_container("httpbin")
-        # Emit the PebbleReadyEvent carrying the httpbin container
-        self.harness.charm.on.httpbin_pebble_ready.emit(container)
-        # Get the plan now we've run PebbleReady
-        updated_plan = self.harness.get_container_pebble_plan("httpbin").to_dict()
-        # Check we've got the plan we expected
-        self.assertEqual(expected_plan, updated_plan)
-        # Check the service was started
-        service = self.harness.model.unit.get_container("httpbin").get_service("httpbin")
-        self.assertTrue(service.is_running())
-        # Ensure we set an ActiveStatus with no message
-        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+        self.cluster = PeerCluster(self.charm_cls, 3)
+        self.addCleanup(self.cluster.cleanup)
+
+    def app_state(self):
+        return decode_app(self.cluster.app_data().get("state", ""))
+
+    def get_run(self):
+        return self.app_state().run
+
+    def play(self, max_passes, owner="hot-potato/2", **params):
+        params.update({"delay": 0, "owner": owner, "max-passes": max_passes})
+        self.cluster.run_action("configure", params)
+        self.cluster.run_action("run", {"run": True})
+        self.cluster.drain(max_hooks=1000)
+
+    def total_npasses(self):
+        return sum(
+            int(self.cluster.unit_data(name).get("npasses", 0)) for name in self.cluster.unit_names
+        )
+
+    def test_leader_elected(self):
+        app = self.app_state()
+        self.assertEqual((app.epoch, app.total_passes, app.owner), (1, 0, "-"))
+        self.assertFalse(app.run)
+
+    def test_configure_action(self):
+        self.cluster.run_action("configure", {"owner": "hot-potato/1", "max-passes": 7})
+        appdata = self.cluster.app_data()
+        self.assertEqual(self.app_state().owner, "hot-potato/1")
+        self.assertEqual(self.app_state().epoch, 2)
+        self.assertEqual(int(appdata["max_passes"]), 7)
+
+    def test_configure_unsupported(self):
+        self.cluster.run_action("configure", {"potatoes": 2})
+        for params in ({"mode": "peer"}, {"burst": 3}):
+            event = self.cluster.run_action("configure", params)
+            event.fail.assert_called_once()
+        event = self.cluster.run_action("configure", {"mode": "peer", "potatoes": 1})
+        event.fail.assert_not_called()
+        self.assertEqual(self.cluster.app_data()["mode"], "peer")
+
+    def test_not_running(self):
+        self.cluster.run_action("configure", {"delay": 0, "owner": "hot-potato/2"})
+        self.cluster.drain()
+        self.assertEqual(self.app_state().total_passes, 0)
+        self.assertEqual(self.total_npasses(), 0)
+
+    def test_game(self):
+        self.play(12)
+        self.assertFalse(self.cluster.queue)
+        self.assertEqual(self.app_state().total_passes, 12)
+        self.assertEqual(self.total_npasses(), 12)
+        self.assertFalse(self.get_run())
+
+    def test_round_robin(self):
+        self.play(12, strategy="round-robin")
+        self.assertEqual(self.app_state().total_passes, 12)
+        for name in self.cluster.unit_names:
+            self.assertEqual(int(self.cluster.unit_data(name)["npasses"]), 4)
+
+    def test_fair(self):
+        self.play(30, strategy="fair")
+        self.assertEqual(self.app_state().total_passes, 30)
+        self.assertEqual(self.total_npasses(), 30)
+
+    def test_targeted_wakeup(self):
+        self.play(12)
+        idle = [
+            hook
+            for hook in self.cluster.hooks
+            if hook.kind == "relation-changed" and hook.reads <= 1
+        ]
+        # (at least) the unit neither owner nor leader, every app update:
+        # one per pass but those the leader makes in its own hook
+        npasses = int(self.cluster.unit_data(self.cluster.leader_name).get("npasses", 0))
+        self.assertGreaterEqual(len(idle), 12 - npasses)
+        for hook in idle:
+            self.assertEqual(hook.writes, 0)
+            self.assertEqual(hook.statuses, 0)
+
+    def test_status_coalesced(self):
+        self.play(12)
+        for hook in self.cluster.hooks:
+            self.assertLessEqual(hook.statuses, 1)
+
+        # unchanged status is not set again
+        self.cluster.emit(self.cluster.leader_name, "update_status")
+        status = self.cluster.leader.model.unit.status
+        self.cluster.leader.charm.service_update_status()
+        self.cluster.leader.framework.commit()
+        calls = self.cluster.leader._get_backend_calls(reset=True)
+        self.assertNotIn("status_set", [call[0] for call in calls])
+        self.assertEqual(self.cluster.leader.model.unit.status, status)
+
+    def test_burst(self):
+        self.play(10, burst=3)
+        self.assertEqual(self.app_state().total_passes, 10)
+        self.assertEqual(self.total_npasses(), 10)
+        self.assertFalse(self.get_run())
+
+    def test_leader_app_events(self):
+        # the leader passes in the hook that makes it owner; being woken
+        # for its own app changes anyway is harmless
+        for leader_app_events in (False, True):
+            self.cluster = PeerCluster(self.charm_cls, 3, leader_app_events=leader_app_events)
+            self.addCleanup(self.cluster.cleanup)
+            self.play(12, owner=self.cluster.leader_name, burst=2)
+            self.assertFalse(self.cluster.queue)
+            self.assertEqual(self.app_state().total_passes, 12)
+            self.assertEqual(self.total_npasses(), 12)
+            self.assertFalse(self.get_run())
+
+    def test_switch_implementation(self):
+        # switch implementation mid-game: settings left at their
+        # defaults (unset) read the same
+        other_cls = (
+            charmnoiface.HotPotatoCharm
+            if self.charm_cls is charmiface.HotPotatoCharm
+            else charmiface.HotPotatoCharm
+        )
+        params = {"owner": "hot-potato/2", "pacing": "none", "burst": 2}
+        self.cluster.run_action("configure", params)
+        self.cluster.run_action("run", {"run": True})
+        self.cluster.drain(max_hooks=5)
+
+        self.cluster.switch(other_cls)
+        # (a new leader does not initialize the app afresh)
+        self.cluster.elect("hot-potato/1")
+        self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 10)
+        self.assertEqual(self.total_npasses(), 10)
+        self.assertFalse(self.get_run())
+
+    def test_burst_last_relays(self):
+        # relays of the burst that ends the game are credited too
+        self.play(14, burst=3, strategy="round-robin")
+        self.assertEqual(self.app_state().total_passes, 14)
+        self.assertEqual(self.total_npasses(), 14)
+
+    def test_potatoes(self):
+        self.play(13, potatoes=3)
+        self.assertFalse(self.cluster.queue)
+        self.assertEqual(self.app_state().total_passes, 13)
+        self.assertEqual(self.total_npasses(), 13)
+        self.assertFalse(self.get_run())
+
+    def test_reconcile_backlog(self):
+        params = {"delay": 0, "owner": "hot-potato/1", "max-passes": 20, "potatoes": 2}
+        self.cluster.run_action("configure", params)
+        self.cluster.drain(max_hooks=1000)
+        self.cluster.run_action("run", {"run": True})
+
+        # both owners hand off before the leader gets to any of it
+        leader_hooks = []
+        while self.cluster.queue:
+            harness, name, changes = self.cluster.queue.popleft()
+            if harness is self.cluster.leader:
+                leader_hooks.append((harness, name, changes))
+            else:
+                self.cluster._deliver(harness, name, changes)
+
+        # as relation-get, the leader sees current bucket data (changes
+        # applied at once) in its first hook for a unit change, which
+        # applies both handoffs
+        raw = self.cluster.leader._backend._relation_data_raw[self.cluster.relation_id]
+        for harness, name, changes in leader_hooks:
+            if name != self.cluster.app_name:
+                raw[name].update(changes)
+        for harness, name, changes in leader_hooks:
+            self.cluster._deliver(harness, name, {})
+            if name != self.cluster.app_name:
+                break
+        # (and then passes its own potato, in the same hook, if it is an
+        # owner)
+        self.assertGreaterEqual(self.app_state().total_passes, 2)
+
+        self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 20)
+
+    def test_peer_mode(self):
+        self.play(15, mode="peer")
+        self.assertFalse(self.cluster.queue)
+        self.assertEqual(self.app_state().total_passes, 15)
+        self.assertEqual(self.total_npasses(), 15)
+        self.assertFalse(self.get_run())
+
+    def test_stats(self):
+        self.play(12)
+        event = self.cluster.run_action("stats", {})
+        results = event.set_results.call_args[0][0]
+        self.assertEqual(results["latency"]["count"], 11)
+        self.assertGreater(results["passes-per-sec"], 0)
+        self.assertEqual(results["npasses"]["units"].count("="), 3)
+        self.assertEqual(
+            sum(int(entry.split("=")[1]) for entry in results["npasses"]["units"].split()), 12
+        )
+
+        # non-leader: own hold latency only
+        event = self.cluster.run_action("stats", {}, unit_name="hot-potato/1")
+        results = event.set_results.call_args[0][0]
+        self.assertNotIn("latency", results)
+        self.assertIn("hold", results)
+
+    def test_failover(self):
+        params = {"delay": 0, "owner": "hot-potato/2", "max-passes": 12}
+        self.cluster.run_action("configure", params)
+        self.cluster.run_action("run", {"run": True})
+
+        # leader fails over with a claim it has not yet applied
+        while not is_claimed(
+            self.app_state(), decode_claim(self.cluster.unit_data("hot-potato/2").get("claim"))
+        ):
+            self.cluster.drain(max_hooks=1)
+        claim = decode_claim(self.cluster.unit_data("hot-potato/2").get("claim"))
+        self.cluster.elect("hot-potato/1")
+        # (and then passes on, in the same hook, while it is the owner)
+        self.assertGreaterEqual(self.app_state().total_passes, 1)
+        self.assertFalse(is_claimed(self.app_state(), claim))
+
+        self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 12)
+        self.assertFalse(self.get_run())
+        self.assertEqual(self.total_npasses(), 12)
+
+    def test_configure_pending_claim(self):
+        # (re)configured mid-game while the owner's claim is pending:
+        # the pass is counted once, whether or not it starts a new epoch
+        for params in ({"strategy": "round-robin"}, {"owner": "hot-potato/1"}):
+            self.cluster = PeerCluster(self.charm_cls, 3)
+            self.addCleanup(self.cluster.cleanup)
+            self.cluster.run_action(
+                "configure", {"delay": 0, "owner": "hot-potato/2", "max-passes": 12}
+            )
+            self.cluster.run_action("run", {"run": True})
+            while not is_claimed(
+                self.app_state(),
+                decode_claim(self.cluster.unit_data("hot-potato/2").get("claim")),
+            ):
+                self.cluster.drain(max_hooks=1)
+
+            self.cluster.run_action("configure", params)
+            self.cluster.drain(max_hooks=1000)
+            self.assertEqual(self.app_state().total_passes, 12)
+            self.assertEqual(self.total_npasses(), 12)
+            self.assertFalse(self.get_run())
+
+    def test_failover_idle(self):
+        params = {"delay": 0, "owner": "hot-potato/2", "max-passes": 5}
+        self.cluster.run_action("configure", params)
+        self.cluster.drain(max_hooks=1000)
+        self.cluster.run_action("run", {"run": True})
+
+        # app change lost with the previous leader: owner is woken again
+        self.cluster.queue.clear()
+        self.cluster.elect("hot-potato/1")
+        self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 5)
+        self.assertFalse(self.get_run())
+
+    def test_owner_departed(self):
+        params = {"delay": 60, "owner": "hot-potato/0", "strategy": "round-robin"}
+        self.cluster.run_action("configure", params)
+        self.cluster.run_action("run", {"run": True})
+        self.cluster.drain(max_hooks=1000)
+        app = self.app_state()
+        self.assertEqual((app.total_passes, app.owner), (1, "hot-potato/1"))
+
+        # new owner passes (on) at once
+        self.cluster.remove("hot-potato/1")
+        self.assertEqual(self.app_state().owner, "hot-potato/2")
+        self.cluster.drain(max_hooks=1000)
+        app = self.app_state()
+        self.assertEqual((app.total_passes, app.owner), (2, "hot-potato/0"))
+
+    def test_owner_stalled(self):
+        self.cluster = PeerCluster(self.charm_cls, 4)
+        self.addCleanup(self.cluster.cleanup)
+        self.cluster.leader.update_config({"owner-timeout": 30.0})
+        params = {"delay": 60, "owner": "hot-potato/1", "strategy": "round-robin"}
+        self.cluster.run_action("configure", params)
+        self.cluster.run_action("run", {"run": True})
+        self.cluster.drain(max_hooks=1000)
+        app = self.app_state()
+        self.assertEqual((app.total_passes, app.owner), (1, "hot-potato/2"))
+
+        # not yet stalled
+        self.cluster.emit("hot-potato/0", "update_status")
+        self.assertEqual(self.app_state(), app)
+
+        # owner misses its wakeup
+        with patch("time.time", return_value=time.time() + 120):
+            self.cluster.emit("hot-potato/0", "update_status")
+        reelected = self.app_state()
+        self.assertEqual(reelected.owner, "hot-potato/1")
+        self.assertEqual((reelected.epoch, reelected.total_passes), (app.epoch + 1, 1))
+
+        # lost owner's late pass is not counted
+        with patch("time.time", return_value=time.time() + 120):
+            self.cluster.emit("hot-potato/2", "update_status")
+            self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 2)
+
+    def test_pacing_none(self):
+        params = {"delay": 60, "owner": "hot-potato/2", "max-passes": 12, "pacing": "none"}
+        self.cluster.run_action("configure", params)
+        self.cluster.run_action("run", {"run": True})
+        self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 12)
+        self.assertFalse(self.get_run())
+
+    def test_pacing_rate(self):
+        params = {"owner": "hot-potato/2", "pacing": "rate", "target-rate": 0.5}
+        self.cluster.run_action("configure", params)
+        self.cluster.run_action("run", {"run": True})
+        self.cluster.drain(max_hooks=1000)
+
+        # nothing measured yet: target interval
+        app = self.app_state()
+        self.assertEqual(app.total_passes, 1)
+        self.assertAlmostEqual(app.deadline - time.time(), 2.0, delta=0.5)
+
+        results = self.cluster.run_action("stats", {}).set_results.call_args[0][0]
+        self.assertAlmostEqual(results["paced-delay"], 2.0)
+
+    def test_pacing_rate_stale(self):
+        for potatoes in (1, 2):
+            params = {
+                "owner": "hot-potato/2",
+                "pacing": "rate",
+                "target-rate": 0.5,
+                "potatoes": potatoes,
+            }
+            self.cluster.run_action("configure", params)
+            self.cluster.run_action("run", {"run": True})
+            self.cluster.drain(max_hooks=1000)
+
+            # stale (already reconciled) unit changes do not step rate control
+            self.cluster.leader.charm._stored.paced_delay = 5.0
+            for name in self.cluster.unit_names:
+                if name != self.cluster.leader_name:
+                    self.cluster._deliver(self.cluster.leader, name, {})
+            self.cluster.drain(max_hooks=1000)
+            self.assertEqual(self.cluster.leader.charm._stored.paced_delay, 5.0)
+
+    def test_wakeup_degraded(self):
+        # no juju-exec under test: warned about (once) and shown in status
+        with patch.object(charmbase, "_wakeup_warned", False):
+            with self.assertLogs("charmbase", "WARNING") as logs:
+                params = {"delay": 60, "owner": "hot-potato/2", "max-passes": 12}
+                self.cluster.run_action("configure", params)
+                self.cluster.run_action("run", {"run": True})
+                self.cluster.drain(max_hooks=1000)
+        self.assertEqual(len(logs.records), 1)
+        owner_name = self.app_state().owner
+        owner = self.cluster.harnesses[owner_name]
+        self.assertIn("wakeup (degraded", owner.model.unit.status.message)
+
+        # cleared once a wakeup is scheduled
+        command = f"juju-exec -u {owner_name} JUJU_DISPATCH_PATH=hooks/update-status dispatch"
+        with patch.object(self.charm_cls, "get_dispatch_command", return_value=command):
+            with patch.object(self.charm_cls, "spawn") as spawn:
+                self.cluster.emit(owner_name, "update_status")
+                self.cluster.drain(max_hooks=1000)
+        spawn.assert_called()
+        self.assertNotIn("wakeup (degraded", owner.model.unit.status.message)
+
+    def test_benchmark(self):
+        self.play(5)
+        results = self.cluster.run_action("benchmark", {}).set_results.call_args[0][0]
+        self.assertFalse(results["done"])
+
+        event = self.cluster.run_action("benchmark", {"passes": 20})
+        self.assertTrue(event.set_results.call_args[0][0]["started"])
+        self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 25)
+        self.assertFalse(self.get_run())
+
+        results = self.cluster.run_action("benchmark", {}).set_results.call_args[0][0]
+        self.assertTrue(results["done"])
+        self.assertEqual(results["implementation"], self.charm_cls.IMPLEMENTATION)
+        self.assertEqual((results["units"], results["passes"]), (3, 20))
+        self.assertGreater(results["passes-per-sec"], 0)
+        self.assertGreater(results["hooks-per-pass"], 0)
+
+        event = self.cluster.run_action("benchmark", {}, unit_name="hot-potato/1")
+        event.fail.assert_called_once()
+
+    def test_nearby(self):
+        addresses = ["10.0.1.1", "10.0.1.2", "10.0.1.3", "10.0.2.1", "10.0.2.2", "10.0.2.3"]
+        self.cluster = PeerCluster(self.charm_cls, 6, addresses=addresses)
+        self.addCleanup(self.cluster.cleanup)
+        for name, address in zip(self.cluster.unit_names, addresses):
+            self.assertEqual(self.cluster.unit_data(name)["address"], address)
+            self.cluster.harnesses[name].update_config({"locality-bias": 1.0})
+
+        self.play(20, owner="hot-potato/1", strategy="nearby")
+        self.assertEqual(self.app_state().total_passes, 20)
+        self.assertEqual(self.total_npasses(), 20)
+        # passes stay in the owner's subnet
+        for name in self.cluster.unit_names[3:]:
+            self.assertEqual(int(self.cluster.unit_data(name).get("npasses", 0)), 0)
+
+    def side_channel_checkpoint(self, name, total_passes, owner, npasses):
+        """Checkpoint by (would-be) daemon of unit `name`, dispatched."""
+
+        charm = self.cluster.harnesses[name].charm
+        with open(charm.get_side_channel_path("json"), "w") as f:
+            state = {
+                "epoch": self.app_state().epoch,
+                "total_passes": total_passes,
+                "owner": owner,
+                "npasses": npasses,
+                "held": False,
+            }
+            json.dump(state, f)
+        self.cluster.emit(name, "update_status")
+        self.cluster.drain(max_hooks=1000)
+
+    def test_side_channel(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        with patch.dict(os.environ, {"JUJU_CHARM_DIR": tmpdir.name}):
+            self.cluster.run_action(
+                "configure", {"mode": "side-channel", "owner": "hot-potato/1", "max-passes": 10}
+            )
+            self.cluster.run_action("run", {"run": True})
+            self.cluster.drain(max_hooks=1000)
+            # passing is left to the daemons
+            self.assertEqual(self.app_state().total_passes, 0)
+            self.assertEqual(self.total_npasses(), 0)
+
+            self.side_channel_checkpoint("hot-potato/2", 5, "hot-potato/0", 2)
+            app = self.app_state()
+            self.assertEqual((app.total_passes, app.owner, app.run), (5, "hot-potato/0", True))
+
+            # end of game (by the leader), and the others' counts
+            self.side_channel_checkpoint("hot-potato/0", 10, "hot-potato/0", 4)
+            self.side_channel_checkpoint("hot-potato/1", 7, "", 3)
+            self.side_channel_checkpoint("hot-potato/2", 8, "", 3)
+            app = self.app_state()
+            self.assertEqual((app.total_passes, app.run), (10, False))
+            self.assertEqual(self.total_npasses(), 10)
+
+            # unchanged checkpoint is not counted again
+            self.cluster.emit("hot-potato/2", "update_status")
+            self.assertEqual(self.total_npasses(), 10)
+
+    def test_side_channel_start(self):
+        addresses = ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+        self.cluster = PeerCluster(self.charm_cls, 3, addresses=addresses)
+        self.addCleanup(self.cluster.cleanup)
+        harness = self.cluster.harnesses["hot-potato/1"]
+        harness.update_config({"side-channel": "tcp:7000"})
+        charm = harness.charm
+        with patch.object(charm, "service_is_running", return_value=False), patch.object(
+            charm, "spawn"
+        ) as spawn:
+            charm.service_start()
+
+        # listens on the unit address only, for its token (published)
+        data = self.cluster.unit_data("hot-potato/1")
+        self.assertEqual(data["endpoint"], "10.0.0.2:7000")
+        args, kwargs = spawn.call_args
+        self.assertIn("10.0.0.2:7000", args[0])
+        self.assertEqual(kwargs["env"], {"SIDE_CHANNEL_TOKEN": data["token"]})
+        self.assertGreaterEqual(len(data["token"]), 32)
+
+        # IPv6 address: bracketed
+        addresses = ["fd00::1", "fd00::2", "fd00::3"]
+        self.cluster = PeerCluster(self.charm_cls, 3, addresses=addresses)
+        self.addCleanup(self.cluster.cleanup)
+        harness = self.cluster.harnesses["hot-potato/1"]
+        harness.update_config({"side-channel": "tcp:7000"})
+        charm = harness.charm
+        with patch.object(charm, "service_is_running", return_value=False), patch.object(
+            charm, "spawn"
+        ):
+            charm.service_start()
+        self.assertEqual(self.cluster.unit_data("hot-potato/1")["endpoint"], "[fd00::2]:7000")
+
+        # not started without the peer relation (nowhere to publish it)
+        with patch.object(charm, "service_is_running", return_value=False), patch.object(
+            charm, "spawn"
+        ) as spawn, patch.object(charm.model, "get_relation", return_value=None):
+            charm.service_start()
+        spawn.assert_not_called()
+
+    def test_paced_pass(self):
+        self.cluster.run_action("configure", {"delay": 60, "owner": "hot-potato/2"})
+        self.cluster.run_action("run", {"run": True})
+        self.cluster.drain(max_hooks=1000)
+
+        # first pass is immediate; next is held by the deadline, not a sleep
+        self.assertEqual(self.app_state().total_passes, 1)
+        owner = self.app_state().owner
+
+        self.cluster.emit(owner, "update_status")
+        self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.total_npasses(), 1)
+
+        with patch("time.time", return_value=time.time() + 61):
+            self.cluster.emit(owner, "update_status")
+            self.cluster.drain(max_hooks=1000)
+        self.assertEqual(self.app_state().total_passes, 2)
+        self.assertEqual(self.total_npasses(), 2)
+
+    def test_random_order(self):
+        # (with bursts, relays miss coalesced app changes)
+        for seed, burst in itertools.product(range(5), [1, 3]):
+            self.cluster = PeerCluster(self.charm_cls, 3, rng=random.Random(seed))
+            self.addCleanup(self.cluster.cleanup)
+            self.play(12, burst=burst)
+            self.assertEqual(self.app_state().total_passes, 12)
+            self.assertEqual(self.total_npasses(), 12)
+            self.assertFalse(self.get_run())
+
+    def test_federation(self):
+        other = PeerCluster(self.charm_cls, 2, app_name="other-potato")
+        self.addCleanup(other.cleanup)
+        for cluster in (self.cluster, other):
+            cluster.run_action("configure", {"delay": 0})
+        federation = Federation([self.cluster, other])
+
+        self.cluster.run_action("federate", {"passes": 25, "turn": 10})
+        federation.drain(max_hooks=5000)
+
+        # turns of 10 (here), 10 (other), 5 (here)
+        self.assertEqual(self.app_state().total_passes, 15)
+        self.assertEqual(decode_app(other.app_data()["state"]).total_passes, 10)
+        self.assertEqual(self.total_npasses(), 15)
+        fpass = decode_pass(federation.app_data(self.cluster, other)["pass"])
+        self.assertEqual((fpass.total_passes, fpass.app), (25, ""))
+
+        for cluster in (self.cluster, other):
+            results = cluster.run_action("stats", {}).set_results.call_args[0][0]
+            self.assertEqual(results["global-passes"], 25)
+
+        event = self.cluster.run_action("federate", {"passes": 5}, unit_name="hot-potato/1")
+        event.fail.assert_called_once()
+
+
+class TestHotPotatoCharmIface(HotPotatoCharmTests, unittest.TestCase):
+
+    charm_cls = charmiface.HotPotatoCharm
+
+
+class TestHotPotatoCharmNoIface(HotPotatoCharmTests, unittest.TestCase):
+
+    charm_cls = charmnoiface.HotPotatoCharm
@@ -0,0 +1,50 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+from gateway import (
+    NO_PASS,
+    FederatedPass,
+    aggregate,
+    decode_pass,
+    encode_pass,
+    encode_passes,
+    hand_on,
+    is_newer_pass,
+    turn_passes,
+)
+
+
+class TestGateway(unittest.TestCase):
+    def test_pass_record(self):
+        fpass = FederatedPass(2, 30, 100, 10, "other-potato")
+        self.assertEqual(encode_pass(fpass), "1:2:30:100:10:other-potato")
+        self.assertEqual(decode_pass(encode_pass(fpass)), fpass)
+        self.assertEqual(decode_pass(None), NO_PASS)
+        self.assertEqual(decode_pass("2:2:30:100:10:other-potato"), NO_PASS)
+
+    def test_newer(self):
+        fpass = FederatedPass(2, 30, 100, 10, "hot-potato")
+        self.assertTrue(is_newer_pass(fpass, 2, 20))
+        self.assertTrue(is_newer_pass(fpass, 1, 90))
+        self.assertFalse(is_newer_pass(fpass, 2, 30))
+
+    def test_turns(self):
+        fpass = FederatedPass(1, 0, 25, 10, "hot-potato")
+        self.assertEqual(turn_passes(fpass), 10)
+
+        fpass = hand_on(fpass, 10, "other-potato")
+        self.assertEqual((fpass.total_passes, fpass.app), (10, "other-potato"))
+        fpass = hand_on(fpass, 10, "hot-potato")
+        self.assertEqual(turn_passes(fpass), 5)
+
+        # game over
+        fpass = hand_on(fpass, 5, "other-potato")
+        self.assertEqual((fpass.total_passes, fpass.app), (25, ""))
+        self.assertEqual(turn_passes(fpass), 0)
+
+    def test_aggregate(self):
+        published = [encode_passes(2, 10), encode_passes(1, 40), None]
+        self.assertEqual(aggregate(2, 15, published), 25)
+        self.assertEqual(aggregate(3, 0, published), 0)
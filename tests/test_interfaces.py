@@ -0,0 +1,46 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+import charmiface
+from benchmarks.cluster import PeerCluster
+from interfaces.hotpotato import HotPotatoRelationSuperInterface, get_snapshot_class
+
+
+class TestSuperInterface(unittest.TestCase):
+    def setUp(self):
+        self.cluster = PeerCluster(charmiface.HotPotatoCharm, 3)
+        self.addCleanup(self.cluster.cleanup)
+        self.charm = self.cluster.leader.charm
+        self.hpsiface = self.charm.hpsiface
+
+    def test_snapshot_class(self):
+        app_cls = HotPotatoRelationSuperInterface.AppInterface
+        self.assertIs(get_snapshot_class(app_cls), get_snapshot_class(app_cls))
+
+        snapshot = self.hpsiface.snapshot(self.charm.app)
+        self.assertIsInstance(snapshot, get_snapshot_class(app_cls))
+        self.assertEqual(snapshot.mode, "leader")
+        # no fields but the interface's
+        with self.assertRaises(AttributeError):
+            snapshot.unknown = 1
+        self.hpsiface.commit()
+
+    def test_reuse(self):
+        unit = self.charm.unit
+        self.assertIs(self.hpsiface.select(unit), self.hpsiface.select(unit))
+        self.assertIs(self.hpsiface.snapshot(unit), self.hpsiface.snapshot(unit))
+
+        bucket = self.hpsiface.select(unit)
+        self.hpsiface.commit()
+        self.assertIsNot(self.hpsiface.select(unit), bucket)
+        self.hpsiface.commit()
+
+    def test_commit(self):
+        snapshot = self.hpsiface.snapshot(self.charm.app)
+        snapshot.max_passes = snapshot.max_passes
+        snapshot.burst = 3
+        self.assertEqual(self.hpsiface.commit(), 1)
+        self.assertEqual(self.hpsiface.snapshot(self.charm.app).burst, 3)
+        self.hpsiface.commit()
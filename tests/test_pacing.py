@@ -0,0 +1,35 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+from pacing import adjust_delay, measure_interval
+
+
+class TestPacing(unittest.TestCase):
+    def test_measure_interval(self):
+        self.assertIsNone(measure_interval([]))
+        self.assertIsNone(measure_interval([1.0]))
+        # burst: passes recorded at once
+        self.assertIsNone(measure_interval([1.0, 1.0]))
+        self.assertEqual(measure_interval([0.0, 1.0, 1.0, 3.0]), 1.0)
+        self.assertEqual(measure_interval(list(range(100)), window=4), 1.0)
+
+    def test_adjust_delay(self):
+        # too slow: less delay, never below 0
+        self.assertEqual(adjust_delay(0.5, [0.0, 1.0, 2.0], 2.0), 0.375)
+        self.assertEqual(adjust_delay(0.1, [0.0, 1.0, 2.0], 2.0), 0.0)
+        # too fast: more delay, never above target interval
+        self.assertEqual(adjust_delay(0.0, [0.0, 0.1, 0.2], 2.0), 0.1)
+        self.assertEqual(adjust_delay(0.5, [0.0, 0.1, 0.2], 2.0), 0.5)
+        # nothing measured yet
+        self.assertEqual(adjust_delay(3.0, [], 2.0), 0.5)
+
+    def test_converges(self):
+        # interval is delay plus a fixed hook latency
+        latency, delay, times = 0.3, 1.0, [0.0]
+        for _ in range(100):
+            times.append(times[-1] + latency + delay)
+            delay = adjust_delay(delay, times, 1.0)
+        self.assertAlmostEqual(delay, 0.7, places=3)
+        self.assertAlmostEqual(times[-1] - times[-2], 1.0, places=2)
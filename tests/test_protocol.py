@@ -0,0 +1,166 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+from protocol import (
+    NO_APP,
+    NO_CLAIM,
+    AppState,
+    Claim,
+    add_relays,
+    advance,
+    apply_checkpoint,
+    claim,
+    claim_chain,
+    decode_app,
+    decode_claim,
+    encode_app,
+    encode_claim,
+    get_setting,
+    is_claimed,
+    is_newer,
+    latest_claim,
+    new_epoch,
+    peer_accepts,
+    peer_handoff,
+    peer_holds,
+    relay_count,
+    transition,
+)
+
+
+class TestRecords(unittest.TestCase):
+    def test_app(self):
+        app = AppState(2, 5, 4, "a/1", "a/0,a/2", 1.5, True)
+        self.assertEqual(encode_app(app), "1:2:5:4:a/1:a/0,a/2:1.500:1")
+        self.assertEqual(decode_app(encode_app(app)), app)
+
+    def test_deadline_truncated(self):
+        app = AppState(2, 5, 4, "a/1", "", 1.0009, True)
+        self.assertEqual(decode_app(encode_app(app)).deadline, 1.0)
+
+    def test_claim(self):
+        for unitclaim in [Claim(2, 5, "a/2", ""), Claim(2, 6, "a/0", "a/2,a/0")]:
+            self.assertEqual(decode_claim(encode_claim(unitclaim)), unitclaim)
+
+    def test_unset(self):
+        self.assertEqual(decode_app(""), NO_APP)
+        self.assertEqual(decode_app(None), NO_APP)
+        self.assertEqual(decode_claim(""), NO_CLAIM)
+
+    def test_unknown_version(self):
+        self.assertEqual(decode_app("2:2:5:4:a/1::1.500:1"), NO_APP)
+        self.assertEqual(decode_claim("2:2:5:a/2"), NO_CLAIM)
+
+    def test_sequence(self):
+        app = AppState(2, 5, 4, "a/1", "", 0.0, True)
+        self.assertEqual((transition(app).epoch, transition(app).seq), (2, 6))
+        self.assertEqual((new_epoch(app).epoch, new_epoch(app).seq), (3, 0))
+        self.assertTrue(is_newer(transition(app), 2, 5))
+        self.assertTrue(is_newer(new_epoch(app), 2, 5))
+        self.assertFalse(is_newer(app, 2, 5))
+        self.assertFalse(is_newer(app, 3, 0))
+
+
+class TestLeaderProtocol(unittest.TestCase):
+    def setUp(self):
+        self.app = AppState(1, 0, 4, "a/1", "", 0.0, True)
+
+    def test_claim(self):
+        self.assertEqual(claim(self.app, ["a/2"]), Claim(1, 5, "a/2", ""))
+        self.assertEqual(claim(self.app, ["a/2", "a/0"]), Claim(1, 6, "a/0", "a/2,a/0"))
+        self.assertEqual(claim_chain(claim(self.app, ["a/2", "a/0"])), ["a/2", "a/0"])
+
+    def test_is_claimed(self):
+        self.assertTrue(is_claimed(self.app, Claim(1, 5, "a/2", "")))
+        self.assertFalse(is_claimed(self.app, Claim(1, 4, "a/2", "")))
+        # earlier epoch
+        self.assertFalse(is_claimed(new_epoch(self.app), Claim(1, 5, "a/2", "")))
+
+    def test_latest_claim(self):
+        claims = {
+            "a/0": Claim(1, 4, "a/1", ""),
+            "a/1": Claim(1, 6, "a/2", "a/0,a/2"),
+            "a/2": Claim(0, 9, "a/1", ""),
+        }
+        self.assertEqual(latest_claim(self.app, claims), "a/1")
+        self.assertIsNone(latest_claim(self.app._replace(total_passes=6), claims))
+        self.assertIsNone(latest_claim(self.app, {}))
+
+    def test_get_setting(self):
+        data = {"initialized": "True", "max_passes": "7", "delay": "0.5"}
+        self.assertIs(get_setting(data, "initialized"), True)
+        self.assertEqual(get_setting(data, "max_passes"), 7)
+        self.assertEqual(get_setting(data, "delay"), 0.5)
+        # unset: the default
+        self.assertEqual(get_setting(data, "burst"), 1)
+        self.assertIs(get_setting({}, "initialized"), False)
+
+    def test_advance(self):
+        app, hot = advance(self.app, claim(self.app, ["a/2"]), 10, 1.0)
+        self.assertEqual(app, AppState(1, 1, 5, "a/2", "", 1.0, True))
+        self.assertEqual(hot, ["a/2"])
+
+    def test_advance_burst(self):
+        app, hot = advance(self.app, claim(self.app, ["a/2", "a/0", "a/3"]), 10, 1.0)
+        self.assertEqual((app.total_passes, app.owner, app.relays), (7, "a/3", "a/0=1,a/2=1"))
+        self.assertEqual(relay_count(app.relays, "a/0"), 1)
+        self.assertEqual(relay_count(app.relays, "a/3"), 0)
+
+        # relays are tallied over the epoch
+        app, hot = advance(app, claim(app, ["a/0", "a/3"]), 10, 1.0)
+        self.assertEqual(app.relays, "a/0=2,a/2=1")
+        self.assertEqual(hot, ["a/0", "a/3"])
+        self.assertEqual(add_relays(app.relays, []), app.relays)
+
+    def test_advance_stale(self):
+        for unitclaim in [Claim(1, 4, "a/2", ""), Claim(0, 5, "a/2", "")]:
+            app, hot = advance(self.app, unitclaim, 10, 1.0)
+            self.assertIs(app, self.app)
+            self.assertIsNone(hot)
+
+    def test_advance_max_passes(self):
+        app = self.app._replace(total_passes=9)
+        app, hot = advance(app, claim(app, ["a/2", "a/0"]), 10, 1.0)
+        self.assertEqual((app.total_passes, app.owner, app.run), (10, "a/2", False))
+        self.assertEqual(hot, "*")
+
+
+class TestSideChannelProtocol(unittest.TestCase):
+    def test_apply_checkpoint(self):
+        app = AppState(1, 3, 4, "a/1", "", 0.0, True)
+        app, hot = apply_checkpoint(app, Claim(1, 7, "a/2", ""), 10)
+        self.assertEqual(app, AppState(1, 4, 7, "a/2", "", 0.0, True))
+        self.assertEqual(hot, [])
+
+        app, hot = apply_checkpoint(app, Claim(1, 10, "a/0", ""), 10)
+        self.assertEqual((app.total_passes, app.run), (10, False))
+        self.assertEqual(hot, "*")
+
+    def test_apply_checkpoint_stale(self):
+        app = AppState(2, 3, 4, "a/1", "", 0.0, True)
+        for checkpoint in [Claim(2, 4, "a/2", ""), Claim(1, 9, "a/2", "")]:
+            self.assertEqual(apply_checkpoint(app, checkpoint, 10), (app, None))
+
+
+class TestPeerProtocol(unittest.TestCase):
+    def test_handoff(self):
+        handoff, hot = peer_handoff(1, 4, 10, "a/2")
+        self.assertEqual(handoff, Claim(1, 5, "a/2", ""))
+        self.assertEqual(hot, ["a/2"])
+
+        handoff, hot = peer_handoff(1, 9, 10, "a/2")
+        self.assertEqual(hot, "*")
+        self.assertFalse(peer_holds("a/2", 10, handoff))
+
+    def test_accepts(self):
+        self.assertTrue(peer_accepts(1, 4, Claim(1, 5, "a/2", "")))
+        self.assertFalse(peer_accepts(1, 5, Claim(1, 5, "a/2", "")))
+        # new epoch (reconfigured game)
+        self.assertTrue(peer_accepts(1, 9, Claim(2, 1, "a/2", "")))
+        self.assertFalse(peer_accepts(2, 0, Claim(1, 9, "a/2", "")))
+
+    def test_holds(self):
+        self.assertTrue(peer_holds("a/2", 10, Claim(1, 5, "a/2", "")))
+        self.assertFalse(peer_holds("a/1", 10, Claim(1, 5, "a/2", "")))
@@ -0,0 +1,101 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import glob
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import charmiface
+import charmnoiface
+from benchmarks.bench_replay import Replayer
+from benchmarks.cluster import PeerCluster
+from protocol import decode_app
+from recorder import Recorder, load
+
+
+class Backend:
+    def __init__(self):
+        self.data = {"a/1": {"x": "1", "y": "2"}}
+
+    def relation_get(self, relation_id, member_name, is_app):
+        return dict(self.data[member_name])
+
+    def update_relation_data(self, relation_id, entity, key, value):
+        self.data[entity.name][key] = value
+
+    def action_get(self):
+        return {"run": True}
+
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "record.jsonl")
+        self.recorder = Recorder(self.path, os.path.join(tmpdir.name, "state.json"))
+        self.backend = Backend()
+        self.recorder.instrument(self.backend)
+
+    def test_changes_only(self):
+        self.backend.relation_get(0, "a/1", False)
+        self.backend.update_relation_data(0, SimpleNamespace(name="a/1"), "y", "3")
+        first = self.recorder.record("a/1", True, "hooks/update-status", config={"c": 1})
+        self.assertEqual(first["reads"], {"a/1": {"x": "1", "y": "2"}})
+        self.assertEqual(first["config"], {"c": 1})
+
+        # own write already known; config unchanged
+        self.backend.data["a/1"]["x"] = "4"
+        self.backend.relation_get(0, "a/1", False)
+        self.backend.action_get()
+        second = self.recorder.record("a/1", True, "actions/run", config={"c": 1})
+        self.assertEqual(second["reads"], {"a/1": {"x": "4"}})
+        self.assertEqual(second["params"], {"run": True})
+        self.assertNotIn("config", second)
+
+        self.assertEqual(load([self.path]), [first, second])
+
+
+class ReplayTests:
+    """Record a game in a cluster and replay it."""
+
+    charm_cls = None
+
+    def test_replay(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+
+        cluster = PeerCluster(self.charm_cls, 3, record_dir=tmpdir.name)
+        self.addCleanup(cluster.cleanup)
+        params = {"delay": 0, "owner": "hot-potato/2", "max-passes": 9, "strategy": "round-robin"}
+        cluster.run_action("configure", params)
+        cluster.run_action("run", {"run": True})
+        cluster.drain(max_hooks=1000)
+
+        records = load(glob.glob(os.path.join(tmpdir.name, "*.jsonl")))
+        self.assertEqual(len(records), len(cluster.hooks))
+        # (json lines)
+        with open(os.path.join(tmpdir.name, "hot-potato-0.jsonl")) as f:
+            self.assertTrue(all(json.loads(line)["unit"] == "hot-potato/0" for line in f))
+
+        replayer = Replayer(self.charm_cls, records)
+        self.addCleanup(replayer.cleanup)
+        replayer.replay()
+        self.assertEqual(replayer.diverged, 0)
+        self.assertEqual(sum(stats["count"] for stats in replayer.stats.values()), len(records))
+
+        leader = replayer.harnesses["hot-potato/0"]
+        state = leader.get_relation_data(replayer.relation_id, "hot-potato")["state"]
+        self.assertEqual(decode_app(state).total_passes, 9)
+
+
+class TestReplayIface(ReplayTests, unittest.TestCase):
+
+    charm_cls = charmiface.HotPotatoCharm
+
+
+class TestReplayNoIface(ReplayTests, unittest.TestCase):
+
+    charm_cls = charmnoiface.HotPotatoCharm
@@ -0,0 +1,86 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+from shards import (
+    Handoff,
+    Shard,
+    apply_handoffs,
+    decode_handoffs,
+    decode_shards,
+    encode_handoffs,
+    encode_shards,
+    finished,
+    new_shards,
+    reassign_shards,
+    take_shards,
+)
+
+
+NAMES = ["hot-potato/0", "hot-potato/1", "hot-potato/2"]
+
+
+class TestShards(unittest.TestCase):
+    def test_roundtrip(self):
+        shards = [Shard("hot-potato/1", 3, 5, 12.5), Shard("hot-potato/0", 0, 4, 0.0)]
+        self.assertEqual(decode_shards(encode_shards(shards)), shards)
+        self.assertEqual(decode_shards(""), [])
+
+        handoffs = [Handoff(1, "hot-potato/2", 1), Handoff(0, "hot-potato/0", 4)]
+        self.assertEqual(decode_handoffs(encode_handoffs(handoffs)), sorted(handoffs))
+
+    def test_deadline_truncated(self):
+        # just below a millisecond boundary: must not round up to 1.000
+        shards = [Shard("hot-potato/1", 3, 5, 0.9996)]
+        self.assertEqual(decode_shards(encode_shards(shards))[0].deadline, 0.999)
+
+        # so the potato is due when its deadline is
+        shards = decode_shards(encode_shards(shards))
+        _, npasses, wait = take_shards(shards, [], "hot-potato/1", 0.9996, lambda: "hot-potato/2")
+        self.assertEqual((npasses, wait), (1, None))
+
+    def test_new_shards(self):
+        shards = new_shards(2, NAMES, "hot-potato/2", 7)
+        self.assertEqual([shard.owner for shard in shards], ["hot-potato/2", "hot-potato/0"])
+        self.assertEqual([shard.max_passes for shard in shards], [4, 3])
+
+    def test_take_and_apply(self):
+        shards = new_shards(3, NAMES, "hot-potato/0", 6)
+        shards[2] = shards[2]._replace(owner="hot-potato/0", deadline=100.0)
+
+        handoffs, npasses, wait = take_shards(
+            shards, [], "hot-potato/0", 90.0, lambda: "hot-potato/1"
+        )
+        self.assertEqual(npasses, 1)
+        self.assertEqual(wait, 10.0)
+        self.assertEqual(handoffs, [Handoff(0, "hot-potato/1", 1)])
+
+        # pending handoff is not passed again
+        _, npasses, _ = take_shards(shards, handoffs, "hot-potato/0", 90.0, lambda: "x")
+        self.assertEqual(npasses, 0)
+
+        self.assertEqual(apply_handoffs(shards, handoffs, 5.0), 1)
+        self.assertEqual(shards[0], Shard("hot-potato/1", 1, 2, 5.0))
+
+        # stale
+        self.assertEqual(apply_handoffs(shards, handoffs, 6.0), 0)
+        self.assertFalse(finished(shards))
+
+    def test_reassign(self):
+        shards = [
+            Shard("hot-potato/1", 1, 2, 0.0),
+            Shard("hot-potato/2", 1, 2, 0.0),
+            Shard("hot-potato/1", 2, 2, 0.0),
+        ]
+        n = reassign_shards(
+            shards, lambda shard: shard.owner == "hot-potato/1", lambda owner: "hot-potato/0", 5.0
+        )
+        # finished potato is left alone
+        self.assertEqual(n, 1)
+        self.assertEqual(shards[0], Shard("hot-potato/0", 1, 2, 5.0))
+        self.assertEqual(shards[2].owner, "hot-potato/1")
+
+        # lost owner's late handoff and the new owner's count once
+        self.assertEqual(apply_handoffs(shards, [Handoff(0, "hot-potato/2", 2)], 6.0), 1)
+        self.assertEqual(apply_handoffs(shards, [Handoff(0, "hot-potato/1", 2)], 7.0), 0)
@@ -0,0 +1,137 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from protocol import Claim, encode_claim
+from sidechannel import Daemon, format_endpoint, parse_endpoint, send
+
+
+class SideChannelTests:
+    """Daemons (one per unit) on localhost, each in a thread."""
+
+    nunits = 3
+
+    def endpoint(self, tmpdir, i):
+        raise NotImplementedError()
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+
+        self.daemons = {}
+        for i in range(self.nunits):
+            name = f"hot-potato/{i}"
+            daemon = Daemon(
+                name,
+                self.endpoint(tmpdir.name, i),
+                f"token-{i}",
+                os.path.join(tmpdir.name, f"{i}.json"),
+            )
+            thread = threading.Thread(target=daemon.serve, daemon=True)
+            thread.start()
+            self.daemons[name] = daemon
+            self.addCleanup(thread.join, 5)
+            self.addCleanup(send, daemon.endpoint, daemon.token, "quit")
+
+        self.peers = {
+            name: [daemon.endpoint, daemon.token] for name, daemon in self.daemons.items()
+        }
+
+    def play(self, max_passes, every=0, epoch=1, **config):
+        config.update(
+            {
+                "epoch": epoch,
+                "max_passes": max_passes,
+                "every": every,
+                "delay": 0.0,
+                "run": True,
+                "peers": self.peers,
+            }
+        )
+        for endpoint, token in self.peers.values():
+            self.assertEqual(send(endpoint, token, f"config {json.dumps(config)}"), "ok")
+        held = Claim(epoch, 0, "hot-potato/1", "")
+        send(*self.peers["hot-potato/1"], f"pass {encode_claim(held)}")
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            states = [self.checkpoint(name) for name in self.daemons]
+            # (on stop, every daemon checkpoints the last pass)
+            if all(
+                state and state["epoch"] == epoch and state["total_passes"] >= max_passes
+                for state in states
+            ):
+                return states
+            time.sleep(0.01)
+        self.fail("game did not end")
+
+    def checkpoint(self, name):
+        try:
+            with open(self.daemons[name].checkpoint_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def test_game(self):
+        states = self.play(50, every=10)
+        self.assertEqual([state["total_passes"] for state in states], [50, 50, 50])
+        self.assertEqual(sum(state["npasses"] for state in states), 50)
+
+    def test_round_robin(self):
+        states = self.play(30, strategy="round-robin")
+        self.assertEqual([state["npasses"] for state in states], [10, 10, 10])
+
+    def test_stale_pass(self):
+        self.play(10)
+        # replayed pass of the finished game
+        send(*self.peers["hot-potato/1"], f"pass {encode_claim(Claim(1, 5, 'hot-potato/1', ''))}")
+        status = json.loads(send(*self.peers["hot-potato/1"], "status"))
+        self.assertFalse(status["held"])
+
+    def test_bad_token(self):
+        endpoint, token = self.peers["hot-potato/1"]
+        for bad in ["token-0", "", f"{token}x"]:
+            self.assertEqual(send(endpoint, bad, "quit"), "error: bad token")
+        self.assertTrue(self.daemons["hot-potato/1"].running)
+        self.assertEqual(json.loads(send(endpoint, token, "status"))["npasses"], 0)
+
+    def test_new_epoch(self):
+        self.play(10)
+        states = self.play(20, epoch=2)
+        # count restarts with the epoch
+        self.assertEqual(sum(state["npasses"] for state in states), 20)
+
+
+class TestEndpoint(unittest.TestCase):
+    def test_parse_endpoint(self):
+        self.assertEqual(parse_endpoint("unix:/tmp/a.sock"), (socket.AF_UNIX, "/tmp/a.sock"))
+        self.assertEqual(parse_endpoint("10.0.0.1:7000"), (socket.AF_INET, ("10.0.0.1", 7000)))
+        self.assertEqual(parse_endpoint("[fd00::1]:7000"), (socket.AF_INET6, ("fd00::1", 7000)))
+
+    def test_format_endpoint(self):
+        self.assertEqual(format_endpoint("10.0.0.1", 7000), "10.0.0.1:7000")
+        self.assertEqual(format_endpoint("fd00::1", 7000), "[fd00::1]:7000")
+        self.assertEqual(parse_endpoint(format_endpoint("::1", 7000))[1], ("::1", 7000))
+
+
+class TestSideChannelUnix(SideChannelTests, unittest.TestCase):
+    def endpoint(self, tmpdir, i):
+        return f"unix:{os.path.join(tmpdir, f'{i}.sock')}"
+
+
+class TestSideChannelTcp(SideChannelTests, unittest.TestCase):
+    def endpoint(self, tmpdir, i):
+        return "127.0.0.1:0"
+
+
+@unittest.skipUnless(socket.has_ipv6, "no IPv6")
+class TestSideChannelTcp6(SideChannelTests, unittest.TestCase):
+    def endpoint(self, tmpdir, i):
+        return "[::1]:0"
@@ -0,0 +1,39 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+from stats import ring_append, ring_values, summarize_npasses, summarize_passes
+
+
+class TestRing(unittest.TestCase):
+    def test_bounded(self):
+        ring, index = [], 0
+        for value in range(10):
+            index = ring_append(ring, index, value, size=4)
+        self.assertEqual(len(ring), 4)
+        self.assertEqual(ring_values(ring, index), [6, 7, 8, 9])
+
+    def test_not_full(self):
+        ring, index = [], 0
+        for value in range(3):
+            index = ring_append(ring, index, value, size=4)
+        self.assertEqual(ring_values(ring, index), [0, 1, 2])
+
+
+class TestSummaries(unittest.TestCase):
+    def test_passes(self):
+        summary = summarize_passes([0.0, 1.0, 2.0, 4.0])
+        self.assertEqual(summary["latency"]["count"], 3)
+        self.assertEqual(summary["latency"]["p50"], 1.0)
+        self.assertEqual(summary["latency"]["p99"], 2.0)
+        self.assertEqual(summary["passes-per-sec"], 0.75)
+
+    def test_no_passes(self):
+        summary = summarize_passes([])
+        self.assertEqual(summary["passes-per-sec"], 0.0)
+
+    def test_npasses(self):
+        summary = summarize_npasses({"a/0": 2, "a/1": 4})
+        self.assertEqual((summary["min"], summary["max"], summary["mean"]), (2, 4, 3))
+        self.assertEqual(summary["units"], "a/0=2 a/1=4")
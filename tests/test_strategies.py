@@ -0,0 +1,54 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import random
+import unittest
+
+from strategies import build_alias_table, locality_key, sample_alias, sample_nearby
+
+
+class TestAliasTable(unittest.TestCase):
+    def test_distribution(self):
+        weights = [1.0, 2.0, 0.5, 4.0]
+        prob, alias = build_alias_table(weights)
+
+        rng = random.Random(1)
+        counts = [0] * len(weights)
+        nsamples = 100000
+        for _ in range(nsamples):
+            counts[sample_alias(prob, alias, rng)] += 1
+
+        total = sum(weights)
+        for weight, count in zip(weights, counts):
+            self.assertAlmostEqual(count / nsamples, weight / total, delta=0.01)
+
+    def test_uniform(self):
+        prob, alias = build_alias_table([1.0] * 5)
+        self.assertEqual(prob, [1.0] * 5)
+
+    def test_empty(self):
+        self.assertEqual(build_alias_table([]), ([], []))
+
+
+class TestNearby(unittest.TestCase):
+    def test_locality(self):
+        self.assertEqual(locality_key("10.0.1.7"), "10.0.1.0/24")
+        self.assertEqual(locality_key("10.0.1.7"), locality_key("10.0.1.200"))
+        self.assertNotEqual(locality_key("10.0.1.7"), locality_key("10.0.2.7"))
+        self.assertEqual(locality_key("fd00:1::7"), "fd00:1::/64")
+        # host name
+        self.assertEqual(locality_key("node1.example"), "node1.example")
+        self.assertEqual(locality_key(""), "")
+        self.assertEqual(locality_key(None), "")
+
+    def test_sample(self):
+        rng = random.Random(1)
+        roster = ["a/0", "a/1", "a/2", "a/3"]
+        nearby = ["a/1"]
+        samples = [sample_nearby(nearby, roster, 0.5, rng) for _ in range(10000)]
+        # 0.5 nearby + 0.5 / 4 by roster
+        self.assertAlmostEqual(samples.count("a/1") / len(samples), 0.625, delta=0.02)
+        self.assertEqual(set(samples), set(roster))
+
+        self.assertEqual({sample_nearby(nearby, roster, 1.0, rng) for _ in range(100)}, {"a/1"})
+        self.assertIn(sample_nearby([], roster, 1.0, rng), roster)
@@ -0,0 +1,64 @@
+# Copyright 2022 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+import tracing
+
+
+class Backend:
+    def relation_get(self, *args):
+        return {}
+
+    def update_relation_data(self, *args):
+        pass
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, tracing.TRACE_NAME)
+        patcher = patch.dict(os.environ, {"JUJU_CHARM_DIR": tmpdir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(tracing, "_file", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_charm(self):
+        charm = Mock()
+        charm.model._backend = Backend()
+        charm.unit.name = "hot-potato/0"
+        return charm
+
+    def test_not_sampled(self):
+        def handler(self):
+            pass
+
+        with patch.object(tracing, "SAMPLED", False):
+            self.assertIs(tracing.traced()(handler), handler)
+
+    def test_sampled(self):
+        def handler(self):
+            self.model._backend.relation_get()
+            self.model._backend.update_relation_data()
+            self.model._backend.update_relation_data()
+
+        with patch.object(tracing, "SAMPLED", True):
+            wrapper = tracing.traced()(handler)
+        wrapper(self.make_charm())
+        tracing._file.close()
+
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["fn"], handler.__qualname__)
+        self.assertEqual((records[0]["reads"], records[0]["writes"]), (1, 2))
+
+        summary = tracing.summarize(records)
+        self.assertEqual(summary[handler.__qualname__]["calls"], 1)